@@ -0,0 +1,256 @@
+"""
+The batch_dispatcher module contains the BatchDispatcher class, and the
+functions it uses to pair riders with drivers at the lowest total cost.
+
+This module requires NumPy.
+"""
+import numpy as np
+
+import travel
+from dispatcher import Dispatcher
+from driver import Driver
+from location import Location
+from rider import Rider, WAITING
+
+
+class BatchDispatcher(Dispatcher):
+    """A dispatcher that fulfills requests from riders and drivers in
+    batches.
+
+    Rather than assigning each rider the nearest idle driver as soon as
+    they ask, the dispatcher collects requests over a window of simulated
+    time. At the end of the window, the waiting riders and the idle drivers
+    are paired so that the total time the drivers take to reach their
+    riders is as small as possible.
+
+    Riders who are not paired stay on the waiting list for the next batch,
+    and may cancel their request as usual.
+    """
+
+    # === Private Attributes ===
+    # @type _window: int
+    #     How long requests are collected for before they are matched.
+    # @type _batch_time: int | None
+    #     The time of the next scheduled batch, or None if there is none.
+
+    def __init__(self, window=1, index=None):
+        """Initialize a BatchDispatcher.
+
+        @type self: BatchDispatcher
+        @type window: int
+            How long requests are collected for before they are matched.
+            Precondition: window >= 0
+        @type index: DriverGrid | DriverArrays | None
+            An empty index to keep idle drivers in. Defaults to a
+            DriverGrid.
+        @rtype: None
+        """
+        super().__init__(index)
+        self._window = window
+        self._batch_time = None
+
+    def request_driver(self, rider):
+        """Add the rider to the waiting list for the next batch, and return
+        None.
+
+        Overrides Dispatcher.request_driver
+
+        @type self: BatchDispatcher
+        @type rider: Rider
+        @rtype: None
+        """
+        rider.status = WAITING
+        self._waiting_riders[rider.id] = rider
+        return None
+
+    def request_rider(self, driver):
+        """Register the driver, if this is a new driver, so that it is
+        available for the next batch, and return None.
+
+        Overrides Dispatcher.request_rider
+
+        @type self: BatchDispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+        self._register(driver)
+        return None
+
+    def schedule_batch(self, timestamp):
+        """Return the end of the window that a request made at <timestamp>
+        falls in, or None if that batch has already been scheduled.
+
+        Overrides Dispatcher.schedule_batch
+
+        @type self: BatchDispatcher
+        @type timestamp: int
+        @rtype: int | None
+
+        >>> dispatcher1 = BatchDispatcher(window=5)
+        >>> dispatcher1.schedule_batch(3)
+        8
+        >>> print(dispatcher1.schedule_batch(4))
+        None
+        """
+        if self._batch_time is not None:
+            return None
+        self._batch_time = timestamp + self._window
+        return self._batch_time
+
+    def match(self):
+        """Pair the waiting riders with idle drivers so that the total
+        travel time of the drivers to their riders is as small as possible,
+        and return the pairs as (rider, driver) tuples.
+
+        Each rider returned is taken off the waiting list.
+
+        Overrides Dispatcher.match
+
+        @type self: BatchDispatcher
+        @rtype: list[(Rider, Driver)]
+
+        >>> dispatcher1 = BatchDispatcher()
+        >>> dispatcher1.request_rider(Driver("Bob", Location(0, 0), 1))
+        >>> dispatcher1.request_rider(Driver("Sue", Location(0, 6), 1))
+        >>> dispatcher1.request_driver(Rider("Jim", Location(0, 4), \
+        Location(9, 9), WAITING, 5))
+        >>> dispatcher1.request_driver(Rider("Ann", Location(0, 8), \
+        Location(9, 9), WAITING, 5))
+        >>> [(str(r), str(d)) for r, d in dispatcher1.match()]
+        [('Jim', 'Bob'), ('Ann', 'Sue')]
+        >>> dispatcher1.match()
+        []
+        """
+        self._batch_time = None
+        riders = [rider for rider in self._waiting_riders.values()
+                  if rider.status == WAITING]
+        drivers = list(self._idle_drivers)
+        if len(riders) == 0 or len(drivers) == 0:
+            return []
+        self._scanned += len(riders) * len(drivers)
+        costs = travel_times(drivers, [rider.origin for rider in riders])
+        pairs = []
+        for row, column in min_cost_matching(costs):
+            rider = riders[column]
+            del self._waiting_riders[rider.id]
+            pairs.append((rider, drivers[row]))
+        return pairs
+
+    def get_state(self):
+        """Return the state of this dispatcher, including the time of the
+        next scheduled batch.
+
+        Extends Dispatcher.get_state
+
+        @type self: BatchDispatcher
+        @rtype: dict[str, object]
+        """
+        state = super().get_state()
+        state["batch_time"] = self._batch_time
+        return state
+
+    def set_state(self, state):
+        """Make the state of this dispatcher that in <state>, as returned by
+        get_state.
+
+        Extends Dispatcher.set_state
+
+        @type self: BatchDispatcher
+        @type state: dict[str, object]
+        @rtype: None
+        """
+        super().set_state(state)
+        self._batch_time = state.get("batch_time")
+
+
+def travel_times(drivers, locations):
+    """Return a matrix of the time each of <drivers> would take to reach
+    each of <locations>, rounded as in Driver.get_travel_time.
+
+    @type drivers: list[Driver]
+    @type locations: list[Location]
+    @rtype: numpy.ndarray
+        A len(drivers) by len(locations) array of integers.
+
+    >>> travel_times([Driver("Bob", Location(1, 1), 1), \
+    Driver("Sue", Location(5, 5), 2)], [Location(2, 2), Location(5, 9)])
+    array([[ 2, 12],
+           [ 3,  2]])
+    """
+    model = travel.model
+    if model is not None and not hasattr(model, "distances"):
+        return np.array([[driver.get_travel_time(location)
+                          for location in locations] for driver in drivers],
+                        dtype=np.int64)
+    rows = np.array([driver.location.row for driver in drivers])
+    columns = np.array([driver.location.column for driver in drivers])
+    speeds = np.array([driver.speed for driver in drivers])
+    location_rows = np.array([location.row for location in locations])
+    location_columns = np.array([location.column for location in locations])
+    if model is None:
+        distances = (np.abs(rows[:, None] - location_rows) +
+                     np.abs(columns[:, None] - location_columns))
+    else:
+        # The model looks the distances up all at once.
+        distances = model.distances(rows[:, None], columns[:, None],
+                                    location_rows, location_columns)
+    return np.rint(distances / speeds[:, None]).astype(np.int64)
+
+
+def min_cost_matching(costs):
+    """Return a minimum-cost matching of the rows of <costs> to its
+    columns, as a list of (row, column) pairs sorted by column.
+
+    Every row is matched if there are no more rows than columns, and every
+    column is matched otherwise. This is the Hungarian algorithm, with
+    shortest augmenting paths found over a whole row at a time.
+
+    @type costs: numpy.ndarray
+        A two-dimensional array of costs.
+    @rtype: list[(int, int)]
+
+    >>> min_cost_matching(np.array([[4, 1, 3], [2, 0, 5], [3, 2, 2]]))
+    [(1, 0), (0, 1), (2, 2)]
+    >>> min_cost_matching(np.array([[7], [1], [4]]))
+    [(1, 0)]
+    """
+    n, m = costs.shape
+    if n > m:
+        return sorted(((row, column) for column, row in
+                       min_cost_matching(costs.T)), key=lambda p: p[1])
+    costs = costs.astype(float)
+    # Potentials and matches are 1-indexed; column 0 is a sentinel that
+    # holds the row being added to the matching.
+    row_potential = np.zeros(n + 1)
+    column_potential = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=np.int64)
+    previous = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        row_of[0] = row
+        column = 0
+        slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current = row_of[column]
+            reduced = (costs[current - 1] - row_potential[current] -
+                       column_potential[1:])
+            free = ~used[1:]
+            better = free & (reduced < slack[1:])
+            slack[1:][better] = reduced[better]
+            previous[1:][better] = column
+            candidates = np.where(free, slack[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            row_potential[row_of[used]] += delta
+            column_potential[used] -= delta
+            slack[1:][free] -= delta
+            column = next_column
+            if row_of[column] == 0:
+                break
+        while column != 0:
+            prior = previous[column]
+            row_of[column] = row_of[prior]
+            column = prior
+    return [(int(row_of[column]) - 1, column - 1)
+            for column in range(1, m + 1) if row_of[column] != 0]
@@ -0,0 +1,535 @@
+"""
+Benchmarks for the ride-sharing simulation.
+
+The suite times the operations the simulation spends its time in, and whole
+simulations, over a range of queue depths, fleet sizes and rider rates.
+Each point of the range gets its throughput, the percentiles of the latency
+of each operation and the peak memory it used. The results are written as
+JSON, and can be compared with the results of an earlier run to put a
+number on each change.
+
+Run this module to benchmark, writing the results to a file:
+
+    python benchmark.py run results.json
+
+to compare two sets of results, failing if any point has got slower or
+bigger by more than a threshold:
+
+    python benchmark.py compare baseline.json results.json
+
+or to measure how much memory the simulation's objects, and loading and
+simulating an events file, take:
+
+    python benchmark.py memory events.txt
+
+This module requires NumPy.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from operator import attrgetter
+
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import DriverRequest, RiderRequest, create_event_list
+from histogram import Histogram
+from location import Location, intern_location
+from monitor import Monitor, DRIVER, RIDER, REQUEST, PICKUP, DROPOFF
+from rider import Rider, WAITING
+from simulation import Simulation
+from workload import Workload
+
+# The points each benchmark is run at, by default and with --quick.
+QUEUE_DEPTHS = [100, 10000, 1000000]
+FLEET_SIZES = [100, 1000, 10000]
+RIDER_RATES = [1, 10, 100]
+QUICK_QUEUE_DEPTHS = [100, 10000]
+QUICK_FLEET_SIZES = [100, 1000]
+QUICK_RIDER_RATES = [1, 10]
+
+# The number of times each operation is timed at each point.
+OPERATIONS = 20000
+
+# The length of the simulated time of each whole simulation.
+DURATION = 1000
+
+# The side of the square grid the benchmarks place drivers and riders on.
+GRID_SIZE = 200
+
+
+def measure_memory(filename):
+    """Return the memory, in bytes, taken to load the events in <filename>
+    and to run a simulation on them.
+
+    @type filename: str
+    @rtype: dict[str, int]
+        The number of events loaded, the memory held by the loaded events,
+        and the peak memory used while the simulation ran.
+    """
+    tracemalloc.start()
+    try:
+        events = create_event_list(filename)
+        loaded = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        Simulation().run(events)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"events": len(events), "loaded_bytes": loaded,
+            "peak_bytes": peak}
+
+
+def measure_object_sizes(count=10000):
+    """Return the average memory, in bytes, taken by one of each kind of
+    object the simulation creates in bulk.
+
+    @type count: int
+        How many objects of each kind to average over.
+    @rtype: dict[str, float]
+    """
+    identifiers = [str(i) for i in range(count)]
+    makers = {
+        "Location": lambda i: Location(i, i + 1),
+        "Driver": lambda i: Driver(identifiers[i], None, 1),
+        "Rider": lambda i: Rider(identifiers[i], None, None, WAITING, 1),
+        "DriverRequest": lambda i: DriverRequest(i, None),
+        "RiderRequest": lambda i: RiderRequest(i, None),
+    }
+    sizes = {}
+    for name, make in makers.items():
+        tracemalloc.start()
+        try:
+            objects = [make(i) for i in range(count)]
+            sizes[name] = tracemalloc.get_traced_memory()[0] / count
+        finally:
+            tracemalloc.stop()
+        del objects
+    return sizes
+
+
+def benchmark_queue(depth, operations=OPERATIONS):
+    """Time adding events to and removing events from a PriorityQueue that
+    holds <depth> events.
+
+    @type depth: int
+    @type operations: int
+    @rtype: dict[str, Histogram]
+        The latency of each operation, in nanoseconds.
+    """
+    generator = random.Random(depth)
+    queue = PriorityQueue(key=attrgetter("timestamp"))
+    queue.extend(DriverRequest(generator.randrange(depth), None)
+                 for _ in range(depth))
+    # Each event added is due later than the one just removed, as the
+    # events a simulation spawns are.
+    events = [DriverRequest(depth + generator.randrange(depth), None)
+              for _ in range(operations)]
+    latencies = {"add": Histogram(), "remove": Histogram()}
+    clock = time.perf_counter_ns
+    for event in events:
+        start = clock()
+        queue.remove()
+        middle = clock()
+        queue.add(event)
+        end = clock()
+        latencies["remove"].add(middle - start)
+        latencies["add"].add(end - middle)
+    return latencies
+
+
+def benchmark_dispatcher(fleet, operations=OPERATIONS):
+    """Time the requests a Dispatcher serves for <fleet> idle drivers.
+
+    @type fleet: int
+    @type operations: int
+    @rtype: dict[str, Histogram]
+        The latency of each operation, in nanoseconds.
+    """
+    generator = random.Random(fleet)
+    dispatcher = Dispatcher()
+    for number in range(fleet):
+        dispatcher.request_rider(Driver("D{}".format(number),
+                                        _place(generator), 1))
+    riders = [Rider("R{}".format(number), _place(generator),
+                    _place(generator), WAITING, 10)
+              for number in range(operations)]
+    latencies = {"request_driver": Histogram(), "request_rider": Histogram(),
+                 "cancel_ride": Histogram()}
+    clock = time.perf_counter_ns
+    for rider in riders:
+        start = clock()
+        dispatcher.request_driver(rider)
+        latencies["request_driver"].add(clock() - start)
+
+    # Riders only wait while no driver is registered.
+    drivers = [Driver("D{}".format(number), _place(generator), 1)
+               for number in range(operations)]
+    dispatcher = Dispatcher()
+    for rider in riders:
+        dispatcher.request_driver(rider)
+    for rider in riders[::2]:
+        start = clock()
+        dispatcher.cancel_ride(rider)
+        latencies["cancel_ride"].add(clock() - start)
+    for driver in drivers:
+        start = clock()
+        dispatcher.request_rider(driver)
+        latencies["request_rider"].add(clock() - start)
+    return latencies
+
+
+def benchmark_monitor(operations=OPERATIONS):
+    """Time notifying a Monitor of <operations> activities, those of a
+    fifth as many rides, and reporting on them.
+
+    @type operations: int
+    @rtype: dict[str, Histogram]
+        The latency of each operation, in nanoseconds.
+    """
+    generator = random.Random(operations)
+    monitor = Monitor()
+    activities = []
+    for number in range(operations // 5):
+        rider = "R{}".format(number)
+        driver = "D{}".format(number % 100)
+        origin = _place(generator)
+        destination = _place(generator)
+        activities.extend([
+            (number, RIDER, REQUEST, rider, origin),
+            (number + 1, DRIVER, PICKUP, driver, origin),
+            (number + 1, RIDER, PICKUP, rider, origin),
+            (number + 2, DRIVER, DROPOFF, driver, destination),
+            (number + 2, RIDER, DROPOFF, rider, destination)])
+    latencies = {"notify": Histogram(), "report": Histogram()}
+    clock = time.perf_counter_ns
+    for activity in activities:
+        start = clock()
+        monitor.notify(*activity)
+        latencies["notify"].add(clock() - start)
+    for _ in range(1000):
+        start = clock()
+        monitor.report()
+        latencies["report"].add(clock() - start)
+    return latencies
+
+
+def benchmark_loading(fleet, rate, directory):
+    """Time create_event_list on an events file of a workload with <fleet>
+    drivers and <rate> riders per unit of time.
+
+    @type fleet: int
+    @type rate: int
+    @type directory: str
+        Where to write the events file.
+    @rtype: (int, float)
+        The number of events loaded, and the seconds loading took.
+    """
+    filename = os.path.join(directory, "events-{}-{}.txt".format(fleet, rate))
+    _workload(fleet, rate).write_text(filename)
+    start = time.perf_counter()
+    events = create_event_list(filename)
+    seconds = time.perf_counter() - start
+    os.remove(filename)
+    return len(events), seconds
+
+
+def benchmark_simulation(fleet, rate):
+    """Time a whole simulation of a workload with <fleet> drivers and <rate>
+    riders per unit of time.
+
+    @type fleet: int
+    @type rate: int
+    @rtype: (int, float)
+        The number of events done, and the seconds the simulation took.
+    """
+    events = list(_workload(fleet, rate).events())
+    queue = _CountingQueue(key=attrgetter("timestamp"))
+    start = time.perf_counter()
+    Simulation(queue).run(events)
+    seconds = time.perf_counter() - start
+    return len(events) + queue.added, seconds
+
+
+def run_suite(quick=False, memory=True, progress=None):
+    """Run every benchmark at every point, and return the results.
+
+    @type quick: bool
+        Whether to run at fewer, smaller points.
+    @type memory: bool
+        Whether to measure the peak memory of each point, which takes a
+        second run of it.
+    @type progress: callable | None
+        Called with the name and parameters of each point as it starts.
+    @rtype: dict[str, object]
+    """
+    depths = QUICK_QUEUE_DEPTHS if quick else QUEUE_DEPTHS
+    fleets = QUICK_FLEET_SIZES if quick else FLEET_SIZES
+    rates = QUICK_RIDER_RATES if quick else RIDER_RATES
+    directory = tempfile.mkdtemp()
+    points = [("queue", {"depth": depth}, benchmark_queue, (depth,))
+              for depth in depths]
+    points.extend(("dispatcher", {"fleet": fleet}, benchmark_dispatcher,
+                   (fleet,)) for fleet in fleets)
+    points.append(("monitor", {}, benchmark_monitor, ()))
+    for fleet in fleets:
+        for rate in rates:
+            parameters = {"fleet": fleet, "rate": rate}
+            points.append(("create_event_list", parameters,
+                           benchmark_loading, (fleet, rate, directory)))
+            points.append(("simulation", parameters, benchmark_simulation,
+                           (fleet, rate)))
+
+    results = []
+    try:
+        for name, parameters, benchmark, arguments in points:
+            if progress is not None:
+                progress(name, parameters)
+            result = {"benchmark": name, "parameters": parameters}
+            outcome = benchmark(*arguments)
+            if isinstance(outcome, dict):
+                result["operations"] = {
+                    operation: _summarize(latencies)
+                    for operation, latencies in outcome.items()}
+            else:
+                count, seconds = outcome
+                result.update({"events": count, "seconds": seconds,
+                               "events_per_second": count / seconds})
+            if memory:
+                result["peak_bytes"] = _peak_memory(benchmark, arguments)
+            results.append(result)
+    finally:
+        os.rmdir(directory)
+    return {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results}
+
+
+def compare(baseline, results, threshold=0.1):
+    """Return a line comparing each point in <results> with the same point
+    in <baseline>, and whether any point has regressed.
+
+    A point regresses if its throughput has fallen, or its peak memory has
+    grown, by more than <threshold> as a fraction of the baseline.
+
+    @type baseline: dict[str, object]
+    @type results: dict[str, object]
+        Results of run_suite, as loaded from JSON.
+    @type threshold: float
+    @rtype: (list[str], bool)
+
+    >>> old = {"results": [{"benchmark": "queue", "parameters": \
+    {"depth": 10}, "operations": {"add": {"ops_per_second": 100.0}}}]}
+    >>> new = {"results": [{"benchmark": "queue", "parameters": \
+    {"depth": 10}, "operations": {"add": {"ops_per_second": 80.0}}}]}
+    >>> compare(old, new)
+    (['queue depth=10 add: 80 ops/s (-20.0%) REGRESSED'], True)
+    >>> new["results"][0]["operations"]["remove"] = {"ops_per_second": 90.0}
+    >>> compare(old, new)[0]
+    ['queue depth=10 remove: not in baseline', \
+'queue depth=10 add: 80 ops/s (-20.0%) REGRESSED']
+    """
+    earlier = {_point(result): result for result in baseline["results"]}
+    lines = []
+    regressed = False
+    for result in results["results"]:
+        point = _point(result)
+        if point not in earlier:
+            lines.append("{}: not in baseline".format(point))
+            continue
+        old = earlier[point]
+        changes = []
+        for operation, summary in sorted(result.get("operations",
+                                                    {}).items()):
+            if operation not in old.get("operations", {}):
+                lines.append("{} {}: not in baseline".format(point,
+                                                             operation))
+                continue
+            changes.append((operation, "ops/s", summary["ops_per_second"],
+                            old["operations"][operation]["ops_per_second"],
+                            False))
+        if "events_per_second" in result and "events_per_second" in old:
+            changes.append(("run", "events/s", result["events_per_second"],
+                            old["events_per_second"], False))
+        if "peak_bytes" in result and "peak_bytes" in old:
+            changes.append(("memory", "bytes", result["peak_bytes"],
+                            old["peak_bytes"], True))
+        for label, unit, new_value, old_value, lower_is_better in changes:
+            change = (new_value - old_value) / old_value if old_value else 0
+            worse = change > threshold if lower_is_better else \
+                change < -threshold
+            regressed = regressed or worse
+            lines.append("{} {}: {:.0f} {} ({:+.1%}){}".format(
+                point, label, new_value, unit, change,
+                " REGRESSED" if worse else ""))
+    return lines, regressed
+
+
+class _CountingQueue(PriorityQueue):
+    """A PriorityQueue that counts the items added to it one at a time.
+
+    === Attributes ===
+    @type added: int
+        The number of items added with add.
+    """
+
+    def __init__(self, key=None):
+        """Initialize an empty _CountingQueue.
+
+        Extends PriorityQueue.__init__
+
+        @type self: _CountingQueue
+        @type key: callable | None
+        @rtype: None
+        """
+        super().__init__(key)
+        self.added = 0
+
+    def add(self, item):
+        """Add <item> to this queue, and count it.
+
+        Extends PriorityQueue.add
+
+        @type self: _CountingQueue
+        @type item: object
+        @rtype: Handle
+        """
+        self.added += 1
+        return super().add(item)
+
+
+def _summarize(latencies):
+    """Return the throughput and percentiles of <latencies>.
+
+    The throughput is 0 if every latency rounds to 0 nanoseconds, which a
+    coarse timer can measure.
+
+    @type latencies: Histogram
+        The latency of each operation, in nanoseconds.
+    @rtype: dict[str, float]
+
+    >>> latencies = Histogram()
+    >>> latencies.add(0)
+    >>> _summarize(latencies)["ops_per_second"]
+    0.0
+    """
+    mean = latencies.mean()
+    summary = {"count": latencies.count,
+               "mean_ns": mean,
+               "ops_per_second": 1e9 / mean if mean else 0.0}
+    for percent, latency in latencies.percentiles((50, 95, 99)).items():
+        summary["p{}_ns".format(percent)] = latency
+    return summary
+
+
+def _peak_memory(benchmark, arguments):
+    """Return the peak memory, in bytes, that <benchmark> takes.
+
+    @type benchmark: callable
+    @type arguments: tuple
+    @rtype: int
+    """
+    tracemalloc.start()
+    try:
+        benchmark(*arguments)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _point(result):
+    """Return a name for the point of <result>.
+
+    @type result: dict[str, object]
+    @rtype: str
+    """
+    return " ".join([result["benchmark"]] + [
+        "{}={}".format(name, value)
+        for name, value in sorted(result["parameters"].items())])
+
+
+def _place(generator):
+    """Return a random location on the benchmark grid.
+
+    @type generator: random.Random
+    @rtype: Location
+    """
+    return intern_location(generator.randrange(GRID_SIZE),
+                           generator.randrange(GRID_SIZE))
+
+
+def _workload(fleet, rate):
+    """Return the workload that the whole-simulation benchmarks run.
+
+    @type fleet: int
+    @type rate: int
+    @rtype: Workload
+    """
+    return Workload(riders=rate * DURATION, drivers=fleet, duration=DURATION,
+                    size=(GRID_SIZE, GRID_SIZE), seed=fleet * 1000 + rate)
+
+
+def _print_point(name, parameters):
+    """Report that the benchmark <name> has started at <parameters>.
+
+    @type name: str
+    @type parameters: dict[str, object]
+    @rtype: None
+    """
+    print(_point({"benchmark": name, "parameters": parameters}),
+          file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the benchmark suite")
+    run.add_argument("output", help="the JSON file to write results to")
+    run.add_argument("--quick", action="store_true",
+                     help="run at fewer, smaller points")
+    run.add_argument("--no-memory", action="store_true",
+                     help="skip measuring peak memory")
+    run.add_argument("--baseline",
+                     help="results to compare with once the suite has run")
+    run.add_argument("--threshold", type=float, default=0.1)
+    comparison = commands.add_parser("compare",
+                                     help="compare two sets of results")
+    comparison.add_argument("baseline")
+    comparison.add_argument("results")
+    comparison.add_argument("--threshold", type=float, default=0.1)
+    memory = commands.add_parser("memory",
+                                 help="measure the memory objects take")
+    memory.add_argument("events", nargs="?",
+                        help="an events file to load and simulate")
+    arguments = parser.parse_args()
+
+    if arguments.command == "memory":
+        for name, size in measure_object_sizes().items():
+            print("{}: {:.0f} bytes".format(name, size))
+        if arguments.events is not None:
+            print(measure_memory(arguments.events))
+        sys.exit()
+
+    if arguments.command == "run":
+        suite = run_suite(arguments.quick, not arguments.no_memory,
+                          _print_point)
+        with open(arguments.output, "w") as output:
+            json.dump(suite, output, indent=2)
+        if arguments.baseline is None:
+            sys.exit()
+    else:
+        with open(arguments.results) as results_file:
+            suite = json.load(results_file)
+    with open(arguments.baseline) as baseline_file:
+        lines, regressed = compare(json.load(baseline_file), suite,
+                                   arguments.threshold)
+    print("\n".join(lines))
+    sys.exit(1 if regressed else 0)
@@ -0,0 +1,532 @@
+"""
+The checkpoint module saves the state of a running simulation to a file in
+a compact binary format, and restores it, so that a long simulation can be
+resumed after a crash or carried on past its original end.
+
+A checkpoint holds the events waiting in the event queue, the riders and
+drivers they refer to, the state of the dispatcher and the statistics of
+the monitor. Riders and drivers are stored once each, in tables, and
+referred to by their position in them; every id is stored once, in a
+string table.
+
+A checkpoint starts with a header holding the magic number, the format
+version, the simulated time it was taken at and the number of initial
+events the simulation had taken. The rest is a series of arrays, each
+stored as its length followed by its little-endian items.
+"""
+import os
+import struct
+import sys
+from array import array
+
+from event import (RiderRequest, DriverRequest, Cancellation, Pickup,
+                   Dropoff, BatchMatch)
+from driver import Driver
+from location import intern_location
+from rider import Rider, WAITING, CANCELLED, SATISFIED
+
+MAGIC = b"RIDECKPT"
+VERSION = 1
+
+# The header holds the magic number, the format version, the simulated
+# time of the checkpoint and the number of initial events taken.
+_HEADER = struct.Struct("<8sIqq")
+_LENGTH = struct.Struct("<Q")
+
+# The codes the kinds of events and the statuses of riders are stored as.
+_KINDS = [RiderRequest, DriverRequest, Cancellation, Pickup, Dropoff,
+          BatchMatch]
+_KIND_CODES = {kind: code for code, kind in enumerate(_KINDS)}
+_STATUSES = [WAITING, CANCELLED, SATISFIED]
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+
+# Stands for a missing reference or time.
+_NONE = -1
+
+
+class Checkpoints:
+    """The checkpoints a simulation writes as it runs.
+
+    A checkpoint is written whenever simulated time reaches a multiple of
+    the interval, before any event at that time is done.
+
+    === Attributes ===
+    @type filename: str
+        The name of the file to write each checkpoint to. Any "{time}" in
+        it is replaced by the simulated time of the checkpoint; otherwise
+        each checkpoint replaces the one before.
+    @type interval: int
+        How much simulated time passes between checkpoints.
+    @type written: list[str]
+        The names of the checkpoint files written so far, in order.
+    """
+
+    def __init__(self, filename, interval):
+        """Initialize a Checkpoints.
+
+        @type self: Checkpoints
+        @type filename: str
+        @type interval: int
+            Precondition: interval >= 1
+        @rtype: None
+        """
+        self.filename = filename
+        self.interval = interval
+        self.written = []
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: Checkpoints
+        @rtype: str
+
+        >>> print(Checkpoints("run-{time}.ckpt", 60))
+        Checkpoints every 60 to run-{time}.ckpt
+        """
+        return "Checkpoints every {} to {}".format(self.interval,
+                                                   self.filename)
+
+    def next_time(self, timestamp):
+        """Return the time of the first checkpoint after <timestamp>.
+
+        @type self: Checkpoints
+        @type timestamp: int
+        @rtype: int
+
+        >>> Checkpoints("run.ckpt", 60).next_time(125)
+        180
+        """
+        return timestamp - timestamp % self.interval + self.interval
+
+    def write(self, timestamp, taken, events, dispatcher, monitor):
+        """Write a checkpoint of a simulation at <timestamp>, and return the
+        name of the file it was written to.
+
+        @type self: Checkpoints
+        @type timestamp: int
+        @type taken: int
+        @type events: Container[Event]
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: str
+        """
+        filename = self.filename.replace("{time}", str(timestamp))
+        write_checkpoint(filename, timestamp, taken, events, dispatcher,
+                         monitor)
+        self.written.append(filename)
+        return filename
+
+
+def write_checkpoint(filename, timestamp, taken, events, dispatcher,
+                     monitor):
+    """Write a checkpoint of a simulation to <filename>.
+
+    The checkpoint is written to a temporary file first, and moved into
+    place once complete, so a crash while writing it leaves any earlier
+    checkpoint of the same name intact.
+
+    @type filename: str
+    @type timestamp: int
+        The simulated time of the checkpoint.
+    @type taken: int
+        The number of initial events the simulation has taken, which are
+        done or in <events>.
+    @type events: Container[Event]
+        The event queue of the simulation.
+    @type dispatcher: Dispatcher
+    @type monitor: Monitor
+    @rtype: None
+    """
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, timestamp, taken))
+        _Encoder(file).encode(type(dispatcher).__name__, events.pending(),
+                              dispatcher.get_state(), monitor.get_state())
+    os.replace(temporary, filename)
+
+
+def read_checkpoint(filename, events, dispatcher, monitor):
+    """Restore the simulation checkpointed in <filename> into <events>,
+    <dispatcher> and <monitor>, and return the simulated time of the
+    checkpoint and the number of initial events the simulation had taken.
+
+    Precondition: <events>, <dispatcher> and <monitor> have not been used,
+    and <dispatcher> is configured as the one checkpointed was.
+
+    @type filename: str
+    @type events: Container[Event]
+    @type dispatcher: Dispatcher
+    @type monitor: Monitor
+    @rtype: (int, int)
+    """
+    with open(filename, "rb") as file:
+        magic, version, timestamp, taken = _HEADER.unpack(
+            file.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a checkpoint")
+        if version != VERSION:
+            raise ValueError("unsupported checkpoint version {}".format(
+                version))
+        kind, pending, dispatcher_state, monitor_state = _Decoder(
+            file).decode()
+    if kind != type(dispatcher).__name__:
+        raise ValueError("checkpoint is of a simulation with a {}, not a "
+                         "{}".format(kind, type(dispatcher).__name__))
+    for event in pending:
+        event.handle = events.add(event)
+    dispatcher.set_state(dispatcher_state)
+    monitor.set_state(monitor_state)
+    return timestamp, taken
+
+
+class _Encoder:
+    """A writer of the parts of a checkpoint after its header."""
+
+    # === Private Attributes ===
+    # @type _file: io.BufferedIOBase
+    #     The file the checkpoint is written to.
+    # @type _ids: dict[str, int]
+    #     The position of each id in the string table.
+    # @type _drivers: dict[int, int]
+    #     The position in the driver table of each driver, keyed by the
+    #     id() of the Driver.
+    # @type _riders: dict[int, int]
+    #     The position in the rider table of each rider, keyed by the id()
+    #     of the Rider.
+    # @type _tables: dict[str, list]
+    #     The drivers and riders, in the order of their tables.
+
+    def __init__(self, file):
+        """Initialize an _Encoder that writes to <file>.
+
+        @type self: _Encoder
+        @type file: io.BufferedIOBase
+        @rtype: None
+        """
+        self._file = file
+        self._ids = {}
+        self._drivers = {}
+        self._riders = {}
+        self._tables = {"drivers": [], "riders": []}
+
+    def encode(self, kind, pending, dispatcher_state, monitor_state):
+        """Write the events in <pending>, the riders and drivers they and
+        the dispatcher refer to, and the states of the dispatcher and
+        monitor.
+
+        @type self: _Encoder
+        @type kind: str
+            The name of the class of the dispatcher.
+        @type pending: list[Event]
+        @type dispatcher_state: dict[str, object]
+        @type monitor_state: dict[str, object]
+        @rtype: None
+        """
+        events = {id(event): index for index, event in enumerate(pending)}
+        kinds = array("b", [_KIND_CODES[type(event)] for event in pending])
+        times = array("q", [event.timestamp for event in pending])
+        riders = array("i", [self._rider(getattr(event, "rider", None))
+                             for event in pending])
+        drivers = array("i", [self._driver(getattr(event, "driver", None))
+                              for event in pending])
+        waiting = array("i", map(self._rider, dispatcher_state["waiting"]))
+        registered = array("i", map(self._driver,
+                                    dispatcher_state["drivers"]))
+        idle = array("i", map(self._driver, dispatcher_state["idle"]))
+        order = array("i", map(self._driver, dispatcher_state["order"]))
+        batch_time = dispatcher_state.get("batch_time")
+
+        wait_ids = array("i", map(self._id, monitor_state["wait_start"]))
+        wait_starts = array("q", [_NONE if start is None else start for start
+                                  in monitor_state["wait_start"].values()])
+        locations = monitor_state["driver_location"]
+        driver_times = monitor_state["driver_time"]
+        driver_ids = array("i", map(self._id, locations))
+
+        # Every rider and driver, and so every id, is known by now.
+        self._strings([kind])
+        self._strings(list(self._ids))
+        self._write_drivers()
+        self._write_riders(events)
+        for column in (kinds, times, riders, drivers, waiting, registered,
+                       idle, order):
+            self._array(column)
+        self._array(array("q", [_NONE if batch_time is None
+                                else batch_time]))
+
+        self._array(array("q", [monitor_state[name] for name in
+                                ("wait_time", "waits", "pickup_start",
+                                 "total_distance", "ride_distance")]))
+        self._array(wait_ids)
+        self._array(wait_starts)
+        self._array(driver_ids)
+        self._array(array("i", [location.row
+                                for location in locations.values()]))
+        self._array(array("i", [location.column
+                                for location in locations.values()]))
+        self._array(array("q", [driver_times[identifier]
+                                for identifier in locations]))
+        for name in ("wait_times", "pickup_times", "ride_distances"):
+            precision, total, counts = monitor_state[name]
+            self._array(array("q", [precision, total]))
+            self._array(array("q", counts))
+
+    def _id(self, identifier):
+        """Return the position of <identifier> in the string table, adding
+        it if it is not there yet.
+
+        @type self: _Encoder
+        @type identifier: str
+        @rtype: int
+        """
+        index = self._ids.get(identifier)
+        if index is None:
+            index = self._ids[identifier] = len(self._ids)
+        return index
+
+    def _driver(self, driver):
+        """Return the position of <driver> in the driver table, adding it
+        if it is not there yet, or _NONE if <driver> is None.
+
+        @type self: _Encoder
+        @type driver: Driver | None
+        @rtype: int
+        """
+        if driver is None:
+            return _NONE
+        index = self._drivers.get(id(driver))
+        if index is None:
+            index = self._drivers[id(driver)] = len(self._drivers)
+            self._tables["drivers"].append(driver)
+            self._id(driver.id)
+        return index
+
+    def _rider(self, rider):
+        """Return the position of <rider> in the rider table, adding it if
+        it is not there yet, or _NONE if <rider> is None.
+
+        @type self: _Encoder
+        @type rider: Rider | None
+        @rtype: int
+        """
+        if rider is None:
+            return _NONE
+        index = self._riders.get(id(rider))
+        if index is None:
+            index = self._riders[id(rider)] = len(self._riders)
+            self._tables["riders"].append(rider)
+            self._id(rider.id)
+        return index
+
+    def _write_drivers(self):
+        """Write the driver table.
+
+        @type self: _Encoder
+        @rtype: None
+        """
+        drivers = self._tables["drivers"]
+        self._array(array("i", [self._ids[driver.id] for driver in drivers]))
+        self._array(array("i", [driver.location.row for driver in drivers]))
+        self._array(array("i", [driver.location.column
+                                for driver in drivers]))
+        self._array(array("i", [driver.speed for driver in drivers]))
+        self._array(array("b", [driver.is_idle for driver in drivers]))
+        self._array(array("i", [_NONE if driver.destination is None
+                                else driver.destination.row
+                                for driver in drivers]))
+        self._array(array("i", [_NONE if driver.destination is None
+                                else driver.destination.column
+                                for driver in drivers]))
+
+    def _write_riders(self, events):
+        """Write the rider table.
+
+        @type self: _Encoder
+        @type events: dict[int, int]
+            The position of each pending event, keyed by its id().
+        @rtype: None
+        """
+        riders = self._tables["riders"]
+        self._array(array("i", [self._ids[rider.id] for rider in riders]))
+        self._array(array("i", [rider.origin.row for rider in riders]))
+        self._array(array("i", [rider.origin.column for rider in riders]))
+        self._array(array("i", [rider.destination.row for rider in riders]))
+        self._array(array("i", [rider.destination.column
+                                for rider in riders]))
+        self._array(array("b", [_STATUS_CODES[rider.status]
+                                for rider in riders]))
+        self._array(array("i", [rider.patience for rider in riders]))
+        self._array(array("i", [events.get(id(rider.cancellation), _NONE)
+                                for rider in riders]))
+
+    def _strings(self, strings):
+        """Write <strings> as a string table: the offset of each in their
+        UTF-8 encoding, followed by the encoding.
+
+        @type self: _Encoder
+        @type strings: list[str]
+        @rtype: None
+        """
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = array("q", [0])
+        for string in encoded:
+            offsets.append(offsets[-1] + len(string))
+        self._array(offsets)
+        self._file.write(b"".join(encoded))
+
+    def _array(self, values):
+        """Write the array <values>, preceded by its length.
+
+        @type self: _Encoder
+        @type values: array
+        @rtype: None
+        """
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        self._file.write(_LENGTH.pack(len(values)))
+        self._file.write(values.tobytes())
+
+
+class _Decoder:
+    """A reader of the parts of a checkpoint after its header."""
+
+    # === Private Attributes ===
+    # @type _file: io.BufferedIOBase
+    #     The file the checkpoint is read from.
+
+    def __init__(self, file):
+        """Initialize a _Decoder that reads from <file>.
+
+        @type self: _Decoder
+        @type file: io.BufferedIOBase
+        @rtype: None
+        """
+        self._file = file
+
+    def decode(self):
+        """Read the name of the class of the dispatcher, the pending
+        events, and the states of the dispatcher and monitor.
+
+        @type self: _Decoder
+        @rtype: (str, list[Event], dict[str, object], dict[str, object])
+        """
+        name = self._strings()[0]
+        ids = self._strings()
+        drivers = self._read_drivers(ids)
+        riders, cancellations = self._read_riders(ids)
+
+        kinds, times, rider_column, driver_column = (
+            self._array("b"), self._array("q"), self._array("i"),
+            self._array("i"))
+        pending = []
+        for kind, timestamp, rider, driver in zip(kinds, times, rider_column,
+                                                  driver_column):
+            kind = _KINDS[kind]
+            if kind is BatchMatch:
+                pending.append(kind(timestamp))
+            elif kind is DriverRequest:
+                pending.append(kind(timestamp, drivers[driver]))
+            elif kind in (Pickup, Dropoff):
+                pending.append(kind(timestamp, riders[rider],
+                                    drivers[driver]))
+            else:
+                pending.append(kind(timestamp, riders[rider]))
+        for rider, event in zip(riders, cancellations):
+            if event != _NONE:
+                rider.cancellation = pending[event]
+
+        dispatcher_state = {
+            "waiting": [riders[index] for index in self._array("i")],
+            "drivers": [drivers[index] for index in self._array("i")],
+            "idle": [drivers[index] for index in self._array("i")],
+            "order": [drivers[index] for index in self._array("i")]}
+        batch_time = self._array("q")[0]
+        if batch_time != _NONE:
+            dispatcher_state["batch_time"] = batch_time
+
+        monitor_state = dict(zip(("wait_time", "waits", "pickup_start",
+                                  "total_distance", "ride_distance"),
+                                 self._array("q")))
+        wait_ids, wait_starts = self._array("i"), self._array("q")
+        monitor_state["wait_start"] = {
+            ids[identifier]: None if start == _NONE else start
+            for identifier, start in zip(wait_ids, wait_starts)}
+        driver_ids, rows, columns, driver_times = (
+            self._array("i"), self._array("i"), self._array("i"),
+            self._array("q"))
+        monitor_state["driver_location"] = {
+            ids[identifier]: intern_location(row, column)
+            for identifier, row, column in zip(driver_ids, rows, columns)}
+        monitor_state["driver_time"] = {
+            ids[identifier]: time
+            for identifier, time in zip(driver_ids, driver_times)}
+        for histogram in ("wait_times", "pickup_times", "ride_distances"):
+            precision, total = self._array("q")
+            monitor_state[histogram] = (precision, total, self._array("q"))
+        return name, pending, dispatcher_state, monitor_state
+
+    def _read_drivers(self, ids):
+        """Read the driver table.
+
+        @type self: _Decoder
+        @type ids: list[str]
+            The string table.
+        @rtype: list[Driver]
+        """
+        drivers = []
+        for (identifier, row, column, speed, is_idle, destination_row,
+             destination_column) in zip(*(self._array(code)
+                                          for code in "iiiibii")):
+            driver = Driver(ids[identifier], intern_location(row, column),
+                            speed)
+            driver.is_idle = bool(is_idle)
+            if destination_row != _NONE:
+                driver.destination = intern_location(destination_row,
+                                                     destination_column)
+            drivers.append(driver)
+        return drivers
+
+    def _read_riders(self, ids):
+        """Read the rider table, and return the riders and the position of
+        the pending cancellation of each, or _NONE if it has none.
+
+        @type self: _Decoder
+        @type ids: list[str]
+            The string table.
+        @rtype: (list[Rider], array[int])
+        """
+        riders = []
+        columns = [self._array(code) for code in "iiiiibi"]
+        for (identifier, origin_row, origin_column, destination_row,
+             destination_column, status, patience) in zip(*columns):
+            riders.append(Rider(
+                ids[identifier], intern_location(origin_row, origin_column),
+                intern_location(destination_row, destination_column),
+                _STATUSES[status], patience))
+        return riders, self._array("i")
+
+    def _strings(self):
+        """Read a string table.
+
+        @type self: _Decoder
+        @rtype: list[str]
+        """
+        offsets = self._array("q")
+        data = self._file.read(offsets[-1])
+        return [str(data[start:end], "utf-8")
+                for start, end in zip(offsets, offsets[1:])]
+
+    def _array(self, typecode):
+        """Read an array of items of type <typecode>.
+
+        @type self: _Decoder
+        @type typecode: str
+        @rtype: array
+        """
+        values = array(typecode)
+        length = _LENGTH.unpack(self._file.read(_LENGTH.size))[0]
+        values.frombytes(self._file.read(length * values.itemsize))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
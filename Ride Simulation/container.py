@@ -1,3 +1,7 @@
+from bisect import insort
+from heapq import heapify, heappop, heappush, nsmallest
+
+
 class Container:
     """A container that holds objects.
 
@@ -5,11 +9,12 @@ class Container:
     """
 
     def add(self, item):
-        """Add <item> to this Container.
+        """Add <item> to this Container, and return a handle that can
+        later withdraw it.
 
         @type self: Container
         @type item: Object
-        @rtype: None
+        @rtype: Handle
         """
         raise NotImplementedError("Implemented in a subclass")
 
@@ -21,6 +26,26 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def peek(self):
+        """Return the item that remove would return, without removing it.
+
+        @type self: Container
+        @rtype: Object
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def extend(self, items):
+        """Add every item in <items> to this Container.
+
+        Subclasses may override this with a faster bulk operation.
+
+        @type self: Container
+        @type items: iterable[Object]
+        @rtype: None
+        """
+        for item in items:
+            self.add(item)
+
     def is_empty(self):
         """Return True iff this Container is empty.
 
@@ -29,6 +54,103 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def pending(self):
+        """Return the items in this Container, in the order remove would
+        return them, without removing them.
+
+        @type self: Container
+        @rtype: list[Object]
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+
+class Handle:
+    """A handle on an item that has been added to a queue, which can
+    withdraw the item or move it to a different time before it is removed.
+
+    Withdrawn items are not taken out of the queue straight away; the queue
+    skips them when they come up, and sweeps them out once they make up
+    most of its entries.
+
+    === Attributes ===
+    @type item: object
+        The item this handle refers to.
+    """
+
+    # === Private Attributes ===
+    # @type _queue: PriorityQueue | CalendarQueue
+    #     The queue the item was added to.
+    # @type _seq: int | None
+    #     The sequence number of the queue entry that currently holds the
+    #     item, or None if the item is no longer pending.
+
+    __slots__ = ("item", "_queue", "_seq")
+
+    def __init__(self, queue, item):
+        """Initialize a Handle on <item> in <queue>.
+
+        @type self: Handle
+        @type queue: PriorityQueue | CalendarQueue
+        @type item: object
+        @rtype: None
+        """
+        self.item = item
+        self._queue = queue
+        self._seq = None
+
+    def is_pending(self):
+        """Return True iff the item is still waiting to be removed.
+
+        @type self: Handle
+        @rtype: bool
+
+        >>> pq = PriorityQueue()
+        >>> handle = pq.add("red")
+        >>> handle.is_pending()
+        True
+        >>> pq.remove()
+        'red'
+        >>> handle.is_pending()
+        False
+        """
+        return self._seq is not None
+
+    def cancel(self):
+        """Withdraw the item from its queue, if it is still pending.
+
+        @type self: Handle
+        @rtype: None
+
+        >>> pq = PriorityQueue()
+        >>> handle = pq.add("red")
+        >>> _ = pq.add("blue")
+        >>> handle.cancel()
+        >>> len(pq)
+        1
+        >>> pq.remove()
+        'blue'
+        >>> pq.is_empty()
+        True
+        """
+        if self._seq is not None:
+            self._seq = None
+            self._queue._discard()
+
+    def reschedule(self, timestamp):
+        """Move the item to <timestamp> in its queue. An item that has
+        already been removed or withdrawn is added back.
+
+        Precondition: the queue was created with a key function that
+        returns the timestamp attribute of its items.
+
+        @type self: Handle
+        @type timestamp: int
+        @rtype: None
+        """
+        self.cancel()
+        self.item.timestamp = timestamp
+        self._queue._push(self)
+
 
 class PriorityQueue(Container):
     """A queue of items that operates in priority order.
@@ -39,7 +161,8 @@ class PriorityQueue(Container):
     removed.
 
     Priority is defined by the rich comparison methods for the objects in the
-    container (__lt__, __le__, __gt__, __ge__).
+    container (__lt__, __le__, __gt__, __ge__), or for the values returned
+    by the <key> function passed to the initializer.
 
     If x < y, then x has a *HIGHER* priority than y.
 
@@ -47,20 +170,54 @@ class PriorityQueue(Container):
     """
 
     # === Private Attributes ===
-    # @type _items: list
-    #     The items stored in the priority queue.
+    # @type _key: ((object) -> object) | None
+    #     Return the value an item is ordered by.
+    # @type _items: list[(object, int, Handle)]
+    #     The entries stored in the priority queue: an item or its key, the
+    #     sequence number it was inserted with, and its handle.
+    # @type _counter: int
+    #     The sequence number to give the next inserted item.
+    # @type _stale: int
+    #     The number of entries in _items whose item has been withdrawn or
+    #     rescheduled.
     #
     # === Representation Invariants ===
-    # _items is a sorted list, where the first item in the queue is the
-    # item with the highest priority.
+    # _items is a binary min-heap (see heapq), where the first live entry
+    # is the item with the highest priority.
+    # Sequence numbers are unique and increase with insertion order, so two
+    # items of equal priority come out in FIFO order.
+    # An entry is live iff the _seq of its handle is its sequence number.
+
+    _MIN_COMPACT = 64
 
-    def __init__(self):
+    def __init__(self, key=None):
         """Initialize an empty PriorityQueue.
 
         @type self: PriorityQueue
+        @type key: ((object) -> object) | None
+            Return the value an item is ordered by. If None, items are
+            compared directly.
         @rtype: None
         """
+        self._key = key
         self._items = []
+        self._counter = 0
+        self._stale = 0
+
+    def __len__(self):
+        """Return the number of items in this PriorityQueue.
+
+        @type self: PriorityQueue
+        @rtype: int
+
+        >>> pq = PriorityQueue()
+        >>> len(pq)
+        0
+        >>> pq.extend(["red", "blue"])
+        >>> len(pq)
+        2
+        """
+        return len(self._items) - self._stale
 
     def remove(self):
         """Remove and return the next item from this PriorityQueue.
@@ -73,10 +230,7 @@ class PriorityQueue(Container):
         @rtype: object
 
         >>> pq = PriorityQueue()
-        >>> pq.add("red")
-        >>> pq.add("blue")
-        >>> pq.add("yellow")
-        >>> pq.add("green")
+        >>> pq.extend(["red", "blue", "yellow", "green"])
         >>> pq.remove()
         'blue'
         >>> pq.remove()
@@ -86,7 +240,34 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        items = self._items
+        while True:
+            _, seq, handle = heappop(items)
+            if handle._seq == seq:
+                handle._seq = None
+                return handle.item
+            self._stale -= 1
+
+    def peek(self):
+        """Return the next item from this PriorityQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        @type self: PriorityQueue
+        @rtype: object
+
+        >>> pq = PriorityQueue()
+        >>> pq.extend(["red", "blue"])
+        >>> pq.peek()
+        'blue'
+        >>> len(pq)
+        2
+        """
+        items = self._items
+        while items[0][2]._seq != items[0][1]:
+            heappop(items)
+            self._stale -= 1
+        return items[0][2].item
 
     def is_empty(self):
         """Return true iff this PriorityQueue is empty.
@@ -99,36 +280,403 @@ class PriorityQueue(Container):
         >>> pq = PriorityQueue()
         >>> pq.is_empty()
         True
-        >>> pq.add("thing")
+        >>> _ = pq.add("thing")
         >>> pq.is_empty()
         False
         """
-        return len(self._items) == 0
+        return len(self._items) == self._stale
+
+    def pending(self):
+        """Return the items in this PriorityQueue, in the order remove would
+        return them, without removing them.
+
+        Overrides Container.pending
+
+        @type self: PriorityQueue
+        @rtype: list[object]
+
+        >>> pq = PriorityQueue()
+        >>> pq.extend(["red", "blue", "yellow"])
+        >>> pq.add("green").cancel()
+        >>> pq.pending()
+        ['blue', 'red', 'yellow']
+        """
+        live = [entry for entry in self._items if entry[2]._seq == entry[1]]
+        live.sort(key=lambda e: e[:2])
+        return [entry[2].item for entry in live]
 
     def add(self, item):
-        """Add <item> to this PriorityQueue.
+        """Add <item> to this PriorityQueue, and return a handle that can
+        later withdraw or reschedule it.
 
         Overrides Container.add
 
         @type self: PriorityQueue
         @type item: object
+        @rtype: Handle
+
+        >>> pq = PriorityQueue()
+        >>> for colour in ["yellow", "blue", "red", "green"]:
+        ...     _ = pq.add(colour)
+        >>> [pq.remove() for _ in range(len(pq))]
+        ['blue', 'green', 'red', 'yellow']
+        """
+        handle = Handle(self, item)
+        self._push(handle)
+        return handle
+
+    def extend(self, items):
+        """Add every item in <items> to this PriorityQueue.
+
+        The items are appended and the heap is rebuilt in a single linear
+        pass, which is cheaper than adding them one at a time.
+
+        Overrides Container.extend
+
+        @type self: PriorityQueue
+        @type items: iterable[object]
         @rtype: None
 
         >>> pq = PriorityQueue()
-        >>> pq.add("yellow")
-        >>> pq.add("blue")
-        >>> pq.add("red")
-        >>> pq.add("green")
-        >>> #pq._items
-        #['blue', 'green', 'red', 'yellow']
-        """
-        index = 0
-        inserted = False
-        while index < len(self._items) and not inserted:
-            if item >= self._items[index]:
-                index += 1
-            else:
-                self._items.insert(index, item)
-                inserted = True
-        if not inserted:
-            self._items.append(item)
+        >>> _ = pq.add("red")
+        >>> pq.extend(["yellow", "blue", "red"])
+        >>> [pq.remove() for _ in range(len(pq))]
+        ['blue', 'red', 'red', 'yellow']
+        """
+        key = self._key
+        counter = self._counter
+        for item in items:
+            handle = Handle(self, item)
+            handle._seq = counter
+            self._items.append((item if key is None else key(item),
+                                counter, handle))
+            counter += 1
+        self._counter = counter
+        heapify(self._items)
+
+    def _push(self, handle):
+        """Add a new entry for the item of <handle>.
+
+        @type self: PriorityQueue
+        @type handle: Handle
+        @rtype: None
+        """
+        item = handle.item
+        handle._seq = self._counter
+        heappush(self._items, (item if self._key is None else self._key(item),
+                               self._counter, handle))
+        self._counter += 1
+
+    def _discard(self):
+        """Record that an entry has gone stale, and sweep out the stale
+        entries once they make up most of the heap.
+
+        @type self: PriorityQueue
+        @rtype: None
+        """
+        self._stale += 1
+        if (self._stale > self._MIN_COMPACT and
+                2 * self._stale > len(self._items)):
+            self._items = [entry for entry in self._items
+                           if entry[2]._seq == entry[1]]
+            heapify(self._items)
+            self._stale = 0
+
+
+class CalendarQueue(Container):
+    """A queue of items with non-negative integer priorities that operates
+    in priority order.
+
+    This is a calendar queue: items are spread over a ring of buckets, each
+    covering <width> consecutive priorities, like the days of a year in a
+    desk calendar. When items are added with priorities a bounded distance
+    ahead of the last removed item, adding and removing take amortized
+    constant time regardless of how many items are queued.
+
+    The item with the *lowest* priority is removed first. Ties are resolved
+    in FIFO order, meaning the item which was inserted *earlier* is the
+    first one to be removed.
+
+    The priority of an item is given by the <key> function passed to the
+    initializer; by default an item is its own priority.
+    """
+
+    # === Private Attributes ===
+    # @type _key: (object) -> int
+    #     Return the priority of an item.
+    # @type _buckets: list[list[(int, int, Handle)]]
+    #     The buckets of the calendar. Each entry holds the priority of an
+    #     item, its insertion sequence number and its handle.
+    # @type _width: int
+    #     The number of consecutive priorities covered by each bucket.
+    # @type _size: int
+    #     The number of items in the queue.
+    # @type _stale: int
+    #     The number of entries in _buckets whose item has been withdrawn or
+    #     rescheduled.
+    # @type _counter: int
+    #     The sequence number to give the next inserted item.
+    # @type _bucket: int
+    #     The index of the bucket the next item will be searched for in.
+    # @type _top: int
+    #     One more than the highest priority that _bucket covers in the
+    #     current pass around the calendar.
+    #
+    # === Representation Invariants ===
+    # An entry with priority p is in _buckets[(p // _width) % len(_buckets)].
+    # Each bucket is sorted by (priority, sequence number).
+    # No live entry has a priority lower than _top - _width.
+    # An entry is live iff the _seq of its handle is its sequence number.
+
+    _MIN_BUCKETS = 2
+    _MIN_COMPACT = 64
+    _SAMPLE_SIZE = 25
+
+    def __init__(self, key=None):
+        """Initialize an empty CalendarQueue.
+
+        @type self: CalendarQueue
+        @type key: ((object) -> int) | None
+            Return the priority of an item, a non-negative integer.
+        @rtype: None
+        """
+        if key is None:
+            key = int
+        self._key = key
+        self._buckets = [[] for _ in range(self._MIN_BUCKETS)]
+        self._width = 1
+        self._size = 0
+        self._stale = 0
+        self._counter = 0
+        self._bucket = 0
+        self._top = 1
+
+    def __len__(self):
+        """Return the number of items in this CalendarQueue.
+
+        @type self: CalendarQueue
+        @rtype: int
+
+        >>> cq = CalendarQueue()
+        >>> cq.extend([3, 1, 2])
+        >>> len(cq)
+        3
+        """
+        return self._size
+
+    def add(self, item):
+        """Add <item> to this CalendarQueue, and return a handle that can
+        later withdraw or reschedule it.
+
+        Overrides Container.add
+
+        @type self: CalendarQueue
+        @type item: object
+        @rtype: Handle
+
+        >>> cq = CalendarQueue()
+        >>> for priority in [40, 7, 7, 1000, 0]:
+        ...     _ = cq.add(priority)
+        >>> [cq.remove() for _ in range(len(cq))]
+        [0, 7, 7, 40, 1000]
+        """
+        handle = Handle(self, item)
+        self._push(handle)
+        return handle
+
+    def remove(self):
+        """Remove and return the next item from this CalendarQueue.
+
+        Precondition: <self> should not be empty.
+
+        Overrides Container.remove
+
+        @type self: CalendarQueue
+        @rtype: object
+
+        >>> cq = CalendarQueue(key=len)
+        >>> cq.extend(["red", "blue", "yellow", "tan"])
+        >>> [cq.remove() for _ in range(len(cq))]
+        ['red', 'tan', 'blue', 'yellow']
+        """
+        handle = self._next_bucket().pop(0)[2]
+        handle._seq = None
+        self._size -= 1
+        if (self._size < len(self._buckets) // 2 and
+                len(self._buckets) > self._MIN_BUCKETS):
+            self._resize(len(self._buckets) // 2)
+        return handle.item
+
+    def peek(self):
+        """Return the next item from this CalendarQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        @type self: CalendarQueue
+        @rtype: object
+
+        >>> cq = CalendarQueue()
+        >>> cq.extend([5, 3])
+        >>> cq.peek()
+        3
+        >>> len(cq)
+        2
+        """
+        return self._next_bucket()[0][2].item
+
+    def is_empty(self):
+        """Return true iff this CalendarQueue is empty.
+
+        Overrides Container.is_empty
+
+        @type self: CalendarQueue
+        @rtype: bool
+
+        >>> cq = CalendarQueue()
+        >>> cq.is_empty()
+        True
+        >>> _ = cq.add(4)
+        >>> cq.is_empty()
+        False
+        """
+        return self._size == 0
+
+    def pending(self):
+        """Return the items in this CalendarQueue, in the order remove would
+        return them, without removing them.
+
+        Overrides Container.pending
+
+        @type self: CalendarQueue
+        @rtype: list[object]
+
+        >>> cq = CalendarQueue()
+        >>> cq.extend([40, 7, 1000])
+        >>> cq.add(3).cancel()
+        >>> cq.pending()
+        [7, 40, 1000]
+        """
+        live = [entry for bucket in self._buckets for entry in bucket
+                if entry[2]._seq == entry[1]]
+        live.sort(key=lambda e: e[:2])
+        return [entry[2].item for entry in live]
+
+    def _push(self, handle):
+        """Add a new entry for the item of <handle>.
+
+        @type self: CalendarQueue
+        @type handle: Handle
+        @rtype: None
+        """
+        priority = self._key(handle.item)
+        if priority < self._top - self._width:
+            self._move_to(priority)
+        handle._seq = self._counter
+        insort(self._buckets[(priority // self._width) % len(self._buckets)],
+               (priority, self._counter, handle))
+        self._counter += 1
+        self._size += 1
+        if self._size > 2 * len(self._buckets):
+            self._resize(2 * len(self._buckets))
+
+    def _discard(self):
+        """Record that an entry has gone stale, and sweep out the stale
+        entries once they make up most of the calendar.
+
+        @type self: CalendarQueue
+        @rtype: None
+        """
+        self._size -= 1
+        self._stale += 1
+        if self._stale > self._MIN_COMPACT and self._stale > self._size:
+            count = len(self._buckets)
+            while count > self._MIN_BUCKETS and self._size < count // 2:
+                count //= 2
+            self._resize(count)
+
+    def _move_to(self, priority):
+        """Make the bucket that holds <priority> the current bucket.
+
+        @type self: CalendarQueue
+        @type priority: int
+        @rtype: None
+        """
+        day = priority // self._width
+        self._bucket = day % len(self._buckets)
+        self._top = (day + 1) * self._width
+
+    def _next_bucket(self):
+        """Return the bucket that holds the next item at its front, and make
+        it the current bucket.
+
+        Precondition: <self> should not be empty.
+
+        @type self: CalendarQueue
+        @rtype: list[(int, int, Handle)]
+        """
+        buckets = self._buckets
+        index = self._bucket
+        top = self._top
+        for _ in range(len(buckets)):
+            bucket = buckets[index]
+            while bucket and bucket[0][2]._seq != bucket[0][1]:
+                bucket.pop(0)
+                self._stale -= 1
+            if bucket and bucket[0][0] < top:
+                self._bucket = index
+                self._top = top
+                return bucket
+            index += 1
+            top += self._width
+            if index == len(buckets):
+                index = 0
+        # Nothing is due within a whole pass around the calendar, so the
+        # queued items are sparse: jump straight to the earliest one.
+        bucket = min((bucket for bucket in buckets if bucket),
+                     key=lambda b: b[0][:2])
+        self._move_to(bucket[0][0])
+        return bucket
+
+    def _resize(self, count):
+        """Redistribute the live items of this CalendarQueue over <count>
+        buckets, choosing a bucket width from the spacing of the next few
+        items.
+
+        @type self: CalendarQueue
+        @type count: int
+        @rtype: None
+        """
+        entries = [entry for bucket in self._buckets for entry in bucket
+                   if entry[2]._seq == entry[1]]
+        self._stale = 0
+        self._width = self._sample_width(entries)
+        self._buckets = [[] for _ in range(count)]
+        for entry in entries:
+            self._buckets[(entry[0] // self._width) % count].append(entry)
+        for bucket in self._buckets:
+            bucket.sort(key=lambda e: e[:2])
+        if entries:
+            self._move_to(min(entry[0] for entry in entries))
+        else:
+            self._move_to(self._top - 1)
+
+    def _sample_width(self, entries):
+        """Return a bucket width of about three times the average gap
+        between the priorities of the first few of <entries>.
+
+        Unusually large gaps are left out of the average, so that a few
+        far-future items do not stretch every bucket.
+
+        @type self: CalendarQueue
+        @type entries: list[(int, int, Handle)]
+        @rtype: int
+        """
+        sample = sorted(entry[0] for entry in
+                        nsmallest(self._SAMPLE_SIZE, entries,
+                                  key=lambda e: e[:2]))
+        gaps = [sample[i] - sample[i - 1] for i in range(1, len(sample))]
+        if not gaps:
+            return self._width
+        average = sum(gaps) / len(gaps)
+        gaps = [gap for gap in gaps if gap <= 2 * average]
+        return max(1, int(3 * sum(gaps) / len(gaps)))
@@ -1,4 +1,7 @@
+from collections import OrderedDict
+
 from driver import Driver
+from driver_grid import DriverGrid
 from location import Location
 from rider import Rider, WAITING
 
@@ -19,14 +22,34 @@ class Dispatcher:
     rider requests.
     """
 
-    def __init__(self):
+    # === Private Attributes ===
+    # @type _waiting_riders: OrderedDict[str, Rider]
+    #     The riders waiting for a driver keyed by id, in the order they
+    #     requested one.
+    # @type _available_drivers: dict[str, Driver]
+    #     The registered drivers keyed by id, in the order they registered.
+    # @type _idle_drivers: DriverGrid | DriverArrays
+    #     The registered drivers that are idle, indexed by location.
+    # @type _scanned: int
+    #     The number of waiting riders, and of candidates for batches,
+    #     examined so far.
+
+    def __init__(self, index=None):
         """Initialize a Dispatcher.
 
         @type self: Dispatcher
+        @type index: DriverGrid | DriverArrays | None
+            An empty index to keep idle drivers in while searching for the
+            nearest one. A DriverArrays suits very large fleets. Defaults to
+            a DriverGrid.
         @rtype: None
         """
-        self._waiting_riders = []
-        self._available_drivers = []
+        if index is None:
+            index = DriverGrid()
+        self._waiting_riders = OrderedDict()
+        self._available_drivers = {}
+        self._idle_drivers = index
+        self._scanned = 0
 
     def __str__(self):
         """Return a string representation.
@@ -44,7 +67,7 @@ class Dispatcher:
         """
         dispatcher = "Dispatcher\n"
         dispatcher += "Riders Waiting: ["
-        for riders in self._waiting_riders:
+        for riders in self._waiting_riders.values():
             dispatcher += str(riders) + ", "
         if dispatcher[-1] == "[":
             dispatcher += "]\n"
@@ -52,7 +75,7 @@ class Dispatcher:
             dispatcher = dispatcher[0:-2] + "]\n"
 
         dispatcher += "Drivers Waiting: ["
-        for drivers in self._available_drivers:
+        for drivers in self._available_drivers.values():
             dispatcher += str(drivers) + ", "
         if dispatcher[-1] == "[":
             dispatcher += "]"
@@ -63,6 +86,9 @@ class Dispatcher:
     def request_driver(self, rider):
         """Return a driver for the rider, or None if no driver is available.
 
+        The driver returned is the idle driver with the shortest travel
+        time to the rider, preferring the earliest registered on a tie.
+
         Add the rider to the waiting list if there is no available driver.
 
         @type self: Dispatcher
@@ -77,27 +103,18 @@ class Dispatcher:
         >>> print(dispatcher1.request_driver(rider1))
         Bob
         """
-        driver = None
         if len(self._available_drivers) == 0:
             rider.status = WAITING
-            self._waiting_riders.append(rider)
-            return driver
-        else:
-            for i in range(len(self._available_drivers)):
-                if (driver is None and
-                        self._available_drivers[i].is_idle):
-                    driver = self._available_drivers[i]
-                elif (driver is not None and
-                      self._available_drivers[i].is_idle and
-                      self._available_drivers[i].get_travel_time(
-                              rider.origin) < driver.get_travel_time(
-                                      rider.origin)):
-                    driver = self._available_drivers[i]
-        return driver
+            self._waiting_riders[rider.id] = rider
+            return None
+        return self._idle_drivers.nearest(rider.origin)
 
     def request_rider(self, driver):
         """Return a rider for the driver, or None if no rider is available.
 
+        The rider returned is the one that has waited longest, and is taken
+        off the waiting list.
+
         If this is a new driver, register the driver for future rider requests.
 
         @type self: Dispatcher
@@ -112,17 +129,93 @@ class Dispatcher:
         >>> print(dispatcher1.request_rider(driver1))
         Joe
         """
-        rider = None
-        done = False
-        if driver not in self._available_drivers:
-            self._available_drivers.append(driver)
-        if len(self._waiting_riders) != 0:
-            for i in range(len(self._waiting_riders)):
-                if (self._waiting_riders[i].status == WAITING and
-                        not done):
-                    rider = self._waiting_riders[i]
-                    done = True
-        return rider
+        self._register(driver)
+        while len(self._waiting_riders) != 0:
+            rider = self._waiting_riders.popitem(last=False)[1]
+            self._scanned += 1
+            if rider.status == WAITING:
+                return rider
+        return None
+
+    def schedule_batch(self, timestamp):
+        """Return the time at which requests made at <timestamp> that could
+        not be fulfilled straight away should be matched as a batch, or None
+        if no batch needs to be scheduled.
+
+        This dispatcher fulfills every request as it is made, so it never
+        needs a batch.
+
+        @type self: Dispatcher
+        @type timestamp: int
+        @rtype: int | None
+        """
+        return None
+
+    def match(self):
+        """Assign drivers to waiting riders, and return the assignments made
+        as (rider, driver) pairs.
+
+        Each rider returned is taken off the waiting list.
+
+        @type self: Dispatcher
+        @rtype: list[(Rider, Driver)]
+        """
+        return []
+
+    def candidates_scanned(self):
+        """Return the number of candidate drivers and riders this dispatcher
+        has examined while fulfilling requests so far.
+
+        @type self: Dispatcher
+        @rtype: int
+
+        >>> dispatcher1 = Dispatcher()
+        >>> dispatcher1.request_rider(Driver("Bob", Location(1, 1), 1))
+        >>> dispatcher1.request_rider(Driver("Sue", Location(5, 5), 1))
+        >>> print(dispatcher1.request_driver(Rider("Jim", Location(1, 2), \
+        Location(3, 3), WAITING, 1)))
+        Bob
+        >>> dispatcher1.candidates_scanned()
+        2
+        """
+        return self._scanned + self._idle_drivers.scanned
+
+    def is_registered(self, driver):
+        """Return True iff <driver> has registered with this dispatcher.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: bool
+
+        >>> dispatcher1 = Dispatcher()
+        >>> driver1 = Driver("Bob", Location(1, 1), 1)
+        >>> dispatcher1.is_registered(driver1)
+        False
+        >>> dispatcher1.request_rider(driver1)
+        >>> dispatcher1.is_registered(driver1)
+        True
+        """
+        return driver.id in self._available_drivers
+
+    def is_idle(self, driver):
+        """Return True iff <driver> is registered with this dispatcher and
+        is free to be assigned a rider.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: bool
+
+        >>> dispatcher1 = Dispatcher()
+        >>> driver1 = Driver("Bob", Location(1, 1), 1)
+        >>> dispatcher1.request_rider(driver1)
+        >>> dispatcher1.is_idle(driver1)
+        True
+        >>> driver1.start_drive(Location(2, 2))
+        2
+        >>> dispatcher1.is_idle(driver1)
+        False
+        """
+        return driver in self._idle_drivers
 
     def cancel_ride(self, rider):
         """Cancel the ride for rider.
@@ -131,15 +224,97 @@ class Dispatcher:
         @type rider: Rider
         @rtype: None
         """
-        index = 0
-        found = False
-        while index < len(self._waiting_riders) and not found:
-            if self._waiting_riders[index].id == rider.id:
-                found = True
-            else:
-                index += 1
-        if found:
-            del self._waiting_riders[index]
+        self._waiting_riders.pop(rider.id, None)
+
+    def unregister(self, driver):
+        """Forget <driver>, so that it is no longer assigned riders until
+        it requests a rider again.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+
+        >>> dispatcher1 = Dispatcher()
+        >>> driver1 = Driver("Bob", Location(1, 1), 1)
+        >>> dispatcher1.request_rider(driver1)
+        >>> dispatcher1.unregister(driver1)
+        >>> dispatcher1.is_registered(driver1), dispatcher1.is_idle(driver1)
+        (False, False)
+        """
+        if self._available_drivers.pop(driver.id, None) is not None:
+            self._idle_drivers.discard(driver)
+            driver.index = None
+
+    def get_state(self):
+        """Return the state of this dispatcher: the riders on the waiting
+        list and the registered drivers, both in order, the idle drivers,
+        and the drivers ever idle, in the order nearest breaks ties in.
+
+        @type self: Dispatcher
+        @rtype: dict[str, object]
+        """
+        idle = list(self._idle_drivers)
+        ids = {driver.id: driver for driver in idle}
+        return {"waiting": list(self._waiting_riders.values()),
+                "drivers": list(self._available_drivers.values()),
+                "idle": idle,
+                "order": [ids.get(identifier) or
+                          self._available_drivers[identifier]
+                          for identifier in self._idle_drivers.order()]}
+
+    def set_state(self, state):
+        """Make the state of this dispatcher that in <state>, as returned by
+        get_state.
+
+        Precondition: no rider or driver has made a request to this
+        dispatcher yet.
+
+        @type self: Dispatcher
+        @type state: dict[str, object]
+        @rtype: None
+
+        >>> dispatcher1, dispatcher2 = Dispatcher(), Dispatcher()
+        >>> dispatcher1.request_rider(Driver("Bob", Location(1, 1), 1))
+        >>> dispatcher1.request_driver(Rider("Jim", Location(1, 2), \
+        Location(3, 3), WAITING, 1)).start_drive(Location(1, 2))
+        1
+        >>> dispatcher1.request_rider(Driver("Sue", Location(1, 3), 1))
+        >>> dispatcher2.set_state(dispatcher1.get_state())
+        >>> print(dispatcher2)
+        Dispatcher
+        Riders Waiting: []
+        Drivers Waiting: [Bob, Sue]
+        >>> [str(driver) for driver in dispatcher2._idle_drivers]
+        ['Sue']
+        """
+        self._waiting_riders = OrderedDict(
+            (rider.id, rider) for rider in state["waiting"])
+        self._available_drivers = {}
+        for driver in state["drivers"]:
+            self._available_drivers[driver.id] = driver
+            driver.index = self._idle_drivers
+        idle = {id(driver) for driver in state["idle"]}
+        # Adding every driver in order, then taking out those that are not
+        # idle, rebuilds the order the index breaks ties in.
+        for driver in state["order"]:
+            self._idle_drivers.add(driver)
+            if id(driver) not in idle:
+                self._idle_drivers.discard(driver)
+
+    def _register(self, driver):
+        """Register <driver> for future rider requests, if this is a new
+        driver.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+        if driver.id not in self._available_drivers:
+            self._available_drivers[driver.id] = driver
+            driver.index = self._idle_drivers
+            if driver.is_idle:
+                self._idle_drivers.add(driver)
+
 
 if __name__ == "__main__":
     import doctest
@@ -1,3 +1,4 @@
+import travel
 from location import Location, manhattan_distance
 from rider import Rider
 
@@ -12,8 +13,15 @@ class Driver:
         The current location of the driver.
     @type is_idle: bool
         A property that is True if the driver is idle and False otherwise.
+    @type index: DriverGrid | DriverArrays | None
+        The index of idle drivers this driver is registered in, if any. The
+        driver leaves the index when it starts driving and rejoins it at
+        its new location when it arrives.
     """
 
+    __slots__ = ("id", "location", "speed", "is_idle", "destination",
+                 "index")
+
     def __init__(self, identifier, location, speed):
         """Initialize a Driver.
 
@@ -28,6 +36,7 @@ class Driver:
         self.speed = speed
         self.is_idle = True
         self.destination = None
+        self.index = None
 
     def __str__(self):
         """Return a string representation.
@@ -65,6 +74,9 @@ class Driver:
         """Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
 
+        The distance to the destination is the Manhattan distance, unless
+        another travel model is in use.
+
         @type self: Driver
         @type destination: Location
         @rtype: int
@@ -75,8 +87,12 @@ class Driver:
         >>> print(driver1.get_travel_time(destination1))
         2
         """
-        return (int(round(manhattan_distance(self.location,
-                                             destination) / self.speed)))
+        model = travel.model
+        if model is None:
+            return (int(round(manhattan_distance(self.location,
+                                                 destination) / self.speed)))
+        return int(round(model.distance(self.location, destination) /
+                         self.speed))
 
     def start_drive(self, location):
         """Start driving to the location and return the time the drive will take.
@@ -93,6 +109,8 @@ class Driver:
         """
         self.is_idle = False
         self.destination = location
+        if self.index is not None:
+            self.index.discard(self)
         return self.get_travel_time(location)
 
     def end_drive(self):
@@ -106,6 +124,8 @@ class Driver:
         self.location = self.destination
         self.destination = None
         self.is_idle = True
+        if self.index is not None:
+            self.index.add(self)
 
     def start_ride(self, rider):
         """Start a ride and return the time the ride will take.
@@ -122,6 +142,8 @@ class Driver:
         """
         self.destination = rider.destination
         self.is_idle = False
+        if self.index is not None:
+            self.index.discard(self)
         return self.get_travel_time(rider.destination)
 
     def end_ride(self):
@@ -136,3 +158,5 @@ class Driver:
         self.is_idle = True
         self.location = self.destination
         self.destination = None
+        if self.index is not None:
+            self.index.add(self)
@@ -0,0 +1,209 @@
+"""
+The driver_arrays module contains the DriverArrays class, an index of the
+idle drivers registered with a dispatcher that keeps the state of the
+whole fleet in NumPy arrays.
+
+This module requires NumPy.
+"""
+import numpy as np
+
+import travel
+from location import Location
+
+
+class DriverArrays:
+    """An index of idle drivers that mirrors the location, speed and idle
+    state of every driver it has seen in contiguous arrays, one slot per
+    driver.
+
+    A driver joins the index at its location when it becomes idle and
+    leaves it when it starts driving; either way it keeps its slot. Finding
+    the idle driver that can reach a location soonest is then one
+    vectorized pass over the arrays, which suits very large fleets better
+    than a DriverGrid when idle drivers are sparse.
+
+    === Attributes ===
+    @type scanned: int
+        The number of drivers examined by nearest so far.
+    """
+
+    # === Private Attributes ===
+    # @type _rows: numpy.ndarray
+    #     The row of each driver's last idle location, by slot.
+    # @type _columns: numpy.ndarray
+    #     The column of each driver's last idle location, by slot.
+    # @type _speeds: numpy.ndarray
+    #     The speed of each driver, by slot.
+    # @type _idle: numpy.ndarray
+    #     True for each slot whose driver is idle.
+    # @type _drivers: list[Driver]
+    #     The driver in each slot.
+    # @type _slot_of: dict[str, int]
+    #     The slot of each driver, keyed by driver id.
+    # @type _idle_count: int
+    #     The number of idle drivers.
+    #
+    # === Representation Invariants ===
+    # Slots are given out in the order drivers are first added, and only
+    # the first len(_drivers) entries of each array are in use.
+    # _idle_count is the number of True entries in _idle.
+
+    def __init__(self, capacity=64):
+        """Initialize an empty DriverArrays.
+
+        @type self: DriverArrays
+        @type capacity: int
+            The number of drivers to allocate room for up front. The arrays
+            grow as needed.
+        @rtype: None
+        """
+        self._rows = np.zeros(capacity, dtype=np.int64)
+        self._columns = np.zeros(capacity, dtype=np.int64)
+        self._speeds = np.ones(capacity, dtype=np.int64)
+        self._idle = np.zeros(capacity, dtype=bool)
+        self._drivers = []
+        self._slot_of = {}
+        self._idle_count = 0
+        self.scanned = 0
+
+    def __len__(self):
+        """Return the number of idle drivers in this DriverArrays.
+
+        @type self: DriverArrays
+        @rtype: int
+        """
+        return self._idle_count
+
+    def __contains__(self, driver):
+        """Return True iff <driver> is idle in this DriverArrays.
+
+        @type self: DriverArrays
+        @type driver: Driver
+        @rtype: bool
+        """
+        slot = self._slot_of.get(driver.id)
+        return slot is not None and bool(self._idle[slot])
+
+    def __iter__(self):
+        """Yield the idle drivers in this DriverArrays, in the order they
+        were first added.
+
+        @type self: DriverArrays
+        @rtype: iterator[Driver]
+        """
+        for slot in np.flatnonzero(self._idle[:len(self._drivers)]):
+            yield self._drivers[slot]
+
+    def order(self):
+        """Return the ids of the drivers ever added to this DriverArrays, idle
+        or not, in the order they were first added, which is the order
+        nearest breaks ties in.
+
+        @type self: DriverArrays
+        @rtype: list[str]
+
+        >>> from driver import Driver
+        >>> arrays = DriverArrays()
+        >>> bob = Driver("Bob", Location(40, 2), 1)
+        >>> arrays.add(bob)
+        >>> arrays.add(Driver("Amy", Location(1, 1), 1))
+        >>> arrays.discard(bob)
+        >>> arrays.order()
+        ['Bob', 'Amy']
+        """
+        return [driver.id for driver in self._drivers]
+
+    def add(self, driver):
+        """Add <driver> to this DriverArrays at its current location.
+
+        @type self: DriverArrays
+        @type driver: Driver
+        @rtype: None
+        """
+        slot = self._slot_of.get(driver.id)
+        if slot is None:
+            slot = len(self._drivers)
+            if slot == len(self._idle):
+                self._grow()
+            self._drivers.append(driver)
+            self._slot_of[driver.id] = slot
+            self._speeds[slot] = driver.speed
+        if not self._idle[slot]:
+            self._idle[slot] = True
+            self._idle_count += 1
+        self._rows[slot] = driver.location.row
+        self._columns[slot] = driver.location.column
+
+    def discard(self, driver):
+        """Remove <driver> from this DriverArrays, if it is idle there.
+
+        @type self: DriverArrays
+        @type driver: Driver
+        @rtype: None
+        """
+        slot = self._slot_of.get(driver.id)
+        if slot is not None and self._idle[slot]:
+            self._idle[slot] = False
+            self._idle_count -= 1
+
+    def nearest(self, location):
+        """Return the idle driver with the shortest travel time to
+        <location>, or None if there is no idle driver.
+
+        Ties are broken in favour of the driver that was added to this
+        DriverArrays first.
+
+        @type self: DriverArrays
+        @type location: Location
+        @rtype: Driver | None
+
+        >>> from driver import Driver
+        >>> arrays = DriverArrays(capacity=1)
+        >>> arrays.add(Driver("Slow", Location(1, 2), 1))
+        >>> arrays.add(Driver("Fast", Location(9, 9), 10))
+        >>> arrays.add(Driver("Near", Location(2, 2), 1))
+        >>> print(arrays.nearest(Location(1, 1)))
+        Slow
+        >>> print(arrays.nearest(Location(5, 5)))
+        Fast
+        >>> print(DriverArrays().nearest(Location(0, 0)))
+        None
+        """
+        if self._idle_count == 0:
+            return None
+        count = len(self._drivers)
+        self.scanned += count
+        model = travel.model
+        if model is None:
+            distances = (np.abs(self._rows[:count] - location.row) +
+                         np.abs(self._columns[:count] - location.column))
+        elif hasattr(model, "distances"):
+            # The model looks the distances up all at once.
+            idle = np.flatnonzero(self._idle[:count])
+            distances = np.zeros(count)
+            distances[idle] = model.distances(
+                self._rows[idle], self._columns[idle], location.row,
+                location.column)
+        else:
+            distances = np.zeros(count)
+            for slot in np.flatnonzero(self._idle[:count]):
+                distances[slot] = model.distance(
+                    self._drivers[slot].location, location)
+        times = np.rint(distances / self._speeds[:count])
+        times[~self._idle[:count]] = np.inf
+        return self._drivers[int(np.argmin(times))]
+
+    def _grow(self):
+        """Double the number of slots in this DriverArrays.
+
+        @type self: DriverArrays
+        @rtype: None
+        """
+        extra = max(1, len(self._idle))
+        self._rows = np.concatenate(
+            (self._rows, np.zeros(extra, dtype=np.int64)))
+        self._columns = np.concatenate(
+            (self._columns, np.zeros(extra, dtype=np.int64)))
+        self._speeds = np.concatenate(
+            (self._speeds, np.ones(extra, dtype=np.int64)))
+        self._idle = np.concatenate((self._idle, np.zeros(extra, dtype=bool)))
@@ -0,0 +1,263 @@
+"""
+The driver_grid module contains the DriverGrid class, a spatial index of
+the idle drivers registered with a dispatcher.
+"""
+import travel
+from location import Location
+
+
+class DriverGrid:
+    """An index of idle drivers, bucketed by location into square cells.
+
+    Drivers are kept in the index only while they are idle: a driver
+    joins the index at its location when it becomes idle and leaves it
+    when it starts driving. The index finds the idle driver that can reach
+    a location soonest by searching outwards, ring by ring, from the cell
+    that holds the location. Once a ring has more cells than there are
+    non-empty cells, the non-empty cells are searched directly instead, so
+    a search never costs more than the number of idle drivers, however far
+    apart they are.
+
+    === Attributes ===
+    @type scanned: int
+        The number of drivers examined by nearest so far.
+    """
+
+    # === Private Attributes ===
+    # @type _cell_size: int
+    #     The number of rows (and columns) covered by each cell.
+    # @type _cells: dict[(int, int), dict[str, Driver]]
+    #     The idle drivers in each non-empty cell, keyed by driver id.
+    # @type _cell_of: dict[str, (int, int)]
+    #     The cell of each idle driver in the index, keyed by driver id.
+    # @type _order: dict[str, int]
+    #     The order in which each driver was first added to the index.
+    # @type _max_speed: int
+    #     The highest speed of any driver ever added to the index.
+    #
+    # === Representation Invariants ===
+    # A driver is in _cells[c] iff _cell_of[driver.id] == c.
+    # No cell in _cells is empty.
+
+    def __init__(self, cell_size=8):
+        """Initialize an empty DriverGrid.
+
+        @type self: DriverGrid
+        @type cell_size: int
+            The number of rows (and columns) covered by each cell.
+            Precondition: cell_size > 0
+        @rtype: None
+        """
+        self._cell_size = cell_size
+        self._cells = {}
+        self._cell_of = {}
+        self._order = {}
+        self._max_speed = 0
+        self.scanned = 0
+
+    def __len__(self):
+        """Return the number of idle drivers in this DriverGrid.
+
+        @type self: DriverGrid
+        @rtype: int
+        """
+        return len(self._cell_of)
+
+    def __contains__(self, driver):
+        """Return True iff <driver> is in this DriverGrid.
+
+        @type self: DriverGrid
+        @type driver: Driver
+        @rtype: bool
+        """
+        return driver.id in self._cell_of
+
+    def __iter__(self):
+        """Yield the idle drivers in this DriverGrid, in the order they were
+        first added.
+
+        @type self: DriverGrid
+        @rtype: iterator[Driver]
+
+        >>> from driver import Driver
+        >>> grid = DriverGrid()
+        >>> grid.add(Driver("Bob", Location(40, 2), 1))
+        >>> grid.add(Driver("Amy", Location(1, 1), 1))
+        >>> [str(driver) for driver in grid]
+        ['Bob', 'Amy']
+        """
+        for identifier in sorted(self._cell_of, key=self._order.get):
+            yield self._cells[self._cell_of[identifier]][identifier]
+
+    def order(self):
+        """Return the ids of the drivers ever added to this DriverGrid, idle
+        or not, in the order they were first added, which is the order
+        nearest breaks ties in.
+
+        @type self: DriverGrid
+        @rtype: list[str]
+
+        >>> from driver import Driver
+        >>> grid = DriverGrid()
+        >>> bob = Driver("Bob", Location(40, 2), 1)
+        >>> grid.add(bob)
+        >>> grid.add(Driver("Amy", Location(1, 1), 1))
+        >>> grid.discard(bob)
+        >>> grid.order()
+        ['Bob', 'Amy']
+        """
+        return list(self._order)
+
+    def add(self, driver):
+        """Add <driver> to this DriverGrid at its current location.
+
+        @type self: DriverGrid
+        @type driver: Driver
+        @rtype: None
+        """
+        self.discard(driver)
+        cell = self._cell(driver.location)
+        self._cells.setdefault(cell, {})[driver.id] = driver
+        self._cell_of[driver.id] = cell
+        if driver.id not in self._order:
+            self._order[driver.id] = len(self._order)
+        if driver.speed > self._max_speed:
+            self._max_speed = driver.speed
+
+    def discard(self, driver):
+        """Remove <driver> from this DriverGrid, if it is there.
+
+        @type self: DriverGrid
+        @type driver: Driver
+        @rtype: None
+        """
+        cell = self._cell_of.pop(driver.id, None)
+        if cell is not None:
+            drivers = self._cells[cell]
+            del drivers[driver.id]
+            if not drivers:
+                del self._cells[cell]
+
+    def nearest(self, location):
+        """Return the idle driver with the shortest travel time to
+        <location>, or None if there is no idle driver.
+
+        Ties are broken in favour of the driver that was added to this
+        DriverGrid first.
+
+        @type self: DriverGrid
+        @type location: Location
+        @rtype: Driver | None
+
+        >>> from driver import Driver
+        >>> grid = DriverGrid(cell_size=2)
+        >>> grid.add(Driver("Slow", Location(1, 2), 1))
+        >>> grid.add(Driver("Fast", Location(9, 9), 10))
+        >>> grid.add(Driver("Near", Location(2, 2), 1))
+        >>> print(grid.nearest(Location(1, 1)))
+        Slow
+        >>> print(grid.nearest(Location(5, 5)))
+        Fast
+        >>> print(DriverGrid().nearest(Location(0, 0)))
+        None
+        """
+        best = None
+        best_key = None
+        seen = 0
+        row, column = self._cell(location)
+        for ring, cells in self._rings(row, column):
+            if seen == len(self._cell_of) or (
+                    best is not None and
+                    self._lower_bound(ring) > best_key[0]):
+                break
+            for cell in cells:
+                for driver in self._cells.get(cell, {}).values():
+                    seen += 1
+                    key = (driver.get_travel_time(location),
+                           self._order[driver.id])
+                    if best is None or key < best_key:
+                        best = driver
+                        best_key = key
+        self.scanned += seen
+        return best
+
+    def _cell(self, location):
+        """Return the cell that holds <location>.
+
+        @type self: DriverGrid
+        @type location: Location
+        @rtype: (int, int)
+        """
+        return (location.row // self._cell_size,
+                location.column // self._cell_size)
+
+    def _lower_bound(self, ring):
+        """Return a lower bound on the travel time of any driver in a cell
+        <ring> cells away from the searched cell.
+
+        A cell <ring> steps away is at least <ring> - 2 whole cells away,
+        since the searched location and the driver may each sit at the
+        near edge of their cells, and no route is shorter than its
+        Manhattan distance times the scale of the travel model in use.
+
+        @type self: DriverGrid
+        @type ring: int
+        @rtype: int
+        """
+        distance = max(0, ring - 2) * self._cell_size * travel.scale()
+        return int(round(distance / self._max_speed))
+
+    def _rings(self, row, column):
+        """Yield the distance in cells of each ring around (<row>,
+        <column>), nearest first, and the cells in the ring that may hold
+        drivers.
+
+        Rings are walked cell by cell while they have no more cells than
+        there are non-empty cells. The non-empty cells farther out are then
+        grouped into their rings directly.
+
+        @type self: DriverGrid
+        @type row: int
+        @type column: int
+        @rtype: iterator[(int, iterable[(int, int)])]
+
+        >>> from driver import Driver
+        >>> grid = DriverGrid(cell_size=1)
+        >>> grid.add(Driver("Bob", Location(0, 0), 1))
+        >>> grid.add(Driver("Amy", Location(900, 5), 1))
+        >>> [(ring, list(cells)) for ring, cells in grid._rings(0, 0)]
+        [(0, [(0, 0)]), (905, [(900, 5)])]
+        """
+        ring = 0
+        while 4 * ring <= len(self._cells):
+            yield ring, self._ring(row, column, ring)
+            ring += 1
+        farther = {}
+        for cell in self._cells:
+            distance = abs(cell[0] - row) + abs(cell[1] - column)
+            if distance >= ring:
+                farther.setdefault(distance, []).append(cell)
+        for distance in sorted(farther):
+            yield distance, farther[distance]
+
+    @staticmethod
+    def _ring(row, column, ring):
+        """Yield the cells whose Manhattan distance from (<row>, <column>)
+        in cells is exactly <ring>.
+
+        @type row: int
+        @type column: int
+        @type ring: int
+        @rtype: iterator[(int, int)]
+
+        >>> sorted(DriverGrid._ring(0, 0, 1))
+        [(-1, 0), (0, -1), (0, 1), (1, 0)]
+        """
+        if ring == 0:
+            yield (row, column)
+            return
+        for step in range(ring):
+            yield (row + step, column + ring - step)
+            yield (row + ring - step, column - step)
+            yield (row - step, column - ring + step)
+            yield (row - ring + step, column + step)
@@ -0,0 +1,269 @@
+"""
+The engine module runs a simulation with events kept as plain tuples
+rather than Event objects.
+
+Each event is a record (timestamp, sequence, kind, rider, driver): the
+sequence number orders events with the same timestamp first in, first out,
+and is unique, so records are compared by the heap without ever reaching
+their kind, rider or driver. Each kind of event is done by a handler looked
+up in a table by its kind. The handlers do exactly what the do methods of
+the Event classes do, in the same order, so the report of a TupleSimulation
+is the same as that of a Simulation given the same events, dispatcher and
+monitor.
+
+A pickup does not withdraw its rider's cancellation from the queue, as a
+Pickup event does; the cancellation is left to do nothing when its time
+comes, as a Cancellation of a rider who is not waiting does.
+"""
+from heapq import heapify, heappop, heappush
+
+from dispatcher import Dispatcher
+from event import (BatchMatch, Cancellation, DriverRequest, Dropoff, Pickup,
+                   RiderRequest)
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+from rider import WAITING, CANCELLED, SATISFIED
+
+# The kinds of event, as stored in records.
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+CANCELLATION = 2
+PICKUP_EVENT = 3
+DROPOFF_EVENT = 4
+BATCH_MATCH = 5
+
+# The kind of each Event class.
+_KINDS = {RiderRequest: RIDER_REQUEST, DriverRequest: DRIVER_REQUEST,
+          Cancellation: CANCELLATION, Pickup: PICKUP_EVENT,
+          Dropoff: DROPOFF_EVENT, BatchMatch: BATCH_MATCH}
+
+
+def to_record(event, sequence):
+    """Return <event> as a record with the sequence number <sequence>.
+
+    @type event: Event
+    @type sequence: int
+    @rtype: (int, int, int, Rider | None, Driver | None)
+
+    >>> from driver import Driver
+    >>> from location import Location
+    >>> to_record(DriverRequest(3, Driver("Bob", Location(1, 1), 1)), 0)[:3]
+    (3, 0, 1)
+    """
+    return (event.timestamp, sequence, _KINDS[type(event)],
+            getattr(event, "rider", None), getattr(event, "driver", None))
+
+
+class TupleSimulation:
+    """A simulation whose events are records, done through a table of
+    handlers.
+
+    It has no profiler or checkpoints, and runs from the start to the end.
+    """
+
+    # === Private Attributes ===
+    # @type _dispatcher: Dispatcher
+    #     The dispatcher associated with the simulation.
+    # @type _monitor: Monitor
+    #     The monitor that records the activities of the simulation.
+    # @type _queue: list[(int, int, int, Rider | None, Driver | None)]
+    #     The records of the events yet to be done, as a heap.
+    # @type _sequence: int
+    #     The sequence number to give the next record queued.
+    # @type _handlers: list[callable]
+    #     The handler of each kind of event, indexed by kind.
+
+    def __init__(self, dispatcher=None, monitor=None):
+        """Initialize a TupleSimulation.
+
+        @type self: TupleSimulation
+        @type dispatcher: Dispatcher | None
+            Defaults to a Dispatcher.
+        @type monitor: Monitor | None
+            Defaults to a Monitor.
+        @rtype: None
+        """
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        if monitor is None:
+            monitor = Monitor()
+        self._dispatcher = dispatcher
+        self._monitor = monitor
+        self._queue = []
+        self._sequence = 0
+        self._handlers = [self._rider_request, self._driver_request,
+                          self._cancellation, self._pickup, self._dropoff,
+                          self._batch_match]
+
+    def run(self, initial_events):
+        """Run the simulation on <initial_events>, and return a dictionary
+        containing statistics of the simulation, as Simulation.run does.
+
+        @type self: TupleSimulation
+        @type initial_events: iterable[Event]
+            The initial events, which are all taken before any is done.
+        @rtype: dict[str, object]
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> from simulation import Simulation
+        >>> def events():
+        ...     return [DriverRequest(0, Driver("Bob", Location(0, 0), 1)),
+        ...             RiderRequest(1, Rider("Ann", Location(2, 2),
+        ...                                   Location(4, 1), WAITING, 9)),
+        ...             RiderRequest(2, Rider("Jim", Location(1, 1),
+        ...                                   Location(1, 3), WAITING, 3))]
+        >>> report = TupleSimulation().run(events())
+        >>> report == Simulation().run(events())
+        True
+        >>> report["rider_wait_time"]
+        3.5
+        """
+        queue = [to_record(event, sequence)
+                 for sequence, event in enumerate(initial_events)]
+        heapify(queue)
+        self._queue = queue
+        self._sequence = len(queue)
+        handlers = self._handlers
+        while queue:
+            timestamp, _, kind, rider, driver = heappop(queue)
+            handlers[kind](timestamp, rider, driver)
+        return self._monitor.report()
+
+    def _schedule(self, timestamp, kind, rider, driver):
+        """Queue a record of an event of <kind> at <timestamp>.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type kind: int
+        @type rider: Rider | None
+        @type driver: Driver | None
+        @rtype: None
+        """
+        heappush(self._queue, (timestamp, self._sequence, kind, rider,
+                               driver))
+        self._sequence += 1
+
+    def _schedule_batch(self, timestamp):
+        """Queue the batch match that will serve a request made at
+        <timestamp>, if the dispatcher needs a new one.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @rtype: None
+        """
+        batch_time = self._dispatcher.schedule_batch(timestamp)
+        if batch_time is not None:
+            self._schedule(batch_time, BATCH_MATCH, None, None)
+
+    def _rider_request(self, timestamp, rider, driver):
+        """Do a rider's request, as RiderRequest.do does.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: None
+        @rtype: None
+        """
+        self._monitor.notify(timestamp, RIDER, REQUEST, rider.id,
+                             rider.origin)
+        driver = self._dispatcher.request_driver(rider)
+        if driver is not None:
+            self._schedule(timestamp + driver.start_drive(rider.origin),
+                           PICKUP_EVENT, rider, driver)
+        else:
+            self._schedule_batch(timestamp)
+        self._schedule(timestamp + rider.patience, CANCELLATION, rider,
+                       None)
+
+    def _driver_request(self, timestamp, rider, driver):
+        """Do a driver's request, as DriverRequest.do does.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type rider: None
+        @type driver: Driver
+        @rtype: None
+        """
+        self._monitor.notify(timestamp, DRIVER, REQUEST, driver.id,
+                             driver.location)
+        rider = self._dispatcher.request_rider(driver)
+        if rider is not None:
+            self._schedule(timestamp + driver.start_drive(rider.origin),
+                           PICKUP_EVENT, rider, driver)
+        else:
+            self._schedule_batch(timestamp)
+
+    def _cancellation(self, timestamp, rider, driver):
+        """Do a rider's cancellation, as Cancellation.do does.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: None
+        @rtype: None
+        """
+        if rider.status == WAITING:
+            self._monitor.notify(timestamp, RIDER, CANCEL, rider.id,
+                                 rider.origin)
+            rider.status = CANCELLED
+            self._dispatcher.cancel_ride(rider)
+
+    def _pickup(self, timestamp, rider, driver):
+        """Do a pickup, as Pickup.do does.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: Driver
+        @rtype: None
+        """
+        driver.end_drive()
+        if rider.status == WAITING:
+            travel_time = driver.start_ride(rider)
+            self._monitor.notify(timestamp, DRIVER, PICKUP, driver.id,
+                                 driver.location)
+            self._monitor.notify(timestamp, RIDER, PICKUP, rider.id,
+                                 rider.origin)
+            self._schedule(timestamp + travel_time, DROPOFF_EVENT, rider,
+                           driver)
+            rider.status = SATISFIED
+        elif rider.status == CANCELLED:
+            self._monitor.notify(timestamp, DRIVER, CANCEL, driver.id,
+                                 driver.location)
+            self._schedule(timestamp, DRIVER_REQUEST, None, driver)
+
+    def _dropoff(self, timestamp, rider, driver):
+        """Do a dropoff, as Dropoff.do does.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type rider: Rider
+        @type driver: Driver
+        @rtype: None
+        """
+        driver.end_ride()
+        rider.status = SATISFIED
+        self._monitor.notify(timestamp, DRIVER, DROPOFF, driver.id,
+                             driver.location)
+        self._monitor.notify(timestamp, RIDER, DROPOFF, rider.id,
+                             rider.destination)
+        self._schedule(timestamp, DRIVER_REQUEST, None, driver)
+
+    def _batch_match(self, timestamp, rider, driver):
+        """Match the waiting riders and drivers, as BatchMatch.do does.
+
+        @type self: TupleSimulation
+        @type timestamp: int
+        @type rider: None
+        @type driver: None
+        @rtype: None
+        """
+        for rider, driver in self._dispatcher.match():
+            self._schedule(timestamp + driver.start_drive(rider.origin),
+                           PICKUP_EVENT, rider, driver)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -3,6 +3,9 @@
 This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
+import gzip
+import lzma
+
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
 from driver import Driver
@@ -25,11 +28,19 @@ class Event:
 
     Document any such changes carefully!
 
+    Events are created in great numbers, so every subclass must declare its
+    attributes in __slots__.
+
     === Attributes ===
     @type timestamp: int
         A timestamp for this event.
+    @type handle: Handle | None
+        The handle returned when this event was added to the event queue,
+        or None if it was not scheduled through one.
     """
 
+    __slots__ = ("timestamp", "handle")
+
     def __init__(self, timestamp):
         """Initialize an Event with a given timestamp.
 
@@ -43,6 +54,7 @@ class Event:
         7
         """
         self.timestamp = timestamp
+        self.handle = None
 
     # The following six 'magic methods' are overridden to allow for easy
     # comparison of Event instances. All comparisons simply perform the
@@ -159,6 +171,15 @@ class Event:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def withdraw(self):
+        """Take this event off the event queue if it has not happened yet.
+
+        @type self: Event
+        @rtype: None
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+
     def do(self, dispatcher, monitor):
         """Do this Event.
 
@@ -190,6 +211,8 @@ class RiderRequest(Event):
         The rider.
     """
 
+    __slots__ = ("rider",)
+
     def __init__(self, timestamp, rider):
         """Initialize a RiderRequest event.
 
@@ -208,7 +231,9 @@ class RiderRequest(Event):
         the rider.
 
         Return a Cancellation event. If the rider is assigned to a driver,
-        also return a Pickup event.
+        also return a Pickup event; otherwise, if the dispatcher matches
+        riders in batches, also return the BatchMatch event that will serve
+        the rider, unless it is already scheduled.
 
         Overrides Event.do
 
@@ -225,8 +250,11 @@ class RiderRequest(Event):
             travel_time = driver.start_drive(self.rider.origin)
             events.append(Pickup(self.timestamp + travel_time,
                                  self.rider, driver))
-        events.append(Cancellation(self.timestamp +
-                                   self.rider.patience, self.rider))
+        else:
+            events.extend(schedule_batch(self.timestamp, dispatcher))
+        self.rider.cancellation = Cancellation(
+            self.timestamp + self.rider.patience, self.rider)
+        events.append(self.rider.cancellation)
         return events
 
     def __str__(self):
@@ -248,6 +276,8 @@ class DriverRequest(Event):
         The driver.
     """
 
+    __slots__ = ("driver",)
+
     def __init__(self, timestamp, driver):
         """Initialize a DriverRequest event.
 
@@ -264,7 +294,9 @@ class DriverRequest(Event):
         """Register the driver, if this is the first request, and
         assign a rider to the driver, if one is available.
 
-        If a rider is available, return a Pickup event.
+        If a rider is available, return a Pickup event. Otherwise, if the
+        dispatcher matches drivers in batches, return the BatchMatch event
+        that will serve the driver, unless it is already scheduled.
 
         Overrides Event.do
 
@@ -284,12 +316,13 @@ class DriverRequest(Event):
                        self.driver.id, self.driver.location)
         rider = dispatcher.request_rider(self.driver)
         if rider is not None:
-            dispatcher.cancel_ride(rider)
             self.driver.start_drive(rider.origin)
             events.append(Pickup(self.timestamp +
                                  self.driver.get_travel_time(
                                          rider.origin), rider,
                                  self.driver))
+        else:
+            events.extend(schedule_batch(self.timestamp, dispatcher))
         return events
 
     def __str__(self):
@@ -311,6 +344,8 @@ class Cancellation(Event):
         The rider.
     """
 
+    __slots__ = ("rider",)
+
     def __init__(self, timestamp, rider):
         """Initialize a Cancellation event.
 
@@ -363,6 +398,8 @@ class Pickup(Event):
         The driver.
     """
 
+    __slots__ = ("rider", "driver")
+
     def __init__(self, timestamp, rider, driver):
         """Initialize a Pickup event.
 
@@ -381,6 +418,9 @@ class Pickup(Event):
         """Pick up the rider is he/she is waiting or request a new
         rider for the driver if the rider cancelled their request.
 
+        A rider who is picked up can no longer cancel, so their pending
+        Cancellation is withdrawn from the event queue.
+
         Overrides Event.do
 
         @type self: Pickup
@@ -391,6 +431,8 @@ class Pickup(Event):
         events = []
         self.driver.end_drive()
         if self.rider.status == WAITING:
+            if self.rider.cancellation is not None:
+                self.rider.cancellation.withdraw()
             self.driver.start_ride(self.rider)
             monitor.notify(self.timestamp, DRIVER, PICKUP,
                            self.driver.id, self.driver.location)
@@ -429,6 +471,8 @@ class Dropoff(Event):
         The driver.
     """
 
+    __slots__ = ("rider", "driver")
+
     def __init__(self, timestamp, rider, driver):
         """Initialize a Pickup event.
 
@@ -476,6 +520,59 @@ class Dropoff(Event):
                 self.timestamp, self.driver, self.rider)
 
 
+class BatchMatch(Event):
+    """The dispatcher matches the riders and drivers who are waiting at the
+    end of a batch window.
+    """
+
+    __slots__ = ()
+
+    def do(self, dispatcher, monitor):
+        """Assign drivers to waiting riders; each assigned driver starts
+        driving to their rider.
+
+        Return a Pickup event for each assignment.
+
+        Overrides Event.do
+
+        @type self: BatchMatch
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event]
+        """
+        events = []
+        for rider, driver in dispatcher.match():
+            travel_time = driver.start_drive(rider.origin)
+            events.append(Pickup(self.timestamp + travel_time,
+                                 rider, driver))
+        return events
+
+    def __str__(self):
+        """Return a string representation of this event.
+
+        Overrides Event.__str__
+
+        @type self: BatchMatch
+        @rtype: str
+        """
+        return "{} -- Match waiting riders and drivers".format(
+                self.timestamp)
+
+
+def schedule_batch(timestamp, dispatcher):
+    """Return a list holding the BatchMatch event that will serve a request
+    made at <timestamp>, if the dispatcher needs a new one.
+
+    @type timestamp: int
+    @type dispatcher: Dispatcher
+    @rtype: list[Event]
+    """
+    batch_time = dispatcher.schedule_batch(timestamp)
+    if batch_time is None:
+        return []
+    return [BatchMatch(batch_time)]
+
+
 def create_event_list(filename):
     """Return a list of Events based on raw list of events in <filename>.
 
@@ -486,40 +583,92 @@ def create_event_list(filename):
         The name of a file that contains the list of events.
     @rtype: list[Event]
     """
-    events = []
-    event = None
-    with open(filename, "r") as file:
+    return list(read_events(filename))
+
+
+def read_events(filename):
+    """Yield the Events in <filename> one at a time, in file order, without
+    reading the whole file into memory.
+
+    The file may be plain text, or compressed with gzip or xz.
+
+    Lines with an unknown event type are skipped.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+
+    @param filename: str
+        The name of a file that contains the list of events.
+    @rtype: iterator[Event]
+    """
+    with open_events_file(filename) as file:
         for line in file:
-            line = line.strip()
-
-            if not line or line.startswith("#"):
-                # Skip lines that are blank or start with #.
-                continue
-
-            # Create a list of words in the line, e.g.
-            # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
-            # Note that these are strings, and you'll need to convert some
-            # of them to a different type.
-            tokens = line.split()
-            timestamp = int(tokens[0])
-            event_type = tokens[1]
-
-            # HINT: Use Location.deserialize to convert the location string to
-            # a location.
-
-            if event_type == "DriverRequest":
-                driver = Driver(tokens[2],
-                                deserialize_location(tokens[3]),
-                                int(tokens[4]))
-                # Create a DriverRequest event.
-                event = DriverRequest(timestamp, driver)
-            elif event_type == "RiderRequest":
-                rider = Rider(tokens[2],
-                              deserialize_location(tokens[3]),
-                              deserialize_location(tokens[4]),
-                              WAITING, int(tokens[5]))
-                # Create a RiderRequest event.
-                event = RiderRequest(timestamp, rider)
+            event = parse_event(line)
             if event is not None:
-                events.append(event)
-    return events
+                yield event
+
+
+def parse_event(line):
+    """Return the Event described by <line>, or None if the line is blank,
+    a comment, or has an unknown event type.
+
+    Precondition: <line> is in the format of a line of the events file
+    specified by the assignment handout.
+
+    @type line: str
+    @rtype: Event | None
+
+    >>> print(parse_event("10 RiderRequest Cerise 4,2 1,5 15"))
+    10 -- Cerise: Request a driver
+    >>> print(parse_event("# A comment"))
+    None
+    """
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        # Skip lines that are blank or start with #.
+        return None
+
+    # Create a list of words in the line, e.g.
+    # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
+    # Note that these are strings, and you'll need to convert some
+    # of them to a different type.
+    tokens = line.split()
+    timestamp = int(tokens[0])
+    event_type = tokens[1]
+    event = None
+
+    # HINT: Use Location.deserialize to convert the location string to
+    # a location.
+
+    if event_type == "DriverRequest":
+        driver = Driver(tokens[2],
+                        deserialize_location(tokens[3]),
+                        int(tokens[4]))
+        # Create a DriverRequest event.
+        event = DriverRequest(timestamp, driver)
+    elif event_type == "RiderRequest":
+        rider = Rider(tokens[2],
+                      deserialize_location(tokens[3]),
+                      deserialize_location(tokens[4]),
+                      WAITING, int(tokens[5]))
+        # Create a RiderRequest event.
+        event = RiderRequest(timestamp, rider)
+    return event
+
+
+def open_events_file(filename):
+    """Open <filename> for reading as text, decompressing it if it was
+    compressed with gzip or xz.
+
+    @param filename: str
+        The name of a file that contains the list of events.
+    @rtype: io.TextIOBase
+    """
+    with open(filename, "rb") as file:
+        magic = file.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.open(filename, "rt")
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return lzma.open(filename, "rt")
+    return open(filename, "r")
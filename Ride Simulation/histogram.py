@@ -0,0 +1,229 @@
+"""
+The histogram module contains the Histogram class, a summary of a stream of
+measurements from which percentiles can be read in fixed memory.
+"""
+from array import array
+
+
+class Histogram:
+    """A log-linear histogram of non-negative integer measurements, in the
+    style of an HDR histogram.
+
+    Measurements below 2 ** precision are counted exactly. Larger ones are
+    counted in buckets whose width grows with the measurement, so that
+    every percentile read back is within 2 ** (1 - precision) of a
+    measurement that was recorded, relative to its size. The memory taken
+    depends only on the precision and the largest measurement, never on
+    the number of measurements.
+
+    Histograms with the same precision can be merged, for example to
+    combine the results of simulations run in parallel.
+
+    === Attributes ===
+    @type precision: int
+        The number of significant bits kept of each measurement.
+    @type count: int
+        The number of measurements recorded.
+    @type total: int
+        The sum of the measurements recorded.
+    """
+
+    # === Private Attributes ===
+    # @type _counts: array[int]
+    #     The number of measurements in each bucket, up to the highest
+    #     bucket used so far.
+    #
+    # === Representation Invariants ===
+    # count is the sum of _counts.
+
+    def __init__(self, precision=8):
+        """Initialize an empty Histogram.
+
+        @type self: Histogram
+        @type precision: int
+            The number of significant bits kept of each measurement. Each
+            extra bit halves the error and doubles the memory taken.
+            Precondition: precision >= 1
+        @rtype: None
+        """
+        self.precision = precision
+        self.count = 0
+        self.total = 0
+        self._counts = array("q")
+
+    def __len__(self):
+        """Return the number of measurements recorded in this Histogram.
+
+        @type self: Histogram
+        @rtype: int
+        """
+        return self.count
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: Histogram
+        @rtype: str
+
+        >>> histogram = Histogram()
+        >>> histogram.add(3)
+        >>> print(histogram)
+        Histogram (1 measurements)
+        """
+        return "Histogram ({} measurements)".format(self.count)
+
+    def add(self, value, count=1):
+        """Record the measurement <value>, <count> times.
+
+        @type self: Histogram
+        @type value: int
+            Precondition: value >= 0
+        @type count: int
+        @rtype: None
+        """
+        index = self._index(value)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += count
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other):
+        """Add the measurements recorded in <other> to this Histogram.
+
+        @type self: Histogram
+        @type other: Histogram
+            Precondition: other.precision == self.precision
+        @rtype: None
+
+        >>> first, second = Histogram(), Histogram()
+        >>> first.add(1)
+        >>> second.add(5, 3)
+        >>> first.merge(second)
+        >>> len(first), first.percentile(50)
+        (4, 5)
+        """
+        if other.precision != self.precision:
+            raise ValueError("cannot merge histograms of different precision")
+        if len(other._counts) > len(self._counts):
+            self._counts.extend(
+                [0] * (len(other._counts) - len(self._counts)))
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self.count += other.count
+        self.total += other.total
+
+    def get_state(self):
+        """Return the precision of this Histogram, the sum of its
+        measurements, and the number of measurements in each of its
+        buckets.
+
+        @type self: Histogram
+        @rtype: (int, int, array[int])
+        """
+        return self.precision, self.total, array("q", self._counts)
+
+    def set_state(self, state):
+        """Make this Histogram hold the measurements described by <state>,
+        as returned by get_state.
+
+        @type self: Histogram
+        @type state: (int, int, iterable[int])
+        @rtype: None
+
+        >>> histogram, copy = Histogram(), Histogram()
+        >>> histogram.add(300, 2)
+        >>> copy.set_state(histogram.get_state())
+        >>> len(copy), copy.percentile(50) == histogram.percentile(50)
+        (2, True)
+        """
+        self.precision, self.total, counts = state
+        self._counts = array("q", counts)
+        self.count = sum(self._counts)
+
+    def mean(self):
+        """Return the mean of the measurements recorded, or 0.0 if there are
+        none.
+
+        @type self: Histogram
+        @rtype: float
+        """
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """Return the smallest measurement that at least <percent> percent
+        of the measurements recorded do not exceed, or 0 if there are none.
+
+        Measurements too large to be counted exactly are given as the
+        middle of their bucket.
+
+        @type self: Histogram
+        @type percent: float
+            Precondition: 0 <= percent <= 100
+        @rtype: int
+
+        >>> histogram = Histogram(precision=4)
+        >>> for value in range(1, 101):
+        ...     histogram.add(value)
+        >>> [histogram.percentile(p) for p in (0, 10, 50, 99, 100)]
+        [1, 10, 49, 99, 99]
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, -(-percent * self.count // 100))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self._value(index)
+        return self._value(len(self._counts) - 1)
+
+    def percentiles(self, percents=(50, 95, 99)):
+        """Return a dictionary of the percentiles of the measurements
+        recorded, keyed by <percents>.
+
+        @type self: Histogram
+        @type percents: iterable[float]
+        @rtype: dict[float, int]
+        """
+        return {percent: self.percentile(percent) for percent in percents}
+
+    def _index(self, value):
+        """Return the index of the bucket that counts <value>.
+
+        @type self: Histogram
+        @type value: int
+        @rtype: int
+
+        >>> histogram = Histogram(precision=2)
+        >>> [histogram._index(value) for value in range(4, 12)]
+        [4, 4, 5, 5, 6, 6, 6, 6]
+        """
+        exact = 1 << self.precision
+        if value < exact:
+            return value
+        shift = value.bit_length() - self.precision
+        half = exact >> 1
+        return exact + (shift - 1) * half + (value >> shift) - half
+
+    def _value(self, index):
+        """Return the measurement that stands for the bucket at <index>.
+
+        @type self: Histogram
+        @type index: int
+        @rtype: int
+
+        >>> histogram = Histogram(precision=2)
+        >>> [histogram._value(index) for index in range(3, 8)]
+        [3, 4, 6, 9, 13]
+        """
+        exact = 1 << self.precision
+        if index < exact:
+            return index
+        half = exact >> 1
+        shift, offset = divmod(index - exact, half)
+        shift += 1
+        low = (half + offset) << shift
+        return low + ((1 << shift) - 1) // 2
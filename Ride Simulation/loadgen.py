@@ -0,0 +1,182 @@
+"""
+The loadgen module replays an events file against a running dispatch
+server, sending each request when its timestamp comes round at <speed>
+units of simulated time per second, and measures how quickly the server
+decides on them.
+
+Start a server, then run this module to replay a file against it at 60
+times the speed the server's clock runs at, printing the throughput, the
+percentiles of the milliseconds each request took to be decided on as
+seen by the client, and the server's own metrics:
+
+    python server.py --port 8765 --speed 600
+    python loadgen.py events.txt --port 8765 --speed 600
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from histogram import Histogram
+from monitor import RIDER, DRIVER
+
+
+async def replay(filename, host="127.0.0.1", port=8765, path=None,
+                 speed=1.0, connections=1, timeout=10.0):
+    """Replay the requests in the events file <filename> against the server
+    at <host> and <port>, or at the Unix socket <path>, and return what was
+    measured.
+
+    Requests are shared among <connections> connections in turn. Once every
+    request has been sent, the server is given <timeout> seconds to decide
+    on those it has not answered yet.
+
+    @type filename: str
+    @type host: str
+    @type port: int
+    @type path: str | None
+    @type speed: float
+        The units of simulated time that pass each second.
+    @type connections: int
+    @type timeout: float
+    @rtype: dict[str, object]
+    """
+    requests = _read_requests(filename)
+    streams = []
+    for _ in range(connections):
+        if path is None:
+            streams.append(await asyncio.open_connection(host, port))
+        else:
+            streams.append(await asyncio.open_unix_connection(path))
+
+    sent = {}
+    latencies = Histogram()
+    counts = {"ASSIGN": 0, "WAIT": 0, "CANCEL": 0, "DROPOFF": 0, "ERROR": 0}
+    settled = asyncio.Event()
+    stats = asyncio.get_running_loop().create_future()
+    readers = [asyncio.create_task(_read_answers(
+        reader, sent, latencies, counts, settled, stats))
+        for reader, _ in streams]
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for index, (timestamp, key, line) in enumerate(requests):
+        delay = start + timestamp / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        writer = streams[index % connections][1]
+        sent[key] = time.perf_counter()
+        writer.write(line)
+        # Waits while the server is not reading, which paces this client to
+        # the server when it falls behind.
+        await writer.drain()
+    elapsed = loop.time() - start
+
+    if sent:
+        settled.clear()
+        try:
+            await asyncio.wait_for(settled.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    writer = streams[0][1]
+    writer.write(b"STATS\n")
+    await writer.drain()
+    try:
+        server = await asyncio.wait_for(stats, timeout)
+    except asyncio.TimeoutError:
+        server = None
+
+    for task in readers:
+        task.cancel()
+    for _, writer in streams:
+        writer.close()
+    return {"requests": len(requests),
+            "seconds": elapsed,
+            "requests_per_second": len(requests) / elapsed if elapsed else 0,
+            "answers": counts,
+            "undecided": len(sent),
+            "latency_ms": {percent: value / 1000 for percent, value
+                           in latencies.percentiles((50, 90, 99, 99.9))
+                           .items()},
+            "server": server}
+
+
+def _read_requests(filename):
+    """Return the requests in the events file <filename>, in order, each as
+    its timestamp, the category and id of its rider or driver, and the line
+    to send.
+
+    @type filename: str
+    @rtype: list[(int, (str, str), bytes)]
+    """
+    requests = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            tokens = line.split()
+            category = RIDER if tokens[1] == "RiderRequest" else DRIVER
+            requests.append((int(tokens[0]), (category, tokens[2]),
+                             line.encode("utf-8") + b"\n"))
+    return requests
+
+
+async def _read_answers(reader, sent, latencies, counts, settled, stats):
+    """Read the answers the server sends on a connection, recording how
+    long each request in <sent> took to be answered.
+
+    @type reader: asyncio.StreamReader
+    @type sent: dict[(str, str), float]
+        The time each request not yet answered was sent, keyed by the
+        category and id of its rider or driver.
+    @type latencies: Histogram
+        The microseconds between sending each request and its answer.
+    @type counts: dict[str, int]
+        The number of answers of each kind.
+    @type settled: asyncio.Event
+        Set once every request sent has been answered.
+    @type stats: asyncio.Future
+        Given the server's metrics once they arrive.
+    @rtype: None
+    """
+    async for line in reader:
+        received = time.perf_counter()
+        text = line.decode("utf-8").strip()
+        if text.startswith("{"):
+            if not stats.done():
+                stats.set_result(json.loads(text))
+            continue
+        tokens = text.split()
+        kind = tokens[0]
+        counts[kind] = counts.get(kind, 0) + 1
+        if kind == "ASSIGN":
+            keys = [(RIDER, tokens[2]), (DRIVER, tokens[3])]
+        elif kind in ("WAIT", "CANCEL"):
+            keys = [(tokens[2], tokens[3])]
+        else:
+            keys = []
+        for key in keys:
+            start = sent.pop(key, None)
+            if start is not None:
+                latencies.add(int((received - start) * 1000000))
+        if not sent:
+            settled.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay an events file against a dispatch server.")
+    parser.add_argument("events")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", help="connect to this Unix socket instead")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="units of simulated time per second")
+    parser.add_argument("--connections", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    arguments = parser.parse_args()
+    print(json.dumps(asyncio.run(replay(
+        arguments.events, arguments.host, arguments.port, arguments.path,
+        arguments.speed, arguments.connections, arguments.timeout)),
+        indent=2))
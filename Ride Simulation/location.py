@@ -1,4 +1,23 @@
+# The shared Location objects, keyed by their coordinates and by each
+# string they have been deserialized from.
+_interned = {}
+_parsed = {}
+
+
 class Location:
+    """A location on the grid.
+
+    Locations are immutable and hashable, so equal locations can be shared
+    and used as dictionary keys.
+
+    === Attributes ===
+    @type row: int
+        The row of the location.
+    @type column: int
+        The column of the location.
+    """
+
+    __slots__ = ("row", "column")
 
     def __init__(self, row, column):
         """Initialize a location.
@@ -8,8 +27,32 @@ class Location:
         @type column: int
         @rtype: None
         """
-        self.row = row
-        self.column = column
+        object.__setattr__(self, "row", row)
+        object.__setattr__(self, "column", column)
+
+    def __setattr__(self, name, value):
+        """Refuse to change a location.
+
+        @type self: Location
+        @type name: str
+        @type value: object
+        @rtype: None
+
+        >>> Location(1, 2).row = 3
+        Traceback (most recent call last):
+        ...
+        AttributeError: Location is immutable
+        """
+        raise AttributeError("Location is immutable")
+
+    def __delattr__(self, name):
+        """Refuse to change a location.
+
+        @type self: Location
+        @type name: str
+        @rtype: None
+        """
+        raise AttributeError("Location is immutable")
 
     def __str__(self):
         """Return a string representation.
@@ -39,6 +82,31 @@ class Location:
         """
         return self.row == other.row and self.column == other.column
 
+    def __hash__(self):
+        """Return a hash of this location, consistent with __eq__.
+
+        @type self: Location
+        @rtype: int
+
+        >>> hash(Location(1, 2)) == hash(Location(1, 2))
+        True
+        """
+        return hash((self.row, self.column))
+
+    def __reduce__(self):
+        """Return how to pickle this location: as the shared location with
+        the same coordinates, since it cannot be changed after it is made.
+
+        @type self: Location
+        @rtype: (callable, tuple)
+
+        >>> import pickle
+        >>> pickle.loads(pickle.dumps(intern_location(1, 2))) is \
+        intern_location(1, 2)
+        True
+        """
+        return intern_location, (self.row, self.column)
+
 
 def manhattan_distance(origin, destination):
     """Return the Manhattan distance between the origin and the destination.
@@ -59,6 +127,8 @@ def manhattan_distance(origin, destination):
 def deserialize_location(location_str):
     """Deserialize a location.
 
+    Equal locations are deserialized to the same shared Location object.
+
     @type location_str: str
         A location in the format 'row,col'
     @rtype: Location
@@ -66,6 +136,32 @@ def deserialize_location(location_str):
     >>> location_str = "2,16"
     >>> print (deserialize_location(location_str))
     (2, 16)
+    >>> deserialize_location("2,16") is deserialize_location("2, 16")
+    True
+    """
+    location = _parsed.get(location_str)
+    if location is None:
+        coordinates = location_str.split(',')
+        location = intern_location(int(coordinates[0]),
+                                   int(coordinates[-1]))
+        _parsed[location_str] = location
+    return location
+
+
+def intern_location(row, column):
+    """Return the shared Location for (<row>, <column>), creating it if
+    this is the first time it is asked for.
+
+    @type row: int
+    @type column: int
+    @rtype: Location
+
+    >>> intern_location(3, 4) is intern_location(3, 4)
+    True
     """
-    location = location_str.split(',')
-    return Location(int(location[0]), int(location[-1]))
+    key = (row, column)
+    location = _interned.get(key)
+    if location is None:
+        location = Location(row, column)
+        _interned[key] = location
+    return location
@@ -1,8 +1,12 @@
+from array import array
+
+import travel
+from histogram import Histogram
 from location import Location, manhattan_distance
 """
-The Monitor module contains the Monitor class, the Activity class,
-and a collection of constants. Together the elements of the module
-help keep a record of activities that have occurred.
+The Monitor module contains the Monitor and ColumnarMonitor classes, the
+Activity class, and a collection of constants. Together the elements of the
+module help keep a record of activities that have occurred.
 
 Activities fall into two categories: Rider activities and Driver
 activities. Each activity also has a description, which is one of
@@ -46,6 +50,8 @@ class Activity:
         The location at which the activity occurred.
     """
 
+    __slots__ = ("description", "time", "id", "location")
+
     def __init__(self, timestamp, description, identifier, location):
         """Initialize an Activity.
 
@@ -70,25 +76,81 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    The statistics in the report are kept up to date as each activity is
+    notified, so generating a report takes constant time. A monitor can
+    also be told to keep only those statistics, and no record of the
+    individual activities.
+
+    Besides averages, the report gives percentiles of rider wait times,
+    pickup times and ride distances. These are read from histograms of
+    fixed size, so they cost no more memory for a long simulation than for
+    a short one, and the statistics of monitors that watched separate
+    simulations can be merged.
     """
 
     # === Private Attributes ===
-    # @type _activities: dict[str, dict[str, list[Activity]]]
+    # @type _activities: dict[str, dict[str, list[Activity]]] | None
     #       A dictionary whose key is a category, and value is another
     #       dictionary. The key of the second dictionary is an identifier
-    #       and its value is a list of Activities.
-
-    def __init__(self):
+    #       and its value is a list of Activities. None if the monitor
+    #       keeps no record of activities.
+    # @type _wait_start: dict[str, int | None]
+    #       The time of the request of each rider still waiting, or None
+    #       for a rider on a ride. Riders are forgotten once they cancel or
+    #       are dropped off.
+    # @type _wait_time: int
+    #       The total time riders that have finished waiting spent waiting.
+    # @type _waits: int
+    #       The number of riders that have finished waiting.
+    # @type _driver_location: dict[str, Location]
+    #       The location of the latest activity of each driver.
+    # @type _driver_time: dict[str, int]
+    #       The time of the latest activity of each driver.
+    # @type _pickup_start: int
+    #       The time the driver of the latest driver pickup set off towards
+    #       its rider, if the rider had already asked for a ride.
+    # @type _total_distance: int
+    #       The total distance driven between consecutive activities of each
+    #       driver.
+    # @type _ride_distance: int
+    #       The part of _total_distance driven on rides, that is, in legs
+    #       that end in a dropoff.
+    # @type _wait_times: Histogram
+    #       The wait time of each rider that has finished waiting.
+    # @type _pickup_times: Histogram
+    #       The time each driver took to reach the rider it picked up,
+    #       from the later of the driver's previous activity and the
+    #       rider's request.
+    # @type _ride_distances: Histogram
+    #       The distance of each ride.
+
+    def __init__(self, history=True):
         """Initialize a Monitor.
 
         @type self: Monitor
+        @type history: bool
+            Whether to keep a record of each activity, as well as the
+            statistics needed for the report.
         @rtype: None
         """
-        self._activities = {
-            RIDER: {},
-            DRIVER: {}
-        }
-        """@type _activities: dict[str, dict[str, list[Activity]]]"""
+        self._activities = None
+        if history:
+            self._activities = {
+                RIDER: {},
+                DRIVER: {}
+            }
+        self._wait_start = {}
+        self._wait_time = 0
+        self._waits = 0
+        self._driver_location = {}
+        self._driver_time = {}
+        self._pickup_start = 0
+        self._total_distance = 0
+        self._ride_distance = 0
+        self._wait_times = Histogram()
+        self._pickup_times = Histogram()
+        self._ride_distances = Histogram()
 
     def __str__(self):
         """Return a string representation.
@@ -104,8 +166,11 @@ class Monitor:
         >>> print(monitor1)
         Monitor (1 drivers, 1 riders)
         """
+        # Every rider seen has either finished waiting or is still waiting.
+        waiting = sum(1 for start in self._wait_start.values()
+                      if start is not None)
         return "Monitor ({} drivers, {} riders)".format(
-                len(self._activities[DRIVER]), len(self._activities[RIDER]))
+                len(self._driver_location), self._waits + waiting)
 
     def notify(self, timestamp, category, description, identifier, location):
         """Notify the monitor of the activity.
@@ -123,11 +188,26 @@ class Monitor:
             The location of the activity.
         @rtype: None
         """
-        if identifier not in self._activities[category]:
-            self._activities[category][identifier] = []
+        self._record(timestamp, category, description, identifier, location)
+        self._update(timestamp, category, description, identifier, location)
 
-        activity = Activity(timestamp, description, identifier, location)
-        self._activities[category][identifier].append(activity)
+    def notify_many(self, activities):
+        """Notify the monitor of each of <activities>, in order.
+
+        @type self: Monitor
+        @type activities: iterable[(int, str, str, str, Location)]
+            The timestamp, category, description, identifier and location
+            of each activity, as passed to notify.
+        @rtype: None
+
+        >>> monitor1 = Monitor()
+        >>> monitor1.notify_many([(0, RIDER, REQUEST, "Jill", \
+        Location(1, 1)), (2, RIDER, PICKUP, "Jill", Location(1, 1))])
+        >>> monitor1.report()["rider_wait_time"]
+        2.0
+        """
+        for activity in activities:
+            self.notify(*activity)
 
     def report(self):
         """Return a report of the activities that have occurred.
@@ -135,7 +215,7 @@ class Monitor:
         @type self: Monitor
         @rtype: dict[str, object]
 
-        >>> monitor1 = Monitor()
+        >>> monitor1 = Monitor(history=False)
         >>> monitor1.notify(0, RIDER, REQUEST, "Jill", \
         Location(1, 1))
         >>> monitor1.notify(1, DRIVER, REQUEST, "Bob", \
@@ -148,13 +228,215 @@ class Monitor:
         Location(4, 1))
         >>> monitor1.notify(1, DRIVER, DROPOFF, "Bob", \
         Location(4, 1))
-        >>> #monitor1.report()
-        #{'rider_wait_time': 1.0, 'driver_total_distance': 6.0,
-        #'driver_ride_distance': 3.0}
+        >>> report = monitor1.report()
+        >>> [report[key] for key in ["rider_wait_time", \
+        "driver_total_distance", "driver_ride_distance"]]
+        [1.0, 6.0, 3.0]
+        >>> report["ride_distance_percentiles"]
+        {50: 3, 95: 3, 99: 3}
         """
         return {"rider_wait_time": self._average_wait_time(),
                 "driver_total_distance": self._average_total_distance(),
-                "driver_ride_distance": self._average_ride_distance()}
+                "driver_ride_distance": self._average_ride_distance(),
+                "rider_wait_time_percentiles":
+                    self._wait_times.percentiles(),
+                "pickup_time_percentiles": self._pickup_times.percentiles(),
+                "ride_distance_percentiles":
+                    self._ride_distances.percentiles()}
+
+    def distributions(self):
+        """Return the histograms the percentiles in the report are read
+        from, keyed by what they measure.
+
+        @type self: Monitor
+        @rtype: dict[str, Histogram]
+        """
+        return {"rider_wait_time": self._wait_times,
+                "pickup_time": self._pickup_times,
+                "ride_distance": self._ride_distances}
+
+    def release(self, identifier):
+        """Stop following the driver <identifier>, whose later activities
+        are notified to another monitor.
+
+        The distance the driver has driven so far still counts, and the
+        driver is counted again if this monitor is notified of it later.
+
+        @type self: Monitor
+        @type identifier: str
+        @rtype: None
+
+        >>> monitor1 = Monitor()
+        >>> monitor1.notify(0, DRIVER, REQUEST, "Bob", Location(1, 1))
+        >>> monitor1.release("Bob")
+        >>> print(monitor1)
+        Monitor (0 drivers, 0 riders)
+        """
+        self._driver_location.pop(identifier, None)
+        self._driver_time.pop(identifier, None)
+
+    def merge(self, other):
+        """Add the statistics kept by <other> to those of this monitor, so
+        that the report covers the activities both were notified of.
+
+        Only the statistics are merged, not any record of the activities.
+
+        @type self: Monitor
+        @type other: Monitor
+            A monitor of a different simulation, whose riders and drivers
+            have different identifiers from this monitor's.
+        @rtype: None
+
+        >>> monitor1, monitor2 = Monitor(history=False), Monitor()
+        >>> monitor1.notify(0, RIDER, REQUEST, "Jill", Location(1, 1))
+        >>> monitor1.notify(2, RIDER, PICKUP, "Jill", Location(1, 1))
+        >>> monitor2.notify(0, RIDER, REQUEST, "Sam", Location(1, 1))
+        >>> monitor2.notify(6, RIDER, CANCEL, "Sam", Location(1, 1))
+        >>> monitor1.merge(monitor2)
+        >>> report = monitor1.report()
+        >>> report["rider_wait_time"], report["rider_wait_time_percentiles"]
+        (4.0, {50: 2, 95: 6, 99: 6})
+        """
+        self._wait_start.update(other._wait_start)
+        self._wait_time += other._wait_time
+        self._waits += other._waits
+        self._driver_location.update(other._driver_location)
+        self._driver_time.update(other._driver_time)
+        self._total_distance += other._total_distance
+        self._ride_distance += other._ride_distance
+        self._wait_times.merge(other._wait_times)
+        self._pickup_times.merge(other._pickup_times)
+        self._ride_distances.merge(other._ride_distances)
+
+    def get_state(self):
+        """Return the statistics this monitor keeps for its report.
+
+        The record of the individual activities, if the monitor keeps one,
+        is not part of them, and of the riders only those still waiting or
+        on a ride are.
+
+        @type self: Monitor
+        @rtype: dict[str, object]
+
+        >>> monitor1 = Monitor(history=False)
+        >>> monitor1.notify(0, RIDER, REQUEST, "Jill", Location(1, 1))
+        >>> monitor1.notify(1, RIDER, REQUEST, "Sam", Location(2, 1))
+        >>> monitor1.notify(3, RIDER, CANCEL, "Sam", Location(2, 1))
+        >>> monitor1.get_state()["wait_start"]
+        {'Jill': 0}
+        """
+        return {"wait_start": self._wait_start,
+                "wait_time": self._wait_time,
+                "waits": self._waits,
+                "driver_location": self._driver_location,
+                "driver_time": self._driver_time,
+                "pickup_start": self._pickup_start,
+                "total_distance": self._total_distance,
+                "ride_distance": self._ride_distance,
+                "wait_times": self._wait_times.get_state(),
+                "pickup_times": self._pickup_times.get_state(),
+                "ride_distances": self._ride_distances.get_state()}
+
+    def set_state(self, state):
+        """Make the statistics this monitor keeps for its report those in
+        <state>, as returned by get_state, so that it carries on from where
+        the monitor they were taken from left off.
+
+        @type self: Monitor
+        @type state: dict[str, object]
+        @rtype: None
+
+        >>> monitor1, monitor2 = Monitor(), Monitor(history=False)
+        >>> monitor1.notify(0, RIDER, REQUEST, "Jill", Location(1, 1))
+        >>> monitor2.set_state(monitor1.get_state())
+        >>> monitor2.notify(4, RIDER, PICKUP, "Jill", Location(1, 1))
+        >>> monitor2.report()["rider_wait_time"]
+        4.0
+        """
+        self._wait_start = dict(state["wait_start"])
+        self._wait_time = state["wait_time"]
+        self._waits = state["waits"]
+        self._driver_location = dict(state["driver_location"])
+        self._driver_time = dict(state["driver_time"])
+        self._pickup_start = state["pickup_start"]
+        self._total_distance = state["total_distance"]
+        self._ride_distance = state["ride_distance"]
+        self._wait_times.set_state(state["wait_times"])
+        self._pickup_times.set_state(state["pickup_times"])
+        self._ride_distances.set_state(state["ride_distances"])
+
+    def _record(self, timestamp, category, description, identifier,
+                location):
+        """Add the activity to the monitor's record of activities, if it
+        keeps one.
+
+        @type self: Monitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        if self._activities is None:
+            return
+        if identifier not in self._activities[category]:
+            self._activities[category][identifier] = []
+
+        activity = Activity(timestamp, description, identifier, location)
+        self._activities[category][identifier].append(activity)
+
+    def _update(self, timestamp, category, description, identifier,
+                location):
+        """Update the statistics for the report with the activity.
+
+        @type self: Monitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        if category == RIDER:
+            # A rider's activities are REQUEST, then CANCEL, or PICKUP and
+            # DROPOFF. The wait time is the time from the request to the
+            # cancellation or pickup.
+            if description == REQUEST:
+                self._wait_start[identifier] = timestamp
+            elif description == DROPOFF:
+                self._wait_start.pop(identifier, None)
+            else:
+                start = self._wait_start.get(identifier)
+                if start is not None:
+                    self._wait_time += timestamp - start
+                    self._waits += 1
+                    self._wait_times.add(timestamp - start)
+                    if description == PICKUP:
+                        self._wait_start[identifier] = None
+                        # The driver is notified of the pickup just before
+                        # the rider, and set off no earlier than the
+                        # rider's request.
+                        self._pickup_times.add(
+                            timestamp - max(start, self._pickup_start))
+                    else:
+                        del self._wait_start[identifier]
+        else:
+            previous = self._driver_location.get(identifier)
+            if previous is not None:
+                model = travel.model
+                if model is None:
+                    distance = manhattan_distance(location, previous)
+                else:
+                    distance = model.distance(previous, location)
+                self._total_distance += distance
+                if description == PICKUP:
+                    self._pickup_start = self._driver_time[identifier]
+                elif description == DROPOFF:
+                    self._ride_distance += distance
+                    self._ride_distances.add(distance)
+            self._driver_location[identifier] = location
+            self._driver_time[identifier] = timestamp
 
     def _average_wait_time(self):
         """Return the average wait time of riders that have either been picked
@@ -172,22 +454,12 @@ class Monitor:
         Location(2, 1))
         >>> monitor1.notify(6, RIDER, CANCEL, "Sam", \
         Location(2, 1))
-        >>> #monitor1._average_wait_time()
-        #2.0
-        """
-        wait_time = 0
-        count = 0
-        for activities in self._activities[RIDER].values():
-            # A rider that has less than two activities hasn't finished
-            # waiting (they haven't cancelled or been picked up).
-            if len(activities) >= 2:
-                # The first activity is REQUEST, and the second is PICKUP
-                # or CANCEL. The wait time is the difference between the two.
-                wait_time += activities[1].time - activities[0].time
-                count += 1
-        if count == 0:
+        >>> monitor1._average_wait_time()
+        2.0
+        """
+        if self._waits == 0:
             return 0.0
-        return wait_time / count
+        return self._wait_time / self._waits
 
     def _average_total_distance(self):
         """Return the average distance drivers have driven.
@@ -206,20 +478,12 @@ class Monitor:
         Location(2, 1))
         >>> monitor1.notify(6, DRIVER, CANCEL, "Tom", \
         Location(3, 1))
-        >>> #monitor1._average_total_distance()
-        #2.5
-        """
-        total_distance = 0
-        count = 0
-        for activities in list(self._activities[DRIVER].values()):
-            for i in range(1, len(activities)):
-                total_distance += manhattan_distance(
-                        activities[i].location,
-                        activities[i-1].location)
-            count += 1
-        if count == 0:
+        >>> monitor1._average_total_distance()
+        2.5
+        """
+        if len(self._driver_location) == 0:
             return 0.0
-        return total_distance / count
+        return self._total_distance / len(self._driver_location)
 
     def _average_ride_distance(self):
         """Return the average distance drivers have driven on rides.
@@ -238,18 +502,123 @@ class Monitor:
         Location(5, 2))
         >>> monitor1.notify(6, DRIVER, DROPOFF, "Tom", \
         Location(6, 3))
-        >>> #monitor1._average_ride_distance()
-        #1.0
-        """
-        total_distance = 0
-        count = 0
-        for activities in list(self._activities[DRIVER].values()):
-            for i in range(1, len(activities)):
-                if activities[i].description == DROPOFF:
-                    total_distance += manhattan_distance(
-                        activities[i].location,
-                        activities[i-1].location)
-            count += 1
-        if count == 0:
+        >>> monitor1._average_ride_distance()
+        1.0
+        """
+        if len(self._driver_location) == 0:
             return 0.0
-        return total_distance / count
+        return self._ride_distance / len(self._driver_location)
+
+
+# The codes ColumnarMonitor stores categories and descriptions as.
+_CATEGORIES = [RIDER, DRIVER]
+_DESCRIPTIONS = [REQUEST, CANCEL, PICKUP, DROPOFF]
+_CATEGORY_CODES = {category: code for code, category in
+                   enumerate(_CATEGORIES)}
+_DESCRIPTION_CODES = {description: code for code, description in
+                      enumerate(_DESCRIPTIONS)}
+
+
+class ColumnarMonitor(Monitor):
+    """A monitor that records activities compactly, as rows of typed
+    arrays rather than as Activity objects.
+
+    Each activity takes a few tens of bytes, and the monitor's report is
+    the same as a Monitor's given the same notifications.
+    """
+
+    # === Private Attributes ===
+    # @type _times: array[int]
+    #     The time of each activity.
+    # @type _categories: array[int]
+    #     The category of each activity, as its index in _CATEGORIES.
+    # @type _descriptions: array[int]
+    #     The description of each activity, as its index in _DESCRIPTIONS.
+    # @type _ids: array[int]
+    #     The identifier of each activity, as its index in _identifiers.
+    # @type _rows: array[int]
+    #     The row of the location of each activity.
+    # @type _columns: array[int]
+    #     The column of the location of each activity.
+    # @type _identifiers: dict[str, int]
+    #     The index of each identifier that has been notified about.
+    #
+    # === Representation Invariants ===
+    # The arrays all have one entry per activity, in the order the monitor
+    # was notified of them.
+
+    def __init__(self):
+        """Initialize a ColumnarMonitor.
+
+        Extends Monitor.__init__
+
+        @type self: ColumnarMonitor
+        @rtype: None
+        """
+        super().__init__(history=False)
+        self._times = array("q")
+        self._categories = array("b")
+        self._descriptions = array("b")
+        self._ids = array("i")
+        self._rows = array("i")
+        self._columns = array("i")
+        self._identifiers = {}
+
+    def notify_many(self, activities):
+        """Notify the monitor of each of <activities>, in order.
+
+        Overrides Monitor.notify_many
+
+        @type self: ColumnarMonitor
+        @type activities: iterable[(int, str, str, str, Location)]
+            The timestamp, category, description, identifier and location
+            of each activity, as passed to notify.
+        @rtype: None
+
+        >>> monitor1 = ColumnarMonitor()
+        >>> monitor1.notify_many([(0, RIDER, REQUEST, "Jill", \
+        Location(1, 1)), (2, RIDER, PICKUP, "Jill", Location(1, 1))])
+        >>> monitor1.report()["rider_wait_time"]
+        2.0
+        >>> print(monitor1)
+        Monitor (0 drivers, 1 riders)
+        """
+        activities = list(activities)
+        identifiers = self._identifiers
+        for activity in activities:
+            if activity[3] not in identifiers:
+                identifiers[activity[3]] = len(identifiers)
+            self._update(*activity)
+        self._times.extend(activity[0] for activity in activities)
+        self._categories.extend(_CATEGORY_CODES[activity[1]]
+                                for activity in activities)
+        self._descriptions.extend(_DESCRIPTION_CODES[activity[2]]
+                                  for activity in activities)
+        self._ids.extend(identifiers[activity[3]] for activity in activities)
+        self._rows.extend(activity[4].row for activity in activities)
+        self._columns.extend(activity[4].column for activity in activities)
+
+    def _record(self, timestamp, category, description, identifier,
+                location):
+        """Add the activity to the monitor's columns.
+
+        Overrides Monitor._record
+
+        @type self: ColumnarMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        index = self._identifiers.get(identifier)
+        if index is None:
+            index = len(self._identifiers)
+            self._identifiers[identifier] = index
+        self._times.append(timestamp)
+        self._categories.append(_CATEGORY_CODES[category])
+        self._descriptions.append(_DESCRIPTION_CODES[description])
+        self._ids.append(index)
+        self._rows.append(location.row)
+        self._columns.append(location.column)
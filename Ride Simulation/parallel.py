@@ -0,0 +1,633 @@
+"""
+The parallel module runs a simulation as a number of regions of the grid,
+each simulated by its own process.
+
+Every region has its own event queue, dispatcher and monitor, so riders are
+only assigned the drivers that are idle in the region they ask for a ride
+in. A driver who carries a rider into another region is handed over to
+that region when the rider is dropped off, and the monitors of the regions
+are merged into one report at the end.
+
+The regions are kept in step conservatively: they all simulate the same
+window of time, then exchange the drivers handed over in it. A window is
+as long as the shortest ride between two regions can take, so a driver
+handed over is never due in a window that has already been simulated, and
+the report does not depend on the number of processes. A ride between two
+regions can take no time at all, and then the window is empty: the regions
+do the events of one time in each round, and a driver handed over at that
+time joins the other region in a round of its own, at the same time.
+"""
+import multiprocessing
+import os
+from operator import attrgetter
+
+import travel
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import DriverRequest, Dropoff, RiderRequest, create_event_list
+from location import intern_location, manhattan_distance
+from monitor import Monitor
+
+
+class Partition:
+    """A division of the grid into a rectangle of equally sized regions.
+
+    Regions are numbered row by row. Locations outside the bounds of the
+    partition belong to the nearest region.
+
+    === Attributes ===
+    @type rows: int
+        The number of rows of regions.
+    @type columns: int
+        The number of columns of regions.
+    """
+
+    # === Private Attributes ===
+    # @type _low: (int, int)
+    #     The smallest row and column of the grid.
+    # @type _size: (int, int)
+    #     The number of grid rows and grid columns each region spans.
+
+    def __init__(self, locations, rows, columns):
+        """Initialize a Partition of the part of the grid that <locations>
+        cover into <rows> by <columns> regions.
+
+        @type self: Partition
+        @type locations: iterable[Location]
+            Precondition: there is at least one location.
+        @type rows: int
+        @type columns: int
+        @rtype: None
+
+        >>> from location import Location
+        >>> partition = Partition([Location(0, 0), Location(9, 19)], 2, 2)
+        >>> [partition.region_of(Location(r, c)) \
+        for r, c in [(0, 0), (4, 10), (5, 9), (9, 19)]]
+        [0, 1, 2, 3]
+        """
+        locations = list(locations)
+        low_row = min(location.row for location in locations)
+        low_column = min(location.column for location in locations)
+        high_row = max(location.row for location in locations)
+        high_column = max(location.column for location in locations)
+        self.rows = rows
+        self.columns = columns
+        self._low = (low_row, low_column)
+        self._size = (-(-(high_row - low_row + 1) // rows),
+                      -(-(high_column - low_column + 1) // columns))
+
+    def __len__(self):
+        """Return the number of regions in this Partition.
+
+        @type self: Partition
+        @rtype: int
+        """
+        return self.rows * self.columns
+
+    def region_of(self, location):
+        """Return the number of the region that <location> is in.
+
+        @type self: Partition
+        @type location: Location
+        @rtype: int
+        """
+        row = (location.row - self._low[0]) // self._size[0]
+        column = (location.column - self._low[1]) // self._size[1]
+        return (min(max(row, 0), self.rows - 1) * self.columns +
+                min(max(column, 0), self.columns - 1))
+
+
+class Region:
+    """One region of a partitioned simulation, with its own event queue,
+    dispatcher and monitor.
+
+    === Attributes ===
+    @type number: int
+        The number of this region in the partition.
+    @type dispatcher: Dispatcher
+        The dispatcher of the drivers and riders in this region.
+    @type monitor: Monitor
+        The monitor of the activities in this region.
+    """
+
+    # === Private Attributes ===
+    # @type _partition: Partition
+    #     The partition this region belongs to.
+    # @type _events: PriorityQueue[Event]
+    #     The events due in this region.
+
+    def __init__(self, number, partition, events, dispatcher):
+        """Initialize a Region that starts with <events>.
+
+        @type self: Region
+        @type number: int
+        @type partition: Partition
+        @type events: list[Event]
+        @type dispatcher: Dispatcher
+        @rtype: None
+        """
+        self.number = number
+        self.dispatcher = dispatcher
+        self.monitor = Monitor(history=False)
+        self._partition = partition
+        self._events = PriorityQueue(key=attrgetter("timestamp"))
+        self._events.extend(events)
+
+    def next_time(self):
+        """Return the time of the next event due in this region, or None if
+        there is none.
+
+        @type self: Region
+        @rtype: int | None
+        """
+        if self._events.is_empty():
+            return None
+        return self._events.peek().timestamp
+
+    def receive(self, handovers):
+        """Take over the drivers in <handovers>, each of whom requests a
+        rider in this region at the given time.
+
+        @type self: Region
+        @type handovers: list[(int, str, int, int, int)]
+            The time, id, row, column and speed of each driver, in the
+            order the drivers should be queued.
+        @rtype: None
+        """
+        for timestamp, identifier, row, column, speed in handovers:
+            event = DriverRequest(timestamp, Driver(
+                identifier, intern_location(row, column), speed))
+            event.handle = self._events.add(event)
+
+    def advance(self, until):
+        """Do the events due in this region before <until>.
+
+        Return the drivers to hand over to other regions: those who have
+        set off on a ride that ends in another region.
+
+        @type self: Region
+        @type until: int | float
+        @rtype: list[(int, int, str, int, int, int)]
+            The time of the dropoff and the region the driver is handed
+            over to, followed by the time, id, row, column and speed of the
+            driver as given to Region.receive.
+        """
+        handovers = []
+        while (not self._events.is_empty() and
+               self._events.peek().timestamp < until):
+            event_to_perform = self._events.remove()
+            additional_events = event_to_perform.do(self.dispatcher,
+                                                    self.monitor)
+            if (isinstance(event_to_perform, Dropoff) and
+                    self._leaves(event_to_perform.driver.location)):
+                # The driver was handed over when the ride began, so the
+                # request for a new rider is made in the other region.
+                driver = event_to_perform.driver
+                self.dispatcher.unregister(driver)
+                self.monitor.release(driver.id)
+                additional_events = [
+                    event for event in additional_events
+                    if not (isinstance(event, DriverRequest) and
+                            event.driver is driver)]
+            for event in additional_events:
+                event.handle = self._events.add(event)
+                if (isinstance(event, Dropoff) and
+                        self._leaves(event.rider.destination)):
+                    destination = event.rider.destination
+                    handovers.append((
+                        event.timestamp,
+                        self._partition.region_of(destination),
+                        event.driver.id, destination.row,
+                        destination.column, event.driver.speed))
+        return handovers
+
+    def _leaves(self, location):
+        """Return True iff <location> is outside this region.
+
+        @type self: Region
+        @type location: Location
+        @rtype: bool
+        """
+        return self._partition.region_of(location) != self.number
+
+
+class PartitionedSimulation:
+    """A simulation of a grid divided into regions, simulated in parallel.
+
+    With a single region, the report is the same as a Simulation's.
+    """
+
+    # === Private Attributes ===
+    # @type _rows: int
+    #     The number of rows of regions.
+    # @type _columns: int
+    #     The number of columns of regions.
+    # @type _processes: int | None
+    #     The number of processes to simulate the regions with.
+    # @type _window: int | None
+    #     The length of each window of time, if one was given.
+    # @type _dispatcher: callable
+    #     Makes a new, empty dispatcher for each region.
+
+    def __init__(self, rows=2, columns=2, processes=None, window=None,
+                 dispatcher=Dispatcher):
+        """Initialize a PartitionedSimulation.
+
+        @type self: PartitionedSimulation
+        @type rows: int
+            The number of rows of regions to divide the grid into.
+        @type columns: int
+            The number of columns of regions to divide the grid into.
+        @type processes: int | None
+            The number of processes to simulate the regions with. With one
+            process, the regions are simulated in this one. Defaults to the
+            number of CPUs, or the number of regions if that is smaller.
+        @type window: int | None
+            The length of each window of time. Defaults to the shortest
+            time a ride between two regions can take, which keeps every
+            handover on time. A window of 0 does the events of one time in
+            each round. A longer window means fewer exchanges between
+            processes, but a driver handed over during a window only joins
+            the other region at its end.
+        @type dispatcher: callable
+            Makes a new, empty dispatcher for each region, such as
+            BatchDispatcher. It must be picklable if the regions are
+            simulated in other processes.
+        @rtype: None
+        """
+        self._rows = rows
+        self._columns = columns
+        self._processes = processes
+        self._window = window
+        self._dispatcher = dispatcher
+
+    def run(self, initial_events):
+        """Run the simulation on the list of events in <initial_events>.
+
+        Return a dictionary containing statistics of the simulation, as
+        Simulation.run does.
+
+        @type self: PartitionedSimulation
+        @type initial_events: list[Event] | iterable[Event]
+        @rtype: dict[str, object]
+
+        >>> from location import Location
+        >>> from rider import Rider, WAITING
+        >>> events = [DriverRequest(0, Driver("Bob", Location(0, 0), 1)), \
+        DriverRequest(0, Driver("Sue", Location(9, 9), 1)), \
+        RiderRequest(1, Rider("Ann", Location(0, 1), Location(9, 8), \
+        WAITING, 5)), RiderRequest(30, Rider("Jim", Location(9, 8), \
+        Location(0, 0), WAITING, 5))]
+        >>> report = PartitionedSimulation(1, 2, processes=1).run(events)
+        >>> report["rider_wait_time"], report["driver_total_distance"]
+        (0.5, 17.0)
+        """
+        initial_events = list(initial_events)
+        if len(initial_events) == 0:
+            return Monitor(history=False).report()
+        partition = Partition(_locations(initial_events), self._rows,
+                              self._columns)
+        window = self._window
+        if window is None:
+            window = _lookahead(initial_events, partition)
+
+        regional_events = [[] for _ in range(len(partition))]
+        for event in initial_events:
+            regional_events[partition.region_of(_location(event))].append(
+                event)
+        processes = self._processes
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, len(partition)))
+        groups = [[(number, regional_events[number])
+                   for number in range(worker, len(partition), processes)]
+                  for worker in range(processes)]
+        if processes == 1:
+            workers = [_LocalWorker(partition, groups[0], self._dispatcher)]
+        else:
+            workers = [_ProcessWorker(partition, group, self._dispatcher)
+                       for group in groups]
+        try:
+            monitors = _synchronize(workers, len(partition), window)
+        finally:
+            for worker in workers:
+                worker.close()
+
+        monitor = Monitor(history=False)
+        for regional_monitor in monitors:
+            monitor.merge(regional_monitor)
+        return monitor.report()
+
+
+def _synchronize(workers, count, window):
+    """Advance the regions simulated by <workers> one window at a time
+    until no events are left, handing drivers over between windows, and
+    return the monitors of the regions in order.
+
+    @type workers: list[_LocalWorker | _ProcessWorker]
+    @type count: int
+        The number of regions.
+    @type window: int | float
+        The length of each window, or 0 to do the events of one time in
+        each round.
+    @rtype: list[Monitor]
+    """
+    inboxes = [[] for _ in range(count)]
+    next_times = {}
+    for worker in workers:
+        next_times.update(worker.start())
+    while True:
+        times = [time for time in next_times.values() if time is not None]
+        times.extend(message[0] for inbox in inboxes for message in inbox)
+        if len(times) == 0:
+            break
+        start = min(times)
+        until = start + window
+        if window == 0:
+            # An empty window does the events due at start.
+            until = start + 1
+        for worker in workers:
+            worker.send(until, {number: _drain(inboxes[number])
+                                for number in worker.regions})
+        outboxes = {}
+        for worker in workers:
+            handovers, times = worker.receive()
+            outboxes.update(handovers)
+            next_times.update(times)
+        # Drivers handed over at the same time are queued in order of the
+        # region they come from, then of their handover there. A driver
+        # handed over during a window joins the other region at its end,
+        # unless the window is empty: the driver is then due no earlier
+        # than start, and joins at the time of the handover, in a round of
+        # its own.
+        for number in range(count):
+            for handover in outboxes[number]:
+                timestamp = handover[0]
+                if window > 0:
+                    timestamp = max(timestamp, until)
+                inboxes[handover[1]].append((timestamp,) + handover[2:])
+    monitors = {}
+    for worker in workers:
+        monitors.update(worker.finish())
+    return [monitors[number] for number in range(count)]
+
+
+def _drain(inbox):
+    """Empty <inbox>, returning the drivers in it in the order they should
+    be queued.
+
+    @type inbox: list[(int, str, int, int, int)]
+    @rtype: list[(int, str, int, int, int)]
+    """
+    handovers = sorted(inbox, key=lambda handover: handover[0])
+    del inbox[:]
+    return handovers
+
+
+class _LocalWorker:
+    """Simulates a group of regions in this process."""
+
+    # === Private Attributes ===
+    # @type regions: list[int]
+    #     The numbers of the regions simulated.
+    # @type _regions: list[Region]
+    #     The regions simulated.
+    # @type _reply: (list, dict[int, int | None])
+    #     The handovers and next event times of the latest window.
+
+    def __init__(self, partition, group, dispatcher):
+        """Initialize a _LocalWorker.
+
+        @type self: _LocalWorker
+        @type partition: Partition
+        @type group: list[(int, list[Event])]
+            The number and initial events of each region to simulate.
+        @type dispatcher: callable
+        @rtype: None
+        """
+        self.regions = [number for number, _ in group]
+        self._regions = [Region(number, partition, events, dispatcher())
+                         for number, events in group]
+        self._reply = None
+
+    def start(self):
+        """Return the time of the next event in each region.
+
+        @type self: _LocalWorker
+        @rtype: dict[int, int | None]
+        """
+        return {region.number: region.next_time() for region in self._regions}
+
+    def send(self, until, inboxes):
+        """Hand the drivers in <inboxes> over to the regions, and advance the
+        regions to <until>.
+
+        @type self: _LocalWorker
+        @type until: int | float
+        @type inboxes: dict[int, list[(int, str, int, int, int)]]
+        @rtype: None
+        """
+        self._reply = _advance(self._regions, until, inboxes)
+
+    def receive(self):
+        """Return the drivers handed over by each region in the latest
+        window, and the time of the next event in each region.
+
+        @type self: _LocalWorker
+        @rtype: (dict[int, list], dict[int, int | None])
+        """
+        return self._reply
+
+    def finish(self):
+        """Return the monitor of each region.
+
+        @type self: _LocalWorker
+        @rtype: dict[int, Monitor]
+        """
+        return {region.number: region.monitor for region in self._regions}
+
+    def close(self):
+        """Release the resources of this worker.
+
+        @type self: _LocalWorker
+        @rtype: None
+        """
+        self._regions = []
+
+
+class _ProcessWorker(_LocalWorker):
+    """Simulates a group of regions in a child process, which it exchanges
+    messages with through a pipe.
+    """
+
+    # === Private Attributes ===
+    # @type _connection: multiprocessing.connection.Connection
+    #     This end of the pipe to the child process.
+    # @type _process: multiprocessing.Process
+    #     The child process.
+
+    def __init__(self, partition, group, dispatcher):
+        """Initialize a _ProcessWorker, starting its child process.
+
+        Overrides _LocalWorker.__init__
+
+        @type self: _ProcessWorker
+        @type partition: Partition
+        @type group: list[(int, list[Event])]
+        @type dispatcher: callable
+        @rtype: None
+        """
+        self.regions = [number for number, _ in group]
+        self._connection, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve,
+            args=(child, partition, group, dispatcher, travel.model),
+            daemon=True)
+        self._process.start()
+        child.close()
+
+    def start(self):
+        """Overrides _LocalWorker.start
+
+        @type self: _ProcessWorker
+        @rtype: dict[int, int | None]
+        """
+        return self._connection.recv()
+
+    def send(self, until, inboxes):
+        """Overrides _LocalWorker.send
+
+        @type self: _ProcessWorker
+        @type until: int | float
+        @type inboxes: dict[int, list[(int, str, int, int, int)]]
+        @rtype: None
+        """
+        self._connection.send((until, inboxes))
+
+    def receive(self):
+        """Overrides _LocalWorker.receive
+
+        @type self: _ProcessWorker
+        @rtype: (dict[int, list], dict[int, int | None])
+        """
+        return self._connection.recv()
+
+    def finish(self):
+        """Overrides _LocalWorker.finish
+
+        @type self: _ProcessWorker
+        @rtype: dict[int, Monitor]
+        """
+        self._connection.send(None)
+        return self._connection.recv()
+
+    def close(self):
+        """Overrides _LocalWorker.close
+
+        @type self: _ProcessWorker
+        @rtype: None
+        """
+        self._connection.close()
+        self._process.join()
+
+
+def _serve(connection, partition, group, dispatcher, model):
+    """Simulate the regions in <group> in a child process under the travel
+    model <model>, as told through <connection>, until told to finish.
+
+    @type connection: multiprocessing.connection.Connection
+    @type partition: Partition
+    @type group: list[(int, list[Event])]
+    @type dispatcher: callable
+    @type model: TravelModel | None
+        The travel model in use in the parent process.
+    @rtype: None
+    """
+    travel.use_model(model)
+    worker = _LocalWorker(partition, group, dispatcher)
+    connection.send(worker.start())
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        worker.send(*message)
+        connection.send(worker.receive())
+    connection.send(worker.finish())
+    connection.close()
+
+
+def _advance(regions, until, inboxes):
+    """Hand the drivers in <inboxes> over to <regions>, advance them to
+    <until>, and return the drivers each of them hands over and the time of
+    the next event in each of them.
+
+    @type regions: list[Region]
+    @type until: int | float
+    @type inboxes: dict[int, list[(int, str, int, int, int)]]
+    @rtype: (dict[int, list], dict[int, int | None])
+    """
+    handovers = {}
+    for region in regions:
+        region.receive(inboxes[region.number])
+        handovers[region.number] = region.advance(until)
+    return handovers, {region.number: region.next_time()
+                       for region in regions}
+
+
+def _location(event):
+    """Return the location that decides which region <event> is in.
+
+    @type event: DriverRequest | RiderRequest
+    @rtype: Location
+    """
+    if isinstance(event, DriverRequest):
+        return event.driver.location
+    return event.rider.origin
+
+
+def _locations(events):
+    """Yield every location that <events> mention.
+
+    @type events: list[DriverRequest | RiderRequest]
+    @rtype: iterator[Location]
+    """
+    for event in events:
+        if isinstance(event, DriverRequest):
+            yield event.driver.location
+        else:
+            yield event.rider.origin
+            yield event.rider.destination
+
+
+def _lookahead(events, partition):
+    """Return the shortest time that a ride in <events> between two regions
+    of <partition> can take, or infinity if there is no such ride.
+
+    The time is worked out from the Manhattan distance of the ride, scaled
+    down as far as the travel model in use allows.
+
+    @type events: list[DriverRequest | RiderRequest]
+    @type partition: Partition
+    @rtype: int | float
+    """
+    speeds = [event.driver.speed for event in events
+              if isinstance(event, DriverRequest)]
+    if len(speeds) == 0:
+        return float("inf")
+    fastest = max(speeds)
+    scale = travel.scale()
+    lookahead = float("inf")
+    for event in events:
+        if isinstance(event, RiderRequest):
+            rider = event.rider
+            if (partition.region_of(rider.origin) !=
+                    partition.region_of(rider.destination)):
+                lookahead = min(lookahead, int(round(manhattan_distance(
+                    rider.origin, rider.destination) * scale / fastest)))
+    return lookahead
+
+
+if __name__ == "__main__":
+    events = create_event_list("events.txt")
+    print(PartitionedSimulation().run(events))
@@ -0,0 +1,249 @@
+"""
+The profiler module contains the Profiler class, which measures where a
+simulation spends its time as it runs.
+
+A Simulation given a Profiler times the events it performs and counts the
+work they do, and adds what the profiler measured to its report under
+"profile". A Simulation without one measures nothing, and runs at full
+speed.
+"""
+import json
+from time import perf_counter_ns
+
+from histogram import Histogram
+
+
+class Profiler:
+    """A record of the work done by the events of a simulation.
+
+    For each kind of event, the profiler keeps the number performed, the
+    total and the longest time taken to perform one, and a histogram of the
+    number of candidate drivers and riders the dispatcher examined while
+    performing one. It also keeps the number of events waiting in the
+    event queue as simulated time passes, and the number of activities of
+    each kind the monitor was notified of.
+
+    === Attributes ===
+    @type interval: int
+        How much simulated time passes between samples of the number of
+        events waiting in the event queue.
+    """
+
+    # === Private Attributes ===
+    # @type _events: dict[str, list[int]]
+    #     The number of events of each kind performed, and the total and
+    #     the longest time taken to perform one in nanoseconds, keyed by
+    #     the name of the kind.
+    # @type _candidates: dict[str, Histogram]
+    #     The number of candidates examined while performing each event,
+    #     keyed by the name of its kind.
+    # @type _depths: list[(int, int)]
+    #     The number of events waiting in the event queue, each with the
+    #     time it was sampled at.
+    # @type _next_sample: int
+    #     The earliest time at which to sample the event queue next.
+    # @type _notifications: dict[(str, str), int]
+    #     The number of activities of each category and description the
+    #     monitor was notified of.
+
+    def __init__(self, interval=1):
+        """Initialize a Profiler that has measured nothing.
+
+        @type self: Profiler
+        @type interval: int
+            How much simulated time passes between samples of the number of
+            events waiting in the event queue.
+            Precondition: interval >= 1
+        @rtype: None
+        """
+        self.interval = interval
+        self._events = {}
+        self._candidates = {}
+        self._depths = []
+        self._next_sample = 0
+        self._notifications = {}
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: Profiler
+        @rtype: str
+
+        >>> print(Profiler())
+        Profiler (0 events)
+        """
+        return "Profiler ({} events)".format(
+            sum(measures[0] for measures in self._events.values()))
+
+    def watch(self, monitor):
+        """Return a monitor that counts the activities it is notified of in
+        this profiler, and passes them on to <monitor>.
+
+        @type self: Profiler
+        @type monitor: Monitor
+        @rtype: _CountingMonitor
+        """
+        return _CountingMonitor(monitor, self._notifications)
+
+    def perform(self, event, dispatcher, monitor, depth):
+        """Perform <event>, measuring the work it does, and return the
+        events it spawns.
+
+        @type self: Profiler
+        @type event: Event
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @type depth: int
+            The number of events waiting in the event queue.
+        @rtype: list[Event]
+
+        >>> from dispatcher import Dispatcher
+        >>> from driver import Driver
+        >>> from event import DriverRequest
+        >>> from location import Location
+        >>> from monitor import Monitor
+        >>> profiler = Profiler()
+        >>> monitor = profiler.watch(Monitor())
+        >>> profiler.perform(DriverRequest(0, Driver("Bob", Location(1, 1), \
+        1)), Dispatcher(), monitor, 0)
+        []
+        >>> results = profiler.results()
+        >>> results["events"]["DriverRequest"]["count"]
+        1
+        >>> results["notifications"], results["queue_depth"]
+        ({'driver request': 1}, [[0, 0]])
+        """
+        timestamp = event.timestamp
+        if timestamp >= self._next_sample:
+            self._depths.append((timestamp, depth))
+            self._next_sample = (timestamp - timestamp % self.interval +
+                                 self.interval)
+        scanned = dispatcher.candidates_scanned()
+        start = perf_counter_ns()
+        spawned = event.do(dispatcher, monitor)
+        elapsed = perf_counter_ns() - start
+        scanned = dispatcher.candidates_scanned() - scanned
+
+        name = type(event).__name__
+        measures = self._events.get(name)
+        if measures is None:
+            measures = self._events[name] = [0, 0, 0]
+            self._candidates[name] = Histogram()
+        measures[0] += 1
+        measures[1] += elapsed
+        if elapsed > measures[2]:
+            measures[2] = elapsed
+        self._candidates[name].add(scanned)
+        return spawned
+
+    def results(self):
+        """Return what this profiler has measured, in a form that can be
+        written as JSON.
+
+        @type self: Profiler
+        @rtype: dict[str, object]
+
+        >>> sorted(Profiler().results())
+        ['candidates', 'events', 'notifications', 'queue_depth']
+        """
+        events = {}
+        candidates = {}
+        for name, (count, total, longest) in self._events.items():
+            events[name] = {"count": count,
+                            "seconds": total / 1e9,
+                            "mean_seconds": total / count / 1e9,
+                            "max_seconds": longest / 1e9}
+            histogram = self._candidates[name]
+            candidates[name] = {"total": histogram.total,
+                                "mean": histogram.mean(),
+                                "percentiles": histogram.percentiles()}
+        notifications = {"{} {}".format(category, description): count
+                         for (category, description), count
+                         in self._notifications.items()}
+        return {"events": events,
+                "candidates": candidates,
+                "queue_depth": [list(sample) for sample in self._depths],
+                "notifications": notifications}
+
+    def dump(self, filename):
+        """Write what this profiler has measured to the file <filename> as
+        JSON.
+
+        @type self: Profiler
+        @type filename: str
+        @rtype: None
+        """
+        with open(filename, "w") as file:
+            json.dump(self.results(), file, indent=2)
+            file.write("\n")
+
+
+class _CountingMonitor:
+    """A wrapper around a monitor that counts the activities it is notified
+    of, and passes them on to the monitor.
+
+    It is not a Monitor itself, but offers the methods of one that events
+    and simulations call: notify, notify_many and report.
+    """
+
+    # === Private Attributes ===
+    # @type _monitor: Monitor
+    #     The monitor the activities are passed on to.
+    # @type _counts: dict[(str, str), int]
+    #     The number of activities of each category and description
+    #     notified so far.
+
+    def __init__(self, monitor, counts):
+        """Initialize a _CountingMonitor.
+
+        @type self: _CountingMonitor
+        @type monitor: Monitor
+        @type counts: dict[(str, str), int]
+        @rtype: None
+        """
+        self._monitor = monitor
+        self._counts = counts
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Count the activity, then pass it to the wrapped monitor's
+        notify.
+
+        @type self: _CountingMonitor
+        @type timestamp: int
+        @type category: str
+        @type description: str
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+        key = (category, description)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._monitor.notify(timestamp, category, description, identifier,
+                             location)
+
+    def notify_many(self, activities):
+        """Count the activities, then pass them to the wrapped monitor's
+        notify_many.
+
+        @type self: _CountingMonitor
+        @type activities: iterable[(int, str, str, str, Location)]
+        @rtype: None
+        """
+        activities = list(activities)
+        for activity in activities:
+            key = (activity[1], activity[2])
+            self._counts[key] = self._counts.get(key, 0) + 1
+        self._monitor.notify_many(activities)
+
+    def report(self):
+        """Return the wrapped monitor's report.
+
+        @type self: _CountingMonitor
+        @rtype: dict[str, object]
+        """
+        return self._monitor.report()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
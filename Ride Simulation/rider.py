@@ -33,6 +33,11 @@ class Rider:
     #     "satisfied" (has been picked up)
     # @type patience_attribute: int
     #     The number of minutes a rider is willing to wait for a driver.
+    # @type cancellation: Event | None
+    #     The scheduled cancellation of this rider's request, if any.
+
+    __slots__ = ("id", "origin", "destination", "status", "patience",
+                 "cancellation")
 
     def __init__(self, unique_identifier, origin, destination, status,
                  patience_attribute):
@@ -51,6 +56,7 @@ class Rider:
         self.destination = destination
         self.status = status
         self.patience = patience_attribute
+        self.cancellation = None
 
     def __str__(self):
         """Return a user-friendly representation of the Rider self
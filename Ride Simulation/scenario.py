@@ -0,0 +1,429 @@
+"""
+The scenario module reads and writes scenarios in a compact binary format,
+as an alternative to the text events files read by create_event_list.
+
+A binary scenario is laid out in columns: one packed array per field of
+the events, followed by a table of the rider and driver ids. Loading one
+maps the file into memory and builds each Event only when it is needed, so
+repeated runs of the same scenario skip parsing altogether.
+
+Run this module to convert a text events file:
+
+    python scenario.py events.txt events.bin
+
+This module requires NumPy.
+"""
+import io
+import mmap
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+from driver import Driver
+from event import DriverRequest, RiderRequest, read_events
+from location import intern_location
+from rider import Rider, WAITING
+
+MAGIC = b"RIDESIM\x00"
+VERSION = 1
+
+# The kind of each event, as stored in the kinds column.
+DRIVER_REQUEST = 0
+RIDER_REQUEST = 1
+
+# The header holds the magic number, the format version, a reserved field
+# that is written as zero and ignored on reading, which keeps the counts
+# after it aligned to 8 bytes, the number of events and the number of ids
+# in the string table.
+_HEADER = struct.Struct("<8sIIQQ")
+
+# The columns in the order they are stored, with their array typecodes.
+# Columns that do not apply to an event (such as the speed of a rider) hold
+# zero.
+_COLUMNS = [
+    ("timestamps", "q"),
+    ("kinds", "b"),
+    ("ids", "i"),
+    ("origin_rows", "i"),
+    ("origin_columns", "i"),
+    ("destination_rows", "i"),
+    ("destination_columns", "i"),
+    ("speeds", "i"),
+    ("patiences", "i"),
+]
+
+# The NumPy dtype of each column, in little-endian byte order.
+_DTYPES = {"q": "<i8", "b": "<i1", "i": "<i4"}
+
+# The number of events Scenario.events converts from the columns at a time.
+_CHUNK_SIZE = 4096
+
+
+def write_scenario(events, filename):
+    """Write <events> to <filename> in the binary scenario format.
+
+    @type events: iterable[DriverRequest | RiderRequest]
+    @type filename: str
+    @rtype: int
+        The number of events written.
+    """
+    with open(filename, "wb") as file:
+        return _write(events, file)
+
+
+def pack_scenario(events):
+    """Return <events> in the binary scenario format, for a Scenario to be
+    read from in memory.
+
+    @type events: iterable[DriverRequest | RiderRequest]
+    @rtype: bytes
+
+    >>> from location import Location
+    >>> scenario = Scenario(pack_scenario([DriverRequest(2, Driver("Bob", \
+    Location(1, 2), 3))]))
+    >>> [str(event) for event in scenario.events()]
+    ['2 -- Bob: Request a rider']
+    """
+    file = io.BytesIO()
+    _write(events, file)
+    return file.getvalue()
+
+
+def _write(events, file):
+    """Write <events> to <file> in the binary scenario format.
+
+    @type events: iterable[DriverRequest | RiderRequest]
+    @type file: io.BufferedIOBase
+    @rtype: int
+        The number of events written.
+    """
+    columns = {name: array(code) for name, code in _COLUMNS}
+    ids = {}
+    for event in events:
+        if isinstance(event, DriverRequest):
+            person = event.driver
+            values = (event.timestamp, DRIVER_REQUEST,
+                      ids.setdefault(person.id, len(ids)),
+                      person.location.row, person.location.column,
+                      0, 0, person.speed, 0)
+        else:
+            person = event.rider
+            values = (event.timestamp, RIDER_REQUEST,
+                      ids.setdefault(person.id, len(ids)),
+                      person.origin.row, person.origin.column,
+                      person.destination.row, person.destination.column,
+                      0, person.patience)
+        for (name, _), value in zip(_COLUMNS, values):
+            columns[name].append(value)
+
+    names = [identifier.encode("utf-8") for identifier in ids]
+    offsets = array("q", [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    count = len(columns["timestamps"])
+    file.write(_HEADER.pack(MAGIC, VERSION, 0, count, len(names)))
+    for name, _ in _COLUMNS:
+        _write_column(file, columns[name])
+    _write_column(file, offsets)
+    file.write(b"".join(names))
+    return count
+
+
+def convert(text_filename, binary_filename):
+    """Convert the text events file <text_filename> to the binary scenario
+    format, writing it to <binary_filename>.
+
+    @type text_filename: str
+    @type binary_filename: str
+    @rtype: int
+        The number of events converted.
+    """
+    return write_scenario(read_events(text_filename), binary_filename)
+
+
+class Scenario:
+    """A binary scenario, read in place from a buffer such as a
+    memory-mapped file.
+
+    Each column is exposed as a read-only NumPy array that views the
+    buffer without copying it.
+
+    === Attributes ===
+    @type timestamps: numpy.ndarray
+        The timestamp of each event.
+    @type kinds: numpy.ndarray
+        The kind of each event, DRIVER_REQUEST or RIDER_REQUEST.
+    @type ids: numpy.ndarray
+        The index in the string table of the id of each event's driver or
+        rider.
+    @type origin_rows: numpy.ndarray
+        The row of each driver's location or rider's origin.
+    @type origin_columns: numpy.ndarray
+        The column of each driver's location or rider's origin.
+    @type destination_rows: numpy.ndarray
+        The row of each rider's destination.
+    @type destination_columns: numpy.ndarray
+        The column of each rider's destination.
+    @type speeds: numpy.ndarray
+        The speed of each driver.
+    @type patiences: numpy.ndarray
+        The patience of each rider.
+    """
+
+    # === Private Attributes ===
+    # @type _buffer: buffer
+    #     The buffer the scenario is read from.
+    # @type _offsets: numpy.ndarray
+    #     The offset of each id in _names, followed by the length of _names.
+    # @type _names: memoryview
+    #     The UTF-8 encoded ids, one after another.
+
+    def __init__(self, buffer):
+        """Initialize a Scenario from <buffer>.
+
+        @type self: Scenario
+        @type buffer: buffer
+            A buffer holding a scenario in the binary scenario format.
+        @rtype: None
+        """
+        magic, version, _, count, name_count = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("not a binary scenario")
+        if version != VERSION:
+            raise ValueError("unsupported scenario version {}".format(version))
+        self._buffer = buffer
+        offset = _HEADER.size
+        for name, code in _COLUMNS:
+            column = np.frombuffer(buffer, dtype=_DTYPES[code], count=count,
+                                   offset=offset)
+            setattr(self, name, column)
+            offset = _aligned(offset + column.nbytes)
+        self._offsets = np.frombuffer(buffer, dtype="<i8",
+                                      count=name_count + 1, offset=offset)
+        offset += self._offsets.nbytes
+        self._names = memoryview(buffer)[offset:offset + self._offsets[-1]]
+
+    def __len__(self):
+        """Return the number of events in this Scenario.
+
+        @type self: Scenario
+        @rtype: int
+        """
+        return len(self.timestamps)
+
+    def name(self, index):
+        """Return the id at <index> in the string table.
+
+        @type self: Scenario
+        @type index: int
+        @rtype: str
+        """
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return str(self._names[start:end], "utf-8")
+
+    def events(self, start=0, stop=None):
+        """Yield the Events of this Scenario from index <start> up to, but
+        not including, <stop>, creating each one as it is needed.
+
+        @type self: Scenario
+        @type start: int
+        @type stop: int | None
+            Defaults to the number of events.
+        @rtype: iterator[Event]
+        """
+        if stop is None:
+            stop = len(self)
+        for chunk in range(start, stop, _CHUNK_SIZE):
+            yield from build_events(
+                {name: getattr(self, name)[chunk:min(chunk + _CHUNK_SIZE,
+                                                     stop)]
+                 for name, _ in _COLUMNS}, self.name)
+
+
+class ScenarioWriter:
+    """A writer of a binary scenario whose events arrive in batches of
+    columns, such as those of a generated workload.
+
+    The number of events and ids must be known up front, so each batch can
+    be written straight to its place in the file.
+    """
+
+    # === Private Attributes ===
+    # @type _file: io.BufferedRandom
+    #     The file being written.
+    # @type _starts: dict[str, int]
+    #     The position in the file of each column.
+    # @type _names_start: int
+    #     The position in the file of the first id.
+    # @type _events: int
+    #     The number of events written so far.
+    # @type _ids: int
+    #     The number of ids written so far.
+    # @type _names_length: int
+    #     The number of bytes of ids written so far.
+
+    def __init__(self, filename, count, id_count):
+        """Initialize a ScenarioWriter that writes <count> events with
+        <id_count> distinct ids to <filename>.
+
+        @type self: ScenarioWriter
+        @type filename: str
+        @type count: int
+        @type id_count: int
+        @rtype: None
+        """
+        self._file = open(filename, "wb+")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0, count, id_count))
+        self._starts = {}
+        position = _HEADER.size
+        for name, code in _COLUMNS:
+            self._starts[name] = position
+            position = _aligned(position +
+                                count * np.dtype(_DTYPES[code]).itemsize)
+        self._starts["offsets"] = position
+        self._names_start = position + (id_count + 1) * 8
+        self._events = 0
+        self._ids = 0
+        self._names_length = 0
+        self._file.truncate(self._names_start)
+
+    def __enter__(self):
+        """Return this ScenarioWriter.
+
+        @type self: ScenarioWriter
+        @rtype: ScenarioWriter
+        """
+        return self
+
+    def __exit__(self, *error):
+        """Close this ScenarioWriter.
+
+        @type self: ScenarioWriter
+        @rtype: None
+        """
+        self.close()
+
+    def write(self, columns, names):
+        """Write a batch of events, and the ids they introduce.
+
+        @type self: ScenarioWriter
+        @type columns: dict[str, numpy.ndarray]
+            The values of each column for the batch, with ids given as
+            indices into all the ids written so far and <names>.
+        @type names: list[str]
+            The ids first used in this batch, in order.
+        @rtype: None
+        """
+        count = len(columns["timestamps"])
+        for name, code in _COLUMNS:
+            dtype = np.dtype(_DTYPES[code])
+            self._file.seek(self._starts[name] + self._events * dtype.itemsize)
+            self._file.write(np.asarray(columns[name], dtype=dtype).tobytes())
+        self._events += count
+
+        names = list(names)
+        blob = "".join(names).encode("utf-8")
+        lengths = np.fromiter(map(len, names), dtype="<i8", count=len(names))
+        if len(blob) != lengths.sum():
+            # Some ids are not ASCII, so their lengths in bytes differ.
+            lengths = np.fromiter(
+                (len(name.encode("utf-8")) for name in names), dtype="<i8",
+                count=len(names))
+        offsets = self._names_length + np.cumsum(lengths, dtype="<i8")
+        if self._ids == 0:
+            offsets = np.concatenate((np.zeros(1, dtype="<i8"), offsets))
+            self._file.seek(self._starts["offsets"])
+        else:
+            self._file.seek(self._starts["offsets"] + (self._ids + 1) * 8)
+        self._file.write(offsets.astype("<i8").tobytes())
+        self._file.seek(self._names_start + self._names_length)
+        self._file.write(blob)
+        self._ids += len(names)
+        self._names_length += len(blob)
+
+    def close(self):
+        """Finish writing the scenario.
+
+        @type self: ScenarioWriter
+        @rtype: None
+        """
+        if self._ids == 0:
+            self._file.seek(self._starts["offsets"])
+            self._file.write(bytes(8))
+        self._file.close()
+
+
+def build_events(columns, id_of):
+    """Yield an Event for each row of <columns>.
+
+    @type columns: dict[str, numpy.ndarray]
+        The values of each column, as a Scenario holds them.
+    @type id_of: callable
+        Returns the id for each value in the ids column.
+    @rtype: iterator[Event]
+    """
+    # Convert each column to Python ints all at once, which is much faster
+    # than indexing the arrays one event at a time.
+    for (timestamp, kind, identifier, origin_row, origin_column,
+         destination_row, destination_column, speed,
+         patience) in zip(*(columns[column].tolist()
+                            for column, _ in _COLUMNS)):
+        origin = intern_location(origin_row, origin_column)
+        if kind == DRIVER_REQUEST:
+            yield DriverRequest(timestamp, Driver(
+                id_of(identifier), origin, speed))
+        else:
+            yield RiderRequest(timestamp, Rider(
+                id_of(identifier), origin,
+                intern_location(destination_row, destination_column),
+                WAITING, patience))
+
+
+def open_scenario(filename):
+    """Return the binary scenario in <filename>, memory-mapped read-only.
+
+    @type filename: str
+    @rtype: Scenario
+    """
+    with open(filename, "rb") as file:
+        return Scenario(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def read_scenario(filename):
+    """Yield the Events of the binary scenario in <filename>, in order.
+
+    @type filename: str
+    @rtype: iterator[Event]
+    """
+    return open_scenario(filename).events()
+
+
+def _aligned(offset):
+    """Return <offset> rounded up to a multiple of 8 bytes.
+
+    @type offset: int
+    @rtype: int
+    """
+    return (offset + 7) // 8 * 8
+
+
+def _write_column(file, column):
+    """Write <column> to <file> in little-endian byte order, padded to a
+    multiple of 8 bytes.
+
+    @type file: io.BufferedIOBase
+    @type column: array
+    @rtype: None
+    """
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    data = column.tobytes()
+    file.write(data)
+    file.write(b"\x00" * (_aligned(len(data)) - len(data)))
+
+
+if __name__ == "__main__":
+    print("{} events converted".format(convert(sys.argv[1], sys.argv[2])))
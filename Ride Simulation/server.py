@@ -0,0 +1,420 @@
+"""
+The server module runs a dispatcher as a live service: riders and drivers
+send their requests over a socket as they happen, and are told who they
+have been assigned as soon as the dispatcher decides.
+
+The service keeps a simulated clock paced by the wall clock, at <speed>
+units of simulated time per second. Each request is stamped with the time
+on the clock when it is taken in, and the events it leads to, such as
+pickups, dropoffs and cancellations, happen when the clock reaches them.
+
+Requests are sent one per line, in the format of a line of an events file;
+the timestamp at the start of the line is ignored. Each is answered with
+one of these lines, where <tick> is the simulated time of the decision:
+
+    ASSIGN <tick> <rider> <driver>  the rider and driver are assigned to
+                                    each other; sent to both
+    WAIT <tick> rider <id>          the rider is waiting for a driver
+    WAIT <tick> driver <id>         the driver is waiting for a rider
+    CANCEL <tick> rider <id>        the rider gave up waiting
+    ERROR <message>                 the request could not be read
+
+A rider and driver who were assigned to each other are both sent
+DROPOFF <tick> <rider> <driver> once the ride is over. The server forgets
+a rider's connection once it has sent the rider DROPOFF or CANCEL, and
+every rider and driver on a connection once it closes.
+
+A line holding just STATS is answered with the server's metrics, as JSON.
+
+Requests that arrive while the dispatcher is busy are taken in together,
+up to a limit, and decided in one pass. Once a limit on the requests
+waiting to be taken in is reached, the server stops reading from its
+connections until there is room, so that a client sending faster than the
+dispatcher can keep up is slowed down rather than piling up requests.
+
+Run this module to start a server, stopping it with Ctrl-C to print its
+report and metrics:
+
+    python server.py --port 8765 --speed 60
+"""
+import argparse
+import asyncio
+import json
+import time
+from operator import attrgetter
+
+from batch_dispatcher import BatchDispatcher
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from event import (Cancellation, DriverRequest, Dropoff, Pickup,
+                   RiderRequest,
+                   parse_event)
+from histogram import Histogram
+from monitor import Monitor, RIDER, DRIVER
+from rider import WAITING
+
+
+class DispatchServer:
+    """A dispatcher serving requests over a socket, in real time.
+
+    === Attributes ===
+    @type speed: float
+        The units of simulated time that pass each second.
+    @type max_pending: int
+        The number of requests that may wait to be taken in before the
+        server stops reading from its connections.
+    @type max_batch: int
+        The largest number of requests decided in one pass.
+    """
+
+    # === Private Attributes ===
+    # @type _dispatcher: Dispatcher
+    #     The dispatcher that decides on the requests.
+    # @type _monitor: Monitor
+    #     The monitor that records the activities of the service.
+    # @type _events: PriorityQueue[Event]
+    #     The events that are yet to happen, by timestamp.
+    # @type _pending: asyncio.Queue | None
+    #     The requests waiting to be taken in, each with the connection it
+    #     came on and the time it was read; None until the server starts.
+    # @type _connections: dict[(str, str), asyncio.StreamWriter]
+    #     The connection each rider and driver made its request on, keyed by
+    #     its category and id, until the rider's ride is over or cancelled,
+    #     or the connection closes.
+    # @type _received: dict[(str, str), float]
+    #     The time each request that has not been decided on was read,
+    #     keyed by the category and id of its rider or driver.
+    # @type _latencies: Histogram
+    #     The microseconds between reading each request and answering it.
+    # @type _batch_sizes: Histogram
+    #     The number of requests decided in each pass.
+    # @type _start: float
+    #     The time on the event loop's clock when the simulated clock was
+    #     at 0.
+    # @type _server: asyncio.AbstractServer | None
+    #     The server accepting connections, once started.
+    # @type _task: asyncio.Task | None
+    #     The task deciding on requests, once started.
+
+    def __init__(self, dispatcher=None, monitor=None, speed=1.0,
+                 max_pending=1024, max_batch=256):
+        """Initialize a DispatchServer.
+
+        @type self: DispatchServer
+        @type dispatcher: Dispatcher | None
+            Defaults to a Dispatcher.
+        @type monitor: Monitor | None
+            Defaults to a Monitor that keeps no record of activities.
+        @type speed: float
+            The units of simulated time that pass each second.
+        @type max_pending: int
+        @type max_batch: int
+        @rtype: None
+        """
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        if monitor is None:
+            monitor = Monitor(history=False)
+        self.speed = speed
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self._dispatcher = dispatcher
+        self._monitor = monitor
+        self._events = PriorityQueue(key=attrgetter("timestamp"))
+        self._pending = None
+        self._connections = {}
+        self._received = {}
+        self._latencies = Histogram()
+        self._batch_sizes = Histogram()
+        self._start = 0.0
+        self._server = None
+        self._task = None
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """Start the simulated clock and accept connections, and return the
+        address the server listens on.
+
+        @type self: DispatchServer
+        @type host: str
+        @type port: int
+            The port to listen on, or 0 for any free port.
+        @type path: str | None
+            The path of a Unix socket to listen on instead of <host> and
+            <port>.
+        @rtype: (str, int) | str
+        """
+        self._pending = asyncio.Queue(self.max_pending)
+        self._start = asyncio.get_running_loop().time()
+        if path is None:
+            self._server = await asyncio.start_server(self._serve, host, port)
+        else:
+            self._server = await asyncio.start_unix_server(self._serve, path)
+        self._task = asyncio.create_task(self._dispatch())
+        return self._server.sockets[0].getsockname()
+
+    async def stop(self):
+        """Stop accepting connections and deciding on requests, and return
+        the report of the monitor with the server's metrics added under
+        "server".
+
+        @type self: DispatchServer
+        @rtype: dict[str, object]
+        """
+        self._server.close()
+        await self._server.wait_closed()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        report = self._monitor.report()
+        report["server"] = self.metrics()
+        return report
+
+    def metrics(self):
+        """Return the server's metrics: how many requests it has decided on
+        and in how many passes, the percentiles of the microseconds each
+        took to decide on, the current state of its queues, and how many
+        riders and drivers it knows the connection of.
+
+        @type self: DispatchServer
+        @rtype: dict[str, object]
+
+        >>> metrics = DispatchServer().metrics()
+        >>> metrics["requests"], metrics["decision_latency_us"][99]
+        (0, 0)
+        """
+        return {"requests": self._latencies.count,
+                "batches": self._batch_sizes.count,
+                "mean_batch": self._batch_sizes.mean(),
+                "max_batch": self._batch_sizes.percentile(100),
+                "decision_latency_us": self._latencies.percentiles(
+                    (50, 90, 99, 99.9)),
+                "pending": 0 if self._pending is None
+                else self._pending.qsize(),
+                "connections": len(self._connections),
+                "clock": self._tick()}
+
+    async def _serve(self, reader, writer):
+        """Read the requests sent on a connection, and queue them to be
+        taken in.
+
+        @type self: DispatchServer
+        @type reader: asyncio.StreamReader
+        @type writer: asyncio.StreamWriter
+        @rtype: None
+        """
+        try:
+            async for line in reader:
+                received = time.perf_counter()
+                text = line.decode("utf-8", "replace").strip()
+                if text == "STATS":
+                    writer.write(json.dumps(self.metrics()).encode("utf-8") +
+                                 b"\n")
+                    await writer.drain()
+                    continue
+                try:
+                    event = parse_event(text)
+                except (ValueError, IndexError):
+                    event = None
+                if event is None:
+                    if text and not text.startswith("#"):
+                        writer.write("ERROR cannot read {!r}\n".format(
+                            text).encode("utf-8"))
+                    continue
+                # Waits while the queue is full, which stops this connection
+                # being read from.
+                await self._pending.put((event, writer, received))
+        except ConnectionError:
+            pass
+        finally:
+            for key in [key for key, connection in self._connections.items()
+                        if connection is writer]:
+                del self._connections[key]
+            writer.close()
+
+    async def _dispatch(self):
+        """Take in the requests as they arrive, and do the events they lead
+        to as the simulated clock reaches them.
+
+        @type self: DispatchServer
+        @rtype: None
+        """
+        pending = self._pending
+        while True:
+            try:
+                request = await asyncio.wait_for(pending.get(),
+                                                 self._time_to_next_event())
+            except asyncio.TimeoutError:
+                request = None
+            requests = [] if request is None else [request]
+            while len(requests) < self.max_batch and not pending.empty():
+                requests.append(pending.get_nowait())
+
+            tick = self._tick()
+            written = set()
+            # Requests go ahead of the events due at the same time, as
+            # initial events do in a Simulation.
+            self._advance(tick, written)
+            for event, writer, received in requests:
+                event.timestamp = tick
+                if isinstance(event, RiderRequest):
+                    key = (RIDER, event.rider.id)
+                else:
+                    key = (DRIVER, event.driver.id)
+                self._connections[key] = writer
+                self._received[key] = received
+                self._perform(event, written)
+            self._advance(tick + 1, written)
+            if requests:
+                self._batch_sizes.add(len(requests))
+            await asyncio.gather(*(writer.drain() for writer in written
+                                   if not writer.is_closing()),
+                                 return_exceptions=True)
+
+    def _advance(self, until, written):
+        """Do the events due before the simulated time <until>.
+
+        @type self: DispatchServer
+        @type until: int
+        @type written: set[asyncio.StreamWriter]
+            The connections answers have been written to.
+        @rtype: None
+        """
+        while (not self._events.is_empty() and
+               self._events.peek().timestamp < until):
+            self._perform(self._events.remove(), written)
+
+    def _perform(self, event, written):
+        """Do <event>, queue the events it spawns, and send the answers it
+        leads to.
+
+        @type self: DispatchServer
+        @type event: Event
+        @type written: set[asyncio.StreamWriter]
+            The connections answers have been written to.
+        @rtype: None
+        """
+        if isinstance(event, RiderRequest):
+            key = (RIDER, event.rider.id)
+        elif isinstance(event, DriverRequest):
+            key = (DRIVER, event.driver.id)
+        else:
+            key = None
+        cancelling = (isinstance(event, Cancellation) and
+                      event.rider.status == WAITING)
+        assigned = False
+        for spawned in event.do(self._dispatcher, self._monitor):
+            spawned.handle = self._events.add(spawned)
+            if isinstance(spawned, Pickup):
+                assigned = True
+                self._answer([(RIDER, spawned.rider.id),
+                              (DRIVER, spawned.driver.id)], written, True,
+                             "ASSIGN", event.timestamp, spawned.rider.id,
+                             spawned.driver.id)
+        if cancelling:
+            self._answer([(RIDER, event.rider.id)], written, True, "CANCEL",
+                         event.timestamp, RIDER, event.rider.id)
+            self._connections.pop((RIDER, event.rider.id), None)
+        elif isinstance(event, Dropoff):
+            self._answer([(RIDER, event.rider.id),
+                          (DRIVER, event.driver.id)], written, False,
+                         "DROPOFF", event.timestamp, event.rider.id,
+                         event.driver.id)
+            self._connections.pop((RIDER, event.rider.id), None)
+        elif not assigned and key in self._received:
+            self._answer([key], written, True, "WAIT", event.timestamp, *key)
+
+    def _answer(self, keys, written, decision, *fields):
+        """Write an answer made of <fields> to the connections of the riders
+        and drivers in <keys>, once to each connection, counting it as the
+        decision on the request of each that has not had one if it is a
+        <decision>.
+
+        @type self: DispatchServer
+        @type keys: list[(str, str)]
+            The category and id of each rider or driver to answer.
+        @type written: set[asyncio.StreamWriter]
+            The connections answers have been written to.
+        @type decision: bool
+        @type fields: tuple[object]
+        @rtype: None
+        """
+        line = " ".join(map(str, fields)).encode("utf-8") + b"\n"
+        writers = []
+        for key in keys:
+            writer = self._connections.get(key)
+            if (writer is not None and writer not in writers and
+                    not writer.is_closing()):
+                writer.write(line)
+                writers.append(writer)
+            if not decision:
+                continue
+            received = self._received.pop(key, None)
+            if received is not None:
+                self._latencies.add(
+                    int((time.perf_counter() - received) * 1000000))
+        written.update(writers)
+
+    def _tick(self):
+        """Return the time on the simulated clock.
+
+        @type self: DispatchServer
+        @rtype: int
+        """
+        if self._pending is None:
+            return 0
+        return int((asyncio.get_running_loop().time() - self._start) *
+                   self.speed)
+
+    def _time_to_next_event(self):
+        """Return the seconds until the next event is due, or None if there
+        is no event to wait for.
+
+        @type self: DispatchServer
+        @rtype: float | None
+        """
+        if self._events.is_empty():
+            return None
+        due = self._start + self._events.peek().timestamp / self.speed
+        return max(0.0, due - asyncio.get_running_loop().time())
+
+
+async def _main(arguments):
+    """Run a server as <arguments> say until it is interrupted, then print
+    its report.
+
+    @type arguments: argparse.Namespace
+    @rtype: None
+    """
+    dispatcher = None
+    if arguments.window is not None:
+        dispatcher = BatchDispatcher(arguments.window)
+    server = DispatchServer(dispatcher, speed=arguments.speed,
+                            max_pending=arguments.max_pending,
+                            max_batch=arguments.max_batch)
+    address = await server.start(arguments.host, arguments.port,
+                                 arguments.path)
+    print("listening on {}".format(address), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(json.dumps(await server.stop(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve ride requests with a dispatcher in real time.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", help="listen on this Unix socket instead")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="units of simulated time per second")
+    parser.add_argument("--window", type=int,
+                        help="match requests in batches over this window")
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--max-batch", type=int, default=256)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,7 +1,12 @@
+from itertools import islice
+from operator import attrgetter
+
+from checkpoint import read_checkpoint
 from container import PriorityQueue
 from dispatcher import Dispatcher
 from event import create_event_list
 from monitor import Monitor
+from whatif import run_branches
 
 
 class Simulation:
@@ -10,34 +15,93 @@ class Simulation:
     This is the class which is responsible for setting up and running a
     simulation.
 
-    The API is given to you: your main task is to implement the run
-    method below according to its docstring.
+    A simulation is set up with the container its events are queued in,
+    the dispatcher that assigns riders and drivers, and the monitor that
+    records their activities, and optionally with a profiler and the
+    checkpoints to write as it runs. Each has a default, so Simulation()
+    on its own runs the simulation of the assignment handout.
 
-    Of course, you may add whatever private attributes and methods you want.
-    But because you should not change the interface, you may not add any public
-    attributes or methods.
+    It can then be:
+    - run from the start of a list or stream of events to the end, with
+      run, which is the entry point into the program;
+    - resumed from a checkpoint and run to the end, with resume;
+    - run up to a time and carried on from there under a number of
+      what-ifs, each in a process of its own, with fork;
+    - carried on to the end after a fork, with continue_with.
 
-    This is the entry point into your program, and in particular is used for
-    auto-testing purposes. This makes it ESSENTIAL that you do not change the
-    interface in any way!
+    run, resume and continue_with return the dictionary of statistics
+    described in run, and fork returns one for each what-if.
     """
 
     # === Private Attributes ===
-    # @type _events: PriorityQueue[Event]
+    # @type _events: Container[Event]
     #     A sequence of events arranged in priority determined by the event
     #     sorting order.
     # @type _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
+    # @type _monitor: Monitor
+    #     The monitor that records the activities of the simulation.
+    # @type _profiler: Profiler | None
+    #     The profiler that measures the work done by the simulation, if any.
+    # @type _checkpoints: Checkpoints | None
+    #     The checkpoints the simulation writes as it runs, if any.
+    # @type _incoming: iterator[Event]
+    #     The initial events not yet taken, in timestamp order.
+    # @type _upcoming: Event | None
+    #     The next initial event, which has been read from _incoming but not
+    #     yet taken, or None if there are no initial events left.
+    # @type _taken: int
+    #     The number of initial events taken so far.
+    # @type _due: int
+    #     The time the next checkpoint is due, if checkpoints are written.
+    # @type _watched: Monitor
+    #     The monitor events notify: _monitor, or the profiler watching it.
 
-    def __init__(self):
+    def __init__(self, events=None, dispatcher=None, monitor=None,
+                 profiler=None, checkpoints=None):
         """Initialize a Simulation.
 
         @type self: Simulation
+        @type events: Container | None
+            An empty container to queue events in, keyed on the event
+            timestamp. A CalendarQueue suits simulations with many pending
+            events. Defaults to a PriorityQueue.
+        @type dispatcher: Dispatcher | None
+            The dispatcher to assign riders and drivers with, such as a
+            BatchDispatcher. Defaults to a Dispatcher, which greedily
+            assigns the nearest idle driver.
+        @type monitor: Monitor | None
+            The monitor to record activities with, such as a
+            ColumnarMonitor. Defaults to a Monitor.
+        @type profiler: Profiler | None
+            A profiler to measure the time taken by each kind of event, the
+            depth of the event queue, the candidates the dispatcher examines
+            and the activities the monitor is notified of with. Its results
+            are added to the report under "profile". Defaults to measuring
+            nothing.
+        @type checkpoints: Checkpoints | None
+            Where and how often to write checkpoints the simulation can be
+            resumed from. Defaults to writing none.
         @rtype: None
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        if events is None:
+            events = PriorityQueue(key=attrgetter("timestamp"))
+        self._events = events
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        self._dispatcher = dispatcher
+        if monitor is None:
+            monitor = Monitor()
+        self._monitor = monitor
+        self._profiler = profiler
+        self._checkpoints = checkpoints
+        self._incoming = iter([])
+        self._upcoming = None
+        self._taken = 0
+        self._due = 0
+        self._watched = monitor
+        if profiler is not None:
+            self._watched = profiler.watch(monitor)
 
     def run(self, initial_events):
         """Run the simulation on the list of events in <initial_events>.
@@ -45,27 +109,225 @@ class Simulation:
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
+        If <initial_events> is not a list, it is consumed lazily: each
+        initial event is only taken from it once the simulation reaches its
+        timestamp, so an event stream such as event.read_events runs in
+        memory bounded by the number of events in flight.
+
         @type self: Simulation
-        @type initial_events: list[Event]
-            An initial list of events.
+        @type initial_events: list[Event] | iterable[Event]
+            An initial list of events. An iterable that is not a list must
+            yield events in timestamp order.
         @rtype: dict[str, object]
         """
-        for event in initial_events:
-            self._events.add(event)
-        while not self._events.is_empty():
-            event_to_perform = self._events.remove()
-            additional_events = event_to_perform.do(self._dispatcher,
-                                                    self._monitor)
-            for event in additional_events:
-                self._events.add(event)
+        self._begin(initial_events)
+        self._advance(None)
+        return self._report()
+
+    def resume(self, filename, initial_events):
+        """Resume the simulation checkpointed in <filename>, and run it to
+        the end.
+
+        Return the same dictionary of statistics that the simulation
+        checkpointed would have returned had it not been interrupted.
+
+        Precondition: this simulation has not been run, and was initialized
+        with the same kind of dispatcher as the one checkpointed, configured
+        the same way.
+
+        @type self: Simulation
+        @type filename: str
+        @type initial_events: list[Event] | iterable[Event]
+            The initial events the simulation checkpointed was run on. Those
+            it had already taken when the checkpoint was written are
+            skipped.
+        @rtype: dict[str, object]
+        """
+        timestamp, taken = read_checkpoint(filename, self._events,
+                                           self._dispatcher, self._monitor)
+        self._start(islice(initial_events, taken, None), taken, timestamp)
+        self._advance(None)
+        return self._report()
+
+    def fork(self, initial_events, timestamp, branches, processes=None,
+             use_fork=None):
+        """Run the simulation on <initial_events> up to <timestamp>, then
+        carry it on to the end once for each of <branches>, in parallel.
+
+        Return the dictionary of statistics of each branch, in the same
+        order as <branches>, or a dictionary holding the "error" that
+        stopped it if a branch fails.
+
+        Each branch runs in a child process. Where os.fork is available,
+        the children share the state of the simulation at <timestamp> with
+        this process, copying only what they change. Elsewhere, the state
+        is pickled once and unpickled by each child.
+
+        This simulation is left at <timestamp>, and can be carried on with
+        continue_with. It writes no more checkpoints, since the branches
+        would overwrite each other's.
+
+        @type self: Simulation
+        @type initial_events: list[Event] | iterable[Event]
+        @type timestamp: int
+            The time to fork at. No event at or after it is done before
+            the branches start.
+        @type branches: list[Branch]
+        @type processes: int | None
+            The number of branches to run at once. Defaults to the number of
+            CPUs.
+        @type use_fork: bool | None
+            Whether to fork rather than pickle. Defaults to forking where
+            os.fork is available.
+        @rtype: list[dict[str, object]]
+        """
+        self._begin(initial_events)
+        self._advance(timestamp)
+        # Each branch reads the rest of the initial events, which a stream
+        # could only yield once.
+        self._incoming = iter(list(self._incoming))
+        self._checkpoints = None
+        return run_branches(self, branches, processes, use_fork)
+
+    def continue_with(self, events=(), dispatcher=None):
+        """Add <events> to this simulation, hand it over to <dispatcher> if
+        one is given, and run it to the end.
+
+        Return a dictionary containing statistics of the simulation.
+
+        @type self: Simulation
+        @type events: iterable[Event]
+            Events to do as well as those already due, such as the requests
+            of extra drivers. None is earlier than the time the simulation
+            has reached.
+        @type dispatcher: Dispatcher | None
+            A dispatcher that has not been used, to take over from the
+            current one, with the riders and drivers it has.
+        @rtype: dict[str, object]
+        """
+        for event in events:
+            event.handle = self._events.add(event)
+        if dispatcher is not None:
+            dispatcher.set_state(self._dispatcher.get_state())
+            self._dispatcher = dispatcher
+        self._advance(None)
+        return self._report()
 
-        # Add all initial events to the event queue.
+    def _begin(self, initial_events):
+        """Get ready to run the simulation from the start on
+        <initial_events>.
 
+        @type self: Simulation
+        @type initial_events: list[Event] | iterable[Event]
+        @rtype: None
+        """
+        taken = 0
+        if isinstance(initial_events, list):
+            # Add all initial events to the event queue.
+            self._events.extend(initial_events)
+            taken = len(initial_events)
+            initial_events = []
+        self._start(iter(initial_events), taken, 0)
+
+    def _start(self, incoming, taken, start):
+        """Get ready to run the simulation from time <start>.
+
+        @type self: Simulation
+        @type incoming: iterator[Event]
+            The initial events not yet taken, in timestamp order.
+        @type taken: int
+            The number of initial events taken before these.
+        @type start: int
+            The simulated time to run from.
+        @rtype: None
+        """
+        self._incoming = incoming
+        self._upcoming = next(incoming, None)
+        self._taken = taken
+        if self._checkpoints is not None:
+            self._due = self._checkpoints.next_time(start)
+
+    def _advance(self, until):
+        """Do the events of the simulation in order, up to but not including
+        the first at or after the time <until>.
+
+        @type self: Simulation
+        @type until: int | None
+            The time to stop at, or None to carry on until there are no
+            events left.
+        @rtype: None
+        """
+        profiler = self._profiler
+        checkpoints = self._checkpoints
+        monitor = self._watched
+        incoming = self._incoming
+        upcoming = self._upcoming
+        taken = self._taken
         # Until there are no more events, remove an event
         # from the event queue and do it. Add any returned
         # events to the event queue.
+        while upcoming is not None or not self._events.is_empty():
+            if until is not None or checkpoints is not None:
+                timestamp = self._next_time(upcoming)
+                if until is not None and timestamp >= until:
+                    break
+                if checkpoints is not None and timestamp >= self._due:
+                    checkpoints.write(timestamp, taken, self._events,
+                                      self._dispatcher, self._monitor)
+                    self._due = checkpoints.next_time(timestamp)
+            # Initial events go ahead of spawned events with the same
+            # timestamp, as they would if they had all been queued first.
+            if upcoming is not None and (
+                    self._events.is_empty() or
+                    upcoming.timestamp <= self._events.peek().timestamp):
+                event_to_perform = upcoming
+                taken += 1
+                upcoming = next(incoming, None)
+                if (upcoming is not None and
+                        upcoming.timestamp < event_to_perform.timestamp):
+                    raise ValueError("initial events are not in timestamp "
+                                     "order: {} follows {}".format(
+                                         upcoming, event_to_perform))
+            else:
+                event_to_perform = self._events.remove()
+            if profiler is None:
+                additional_events = event_to_perform.do(self._dispatcher,
+                                                        monitor)
+            else:
+                additional_events = profiler.perform(
+                    event_to_perform, self._dispatcher, monitor,
+                    len(self._events))
+            for event in additional_events:
+                event.handle = self._events.add(event)
+        self._upcoming = upcoming
+        self._taken = taken
+
+    def _next_time(self, upcoming):
+        """Return the timestamp of the next event to do.
 
-        return self._monitor.report()
+        Precondition: there is an event left to do.
+
+        @type self: Simulation
+        @type upcoming: Event | None
+            The next initial event, which has not been taken yet.
+        @rtype: int
+        """
+        if upcoming is not None and (
+                self._events.is_empty() or
+                upcoming.timestamp <= self._events.peek().timestamp):
+            return upcoming.timestamp
+        return self._events.peek().timestamp
+
+    def _report(self):
+        """Return a dictionary containing statistics of the simulation.
+
+        @type self: Simulation
+        @rtype: dict[str, object]
+        """
+        report = self._monitor.report()
+        if self._profiler is not None:
+            report["profile"] = self._profiler.results()
+        return report
 
 
 if __name__ == "__main__":
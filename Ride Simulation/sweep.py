@@ -0,0 +1,298 @@
+"""
+The sweep module runs one scenario under many configurations in parallel,
+and collects the reports of the runs into a table.
+
+The scenario is parsed once, packed in the binary scenario format, and
+published to the worker processes through shared memory, so each run reads
+the same copy of the events instead of parsing the events file again.
+The travel model in use is handed to the worker processes too, so the runs
+go the same distances whichever way the workers are started.
+
+A configuration is a dictionary that may hold any of these keys:
+
+    fleet       The number of drivers, taken in the order they first
+                request a rider. Defaults to every driver.
+    speed       The factor to scale the speed of each driver by.
+    patience    The factor to scale the patience of each rider by.
+    dispatcher  "nearest", to assign each rider the nearest idle driver,
+                or "batch", to match riders and drivers in batches.
+    window      How long a batch dispatcher collects requests for.
+    index       "grid" or "arrays": how idle drivers are indexed.
+
+Run this module with an events file and a JSON file holding a list of
+configurations to write the table of results as CSV:
+
+    python sweep.py events.txt configurations.json results.csv
+
+This module requires NumPy.
+"""
+import csv
+import itertools
+import sys
+import time
+import traceback
+from multiprocessing import Pool, shared_memory
+
+import travel
+from batch_dispatcher import BatchDispatcher
+from dispatcher import Dispatcher
+from driver_arrays import DriverArrays
+from driver_grid import DriverGrid
+from event import DriverRequest, read_events
+from monitor import Monitor
+from scenario import Scenario, pack_scenario
+from simulation import Simulation
+
+# The keys a configuration may hold, and the value each has by default.
+DEFAULTS = {"fleet": None, "speed": 1, "patience": 1,
+            "dispatcher": "nearest", "window": 1, "index": "grid"}
+
+# The Scenario the runs in this process read, once a worker has attached
+# to the shared memory holding it.
+_scenario = None
+_memory = None
+
+
+def grid(**options):
+    """Return every configuration that takes one of the given values for
+    each of <options>.
+
+    @type options: dict[str, list]
+    @rtype: list[dict[str, object]]
+
+    >>> grid(fleet=[10, 20], dispatcher=["nearest", "batch"])[1]
+    {'fleet': 10, 'dispatcher': 'batch'}
+    """
+    names = list(options)
+    return [dict(zip(names, values))
+            for values in itertools.product(*options.values())]
+
+
+def sweep(events, configurations, processes=None, progress=None):
+    """Run a simulation of <events> under each of <configurations>, and
+    return a row of results for each, in the same order.
+
+    Each row holds the configuration, the report of its run with the
+    percentiles spread over columns of their own, and the time the run
+    took. A run that fails does not stop the others: its row holds the
+    error instead of the report.
+
+    @type events: iterable[DriverRequest | RiderRequest]
+        The events of the scenario, parsed only once.
+    @type configurations: list[dict[str, object]]
+    @type processes: int | None
+        The number of worker processes. With one process, the runs are
+        done in this one. Defaults to the number of CPUs.
+    @type progress: callable | None
+        Called with the number of runs finished and the number of runs
+        as each run finishes.
+    @rtype: list[dict[str, object]]
+
+    >>> from driver import Driver
+    >>> from event import RiderRequest
+    >>> from location import Location
+    >>> from rider import Rider, WAITING
+    >>> events = [DriverRequest(0, Driver("Bob", Location(0, 0), 1)), \
+    DriverRequest(0, Driver("Sue", Location(5, 5), 1))]
+    >>> events.append(RiderRequest(1, Rider("Ann", Location(4, 4), \
+    Location(9, 9), WAITING, 5)))
+    >>> rows = sweep(events, [{"fleet": 1}, {}, {"dispatcher": "fastest"}], \
+    processes=1)
+    >>> [row["rider_wait_time"] for row in rows[:2]]
+    [5.0, 2.0]
+    >>> rows[2]["error"]
+    "ValueError: unknown dispatcher 'fastest'"
+    """
+    data = pack_scenario(events)
+    configurations = list(configurations)
+    results = [None] * len(configurations)
+    if processes == 1:
+        _attach(data, travel.model)
+        outcomes = map(_run, enumerate(configurations))
+        _finish(outcomes, results, progress)
+        return results
+
+    memory = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        memory.buf[:len(data)] = data
+        with Pool(processes, initializer=_attach,
+                  initargs=(memory.name, travel.model)) as pool:
+            _finish(pool.imap_unordered(_run, enumerate(configurations)),
+                    results, progress)
+    finally:
+        memory.close()
+        memory.unlink()
+    return results
+
+
+def _finish(outcomes, results, progress):
+    """Put each of <outcomes> in its place in <results> as it arrives,
+    reporting the progress made to <progress>.
+
+    @type outcomes: iterator[(int, dict[str, object])]
+    @type results: list[dict[str, object] | None]
+    @type progress: callable | None
+    @rtype: None
+    """
+    for done, (index, row) in enumerate(outcomes, 1):
+        results[index] = row
+        if progress is not None:
+            progress(done, len(results))
+
+
+def _attach(source, model):
+    """Make the scenario in <source> the one the runs in this process read,
+    and <model> the travel model they use.
+
+    @type source: bytes | str
+        The packed scenario itself, or the name of the shared memory that
+        holds it.
+    @type model: TravelModel | None
+        The travel model in use in the process that started the runs.
+    @rtype: None
+    """
+    global _scenario, _memory
+    travel.use_model(model)
+    if isinstance(source, str):
+        _memory = shared_memory.SharedMemory(name=source)
+        source = _memory.buf
+    _scenario = Scenario(source)
+
+
+def _run(job):
+    """Run a simulation of the scenario attached under a configuration,
+    and return its row of results.
+
+    @type job: (int, dict[str, object])
+        The index of the configuration, and the configuration.
+    @rtype: (int, dict[str, object])
+    """
+    index, configuration = job
+    row = dict(configuration)
+    start = time.perf_counter()
+    try:
+        report = _simulate(configuration)
+    except Exception as error:
+        row["error"] = "".join(
+            traceback.format_exception_only(type(error), error)).strip()
+    else:
+        row.update(_flatten(report))
+    row["seconds"] = time.perf_counter() - start
+    return index, row
+
+
+def _simulate(configuration):
+    """Return the report of a simulation of the scenario attached under
+    <configuration>.
+
+    @type configuration: dict[str, object]
+    @rtype: dict[str, object]
+    """
+    unknown = set(configuration) - set(DEFAULTS)
+    if len(unknown) != 0:
+        raise ValueError("unknown configuration keys: {}".format(
+            ", ".join(sorted(unknown))))
+    settings = dict(DEFAULTS)
+    settings.update(configuration)
+
+    if settings["index"] == "grid":
+        index = DriverGrid()
+    elif settings["index"] == "arrays":
+        index = DriverArrays()
+    else:
+        raise ValueError("unknown index {!r}".format(settings["index"]))
+    if settings["dispatcher"] == "nearest":
+        dispatcher = Dispatcher(index)
+    elif settings["dispatcher"] == "batch":
+        dispatcher = BatchDispatcher(settings["window"], index)
+    else:
+        raise ValueError("unknown dispatcher {!r}".format(
+            settings["dispatcher"]))
+    simulation = Simulation(dispatcher=dispatcher,
+                            monitor=Monitor(history=False))
+    return simulation.run(_configured_events(settings))
+
+
+def _configured_events(settings):
+    """Yield the events of the scenario attached, changed as <settings>
+    say.
+
+    @type settings: dict[str, object]
+    @rtype: iterator[Event]
+    """
+    fleet = settings["fleet"]
+    drivers = set()
+    for event in _scenario.events():
+        if isinstance(event, DriverRequest):
+            driver = event.driver
+            if driver.id not in drivers:
+                if fleet is not None and len(drivers) >= fleet:
+                    continue
+                drivers.add(driver.id)
+            driver.speed = max(1, int(round(driver.speed *
+                                            settings["speed"])))
+        else:
+            event.rider.patience = int(round(event.rider.patience *
+                                             settings["patience"]))
+        yield event
+
+
+def _flatten(report):
+    """Return <report> with each dictionary of percentiles in it spread
+    over a column per percentile.
+
+    @type report: dict[str, object]
+    @rtype: dict[str, object]
+
+    >>> _flatten({"wait": 1.5, "wait_percentiles": {50: 1, 99: 4}})
+    {'wait': 1.5, 'wait_p50': 1, 'wait_p99': 4}
+    """
+    row = {}
+    for name, value in report.items():
+        if isinstance(value, dict):
+            prefix = name[:-len("_percentiles")]
+            for percent, percentile in value.items():
+                row["{}_p{}".format(prefix, percent)] = percentile
+        else:
+            row[name] = value
+    return row
+
+
+def write_table(rows, file):
+    """Write <rows> to <file> as CSV, with a column for every key in any
+    of the rows, the configuration first.
+
+    @type rows: list[dict[str, object]]
+    @type file: io.TextIOBase
+    @rtype: None
+    """
+    columns = [name for name in DEFAULTS if any(name in row for row in rows)]
+    for row in rows:
+        columns.extend(name for name in row if name not in columns)
+    writer = csv.DictWriter(file, columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def _print_progress(done, total):
+    """Report that <done> of <total> runs have finished.
+
+    @type done: int
+    @type total: int
+    @rtype: None
+    """
+    print("\r{}/{} runs finished".format(done, total), end="",
+          file=sys.stderr, flush=True)
+    if done == total:
+        print(file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import json
+
+    with open(sys.argv[2]) as configurations_file:
+        configurations = json.load(configurations_file)
+    rows = sweep(read_events(sys.argv[1]), configurations,
+                 progress=_print_progress)
+    with open(sys.argv[3], "w", newline="") as results_file:
+        write_table(rows, results_file)
@@ -0,0 +1,432 @@
+"""
+The travel module decides how far apart two locations are for a driver,
+and so how long drivers take to get around.
+
+By default drivers go the Manhattan distance between locations, worked out
+directly where it is needed. Another TravelModel, such as a RoadNetwork
+read from a file, can be put in its place for every driver:
+
+    travel.use_model(travel.read_roads("roads.txt"))
+
+after which the distances drivers go, the times they take, and the
+distances the monitor records all come from it. use_model(None) goes back
+to Manhattan distances.
+"""
+from collections import OrderedDict
+from heapq import heappop, heappush
+
+from location import deserialize_location, manhattan_distance
+
+# The TravelModel in use, or None for Manhattan distances.
+model = None
+
+
+class TravelModel:
+    """A way of working out the distance a driver goes between locations.
+
+    This is an abstract class.  Only child classes should be instantiated.
+
+    === Attributes ===
+    @type scale: float
+        A number no larger than the distance between any two locations
+        divided by the Manhattan distance between them, so that searches
+        for the nearest driver know when to stop.
+    """
+
+    scale = 1
+
+    def distance(self, origin, destination):
+        """Return the distance a driver goes from <origin> to
+        <destination>.
+
+        @type self: TravelModel
+        @type origin: Location
+        @type destination: Location
+        @rtype: int
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def distances_from(self, origin, destinations):
+        """Return the distance a driver goes from <origin> to each of
+        <destinations>, in order.
+
+        Subclasses may override this with a faster search that reaches
+        every destination at once.
+
+        @type self: TravelModel
+        @type origin: Location
+        @type destinations: list[Location]
+        @rtype: list[int]
+
+        >>> from location import Location
+        >>> ManhattanModel().distances_from(Location(0, 0), \
+        [Location(1, 2), Location(0, 0)])
+        [3, 0]
+        """
+        return [self.distance(origin, destination)
+                for destination in destinations]
+
+
+class ManhattanModel(TravelModel):
+    """Drivers go the Manhattan distance between locations.
+
+    This is the model in use when none is, as a TravelModel.
+    """
+
+    def distance(self, origin, destination):
+        """Return the Manhattan distance from <origin> to <destination>.
+
+        Overrides TravelModel.distance
+
+        @type self: ManhattanModel
+        @type origin: Location
+        @type destination: Location
+        @rtype: int
+
+        >>> from location import Location
+        >>> ManhattanModel().distance(Location(1, 1), Location(3, 4))
+        5
+        """
+        return manhattan_distance(origin, destination)
+
+
+class RoadNetwork(TravelModel):
+    """Drivers go along the shortest route over a network of roads.
+
+    Each road joins two locations, its ends, and has a length. A driver
+    going from or to a location that is not at the end of any road goes
+    the Manhattan distance to or from the nearest road end first.
+
+    The lengths of the shortest routes are found with A* search, and the
+    most recently used are kept, so that a route asked for again is not
+    searched for again.
+
+    === Attributes ===
+    @type scale: float
+        The smallest length of a road divided by the Manhattan distance
+        between its ends, or 1 if that is smaller.
+    @type capacity: int
+        The most routes kept.
+    @type hits: int
+        The number of routes asked for that had been kept.
+    @type misses: int
+        The number of routes asked for that had to be searched for.
+    """
+
+    # === Private Attributes ===
+    # @type _roads: dict[Location, list[(Location, int)]]
+    #     The roads leaving each road end, as the location at the other end
+    #     and the length.
+    # @type _nodes: list[Location]
+    #     The road ends, in the order they were first seen.
+    # @type _nearest: dict[Location, Location]
+    #     The nearest road end to each location that has been asked about.
+    # @type _routes: OrderedDict[(Location, Location), int]
+    #     The length of the shortest route between pairs of road ends, least
+    #     recently used first.
+
+    def __init__(self, roads, capacity=65536):
+        """Initialize a RoadNetwork.
+
+        @type self: RoadNetwork
+        @type roads: iterable[(Location, Location, int, bool)]
+            The ends and length of each road, and whether it may only be
+            driven from its first end to its second.
+        @type capacity: int
+            The most routes to keep.
+            Precondition: capacity >= 1
+        @rtype: None
+        """
+        self.scale = 1
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._roads = {}
+        self._nodes = []
+        self._nearest = {}
+        self._routes = OrderedDict()
+        for start, end, length, one_way in roads:
+            for node in (start, end):
+                if node not in self._roads:
+                    self._roads[node] = []
+                    self._nodes.append(node)
+            self._roads[start].append((end, length))
+            if not one_way:
+                self._roads[end].append((start, length))
+            span = manhattan_distance(start, end)
+            if span > 0 and length / span < self.scale:
+                self.scale = length / span
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: RoadNetwork
+        @rtype: str
+
+        >>> from location import Location
+        >>> print(RoadNetwork([(Location(0, 0), Location(0, 1), 2, False)]))
+        RoadNetwork (2 road ends, 0 routes kept)
+        """
+        return "RoadNetwork ({} road ends, {} routes kept)".format(
+            len(self._nodes), len(self._routes))
+
+    def distance(self, origin, destination):
+        """Return the length of the shortest route from <origin> to
+        <destination>.
+
+        Overrides TravelModel.distance
+
+        Precondition: every road end can be reached from every other.
+
+        @type self: RoadNetwork
+        @type origin: Location
+        @type destination: Location
+        @rtype: int
+
+        >>> from location import Location
+        >>> network = RoadNetwork([(Location(0, 0), Location(0, 4), 4, False),
+        ...                        (Location(0, 4), Location(4, 4), 4, False),
+        ...                        (Location(0, 0), Location(4, 4), 12,
+        ...                         False)])
+        >>> network.distance(Location(0, 0), Location(4, 4))
+        8
+        >>> network.distance(Location(5, 4), Location(0, 1))
+        10
+        >>> network.distance(Location(4, 4), Location(0, 0))
+        8
+        >>> network.hits, network.misses
+        (1, 2)
+        >>> network.cache_info()["size"]
+        2
+        """
+        if origin == destination:
+            return 0
+        start = self._nearest_node(origin)
+        end = self._nearest_node(destination)
+        return (manhattan_distance(origin, start) + self._route(start, end) +
+                manhattan_distance(end, destination))
+
+    def distances_from(self, origin, destinations):
+        """Return the length of the shortest route from <origin> to each of
+        <destinations>, in order, searching once for the routes to every
+        road end.
+
+        Overrides TravelModel.distances_from
+
+        Precondition: every road end can be reached from every other.
+
+        @type self: RoadNetwork
+        @type origin: Location
+        @type destinations: list[Location]
+        @rtype: list[int]
+
+        >>> from location import Location
+        >>> network = RoadNetwork([(Location(0, 0), Location(0, 4), 4, False),
+        ...                        (Location(0, 4), Location(4, 4), 4, True)])
+        >>> network.distances_from(Location(0, 0), [Location(4, 4), \
+        Location(0, 0), Location(5, 5)])
+        [8, 0, 10]
+        """
+        start = self._nearest_node(origin)
+        lengths = self._search_all(start)
+        offset = manhattan_distance(origin, start)
+        distances = []
+        for destination in destinations:
+            if destination == origin:
+                distances.append(0)
+                continue
+            end = self._nearest_node(destination)
+            if end not in lengths:
+                raise ValueError("no route from {} to {}".format(start, end))
+            distances.append(offset + lengths[end] +
+                             manhattan_distance(end, destination))
+        return distances
+
+    def cache_info(self):
+        """Return how many routes asked for had been kept and how many had
+        to be searched for, the share that had been kept, and how many are
+        kept now.
+
+        @type self: RoadNetwork
+        @rtype: dict[str, int | float]
+        """
+        asked = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / asked if asked else 0.0,
+                "size": len(self._routes),
+                "capacity": self.capacity}
+
+    def _nearest_node(self, location):
+        """Return the road end nearest to <location>, preferring the first
+        seen on a tie.
+
+        @type self: RoadNetwork
+        @type location: Location
+        @rtype: Location
+        """
+        if location in self._roads:
+            return location
+        nearest = self._nearest.get(location)
+        if nearest is None:
+            nearest = min(self._nodes,
+                          key=lambda node: manhattan_distance(location, node))
+            self._nearest[location] = nearest
+        return nearest
+
+    def _route(self, start, end):
+        """Return the length of the shortest route from the road end <start>
+        to the road end <end>, keeping it for next time.
+
+        @type self: RoadNetwork
+        @type start: Location
+        @type end: Location
+        @rtype: int
+        """
+        key = (start, end)
+        routes = self._routes
+        length = routes.get(key)
+        if length is not None:
+            self.hits += 1
+            routes.move_to_end(key)
+            return length
+        self.misses += 1
+        length = self._search(start, end)
+        routes[key] = length
+        if len(routes) > self.capacity:
+            routes.popitem(last=False)
+        return length
+
+    def _search(self, start, end):
+        """Return the length of the shortest route from the road end <start>
+        to the road end <end>, found with A* search.
+
+        The estimate of the length left from a road end is its Manhattan
+        distance to <end>, times the scale, which no route is shorter than.
+
+        @type self: RoadNetwork
+        @type start: Location
+        @type end: Location
+        @rtype: int
+        """
+        scale = self.scale
+        best = {start: 0}
+        done = set()
+        # Entries are (estimated total, length so far, order pushed, road
+        # end); the order pushed keeps locations from being compared.
+        frontier = [(scale * manhattan_distance(start, end), 0, 0, start)]
+        pushed = 1
+        while frontier:
+            _, length, _, node = heappop(frontier)
+            if node == end:
+                return length
+            if node in done:
+                continue
+            done.add(node)
+            for neighbour, road in self._roads[node]:
+                candidate = length + road
+                if candidate < best.get(neighbour, candidate + 1):
+                    best[neighbour] = candidate
+                    heappush(frontier, (
+                        candidate + scale * manhattan_distance(neighbour, end),
+                        candidate, pushed, neighbour))
+                    pushed += 1
+        raise ValueError("no route from {} to {}".format(start, end))
+
+    def _search_all(self, start):
+        """Return the length of the shortest route from the road end <start>
+        to each road end that can be reached from it, found with Dijkstra's
+        algorithm.
+
+        @type self: RoadNetwork
+        @type start: Location
+        @rtype: dict[Location, int]
+        """
+        lengths = {}
+        best = {start: 0}
+        frontier = [(0, 0, start)]
+        pushed = 1
+        while frontier:
+            length, _, node = heappop(frontier)
+            if node in lengths:
+                continue
+            lengths[node] = length
+            for neighbour, road in self._roads[node]:
+                candidate = length + road
+                if candidate < best.get(neighbour, candidate + 1):
+                    best[neighbour] = candidate
+                    heappush(frontier, (candidate, pushed, neighbour))
+                    pushed += 1
+        return lengths
+
+
+def use_model(new_model):
+    """Make <new_model> the way the distance drivers go is worked out, or go
+    back to Manhattan distances if it is None.
+
+    @type new_model: TravelModel | None
+    @rtype: None
+    """
+    global model
+    model = new_model
+
+
+def distance(origin, destination):
+    """Return the distance a driver goes from <origin> to <destination>
+    under the model in use.
+
+    @type origin: Location
+    @type destination: Location
+    @rtype: int
+
+    >>> from location import Location
+    >>> distance(Location(0, 0), Location(2, 3))
+    5
+    """
+    if model is None:
+        return manhattan_distance(origin, destination)
+    return model.distance(origin, destination)
+
+
+def scale():
+    """Return the scale of the model in use: a number no larger than the
+    distance between any two locations divided by the Manhattan distance
+    between them.
+
+    @rtype: int | float
+    """
+    if model is None:
+        return 1
+    return model.scale
+
+
+def read_roads(filename, capacity=65536):
+    """Read the roads in the file <filename>, and return a RoadNetwork of
+    them.
+
+    Each line of the file holds a road: the locations of its ends, in the
+    format 'row,col', then its whole length, then "oneway" if it may only be
+    driven from its first end to its second. Blank lines and lines that
+    start with # are skipped.
+
+    @type filename: str
+    @type capacity: int
+        The most routes for the network to keep.
+    @rtype: RoadNetwork
+    """
+    roads = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            tokens = line.split()
+            roads.append((deserialize_location(tokens[0]),
+                          deserialize_location(tokens[1]), int(tokens[2]),
+                          len(tokens) > 3 and tokens[3] == "oneway"))
+    return RoadNetwork(roads, capacity)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,293 @@
+"""
+The travel_table module precomputes the distance between every pair of
+cells of a bounded grid under a travel model, and stores the distances in
+a file. A TravelTable reads the file memory-mapped and stands in for the
+model, so that every distance a driver goes, and every travel time, is
+looked up rather than worked out.
+
+Processes that open the same table share the one copy of it the operating
+system keeps in its page cache, rather than each holding its own.
+
+A table starts with a header holding the magic number, the format version,
+the number of rows and columns of the grid, the size in bytes of each
+distance and the scale of the distances. The rest is the distances, as
+little-endian unsigned integers, from each cell in turn to every cell,
+with cells in row-major order.
+
+Run this module to build a table for a grid, under the road network in a
+file or, without one, under Manhattan distances:
+
+    python travel_table.py table.bin --rows 50 --columns 50 --roads roads.txt
+
+This module requires NumPy.
+"""
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+from location import intern_location
+from travel import ManhattanModel, TravelModel, read_roads
+
+MAGIC = b"RIDETTBL"
+VERSION = 1
+
+# The header holds the magic number, the format version, the number of rows
+# and columns, the size of each distance and the scale.
+_HEADER = struct.Struct("<8sIIIId")
+
+# The type distances are stored as, by their size in bytes.
+_TYPES = {2: "<u2", 4: "<u4"}
+
+
+class TravelTable(TravelModel):
+    """A travel model that looks distances up in a table of the distance
+    between every pair of cells of a grid.
+
+    === Attributes ===
+    @type filename: str
+        The file the table is read from.
+    @type rows: int
+        The number of rows of the grid.
+    @type columns: int
+        The number of columns of the grid.
+    @type scale: float
+        The smallest distance in the table divided by the Manhattan
+        distance it covers, or 1 if that is smaller.
+    """
+
+    # === Private Attributes ===
+    # @type _map: numpy.memmap
+    #     The distances, mapped from the file.
+    # @type _distances: memoryview
+    #     The distances, as Python integers. The distance from the cell
+    #     (r1, c1) to the cell (r2, c2) is at
+    #     ((r1 * columns + c1) * rows + r2) * columns + c2.
+
+    def __init__(self, filename):
+        """Initialize a TravelTable from the table in <filename>.
+
+        @type self: TravelTable
+        @type filename: str
+        @rtype: None
+        """
+        with open(filename, "rb") as file:
+            magic, version, rows, columns, size, scale = _HEADER.unpack(
+                file.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a travel table")
+        if version != VERSION:
+            raise ValueError("unsupported travel table version {}".format(
+                version))
+        self.filename = filename
+        self.rows = rows
+        self.columns = columns
+        self.scale = scale
+        cells = rows * columns
+        self._map = np.memmap(filename, dtype=_TYPES[size], mode="r",
+                              offset=_HEADER.size, shape=(cells * cells,))
+        self._distances = memoryview(self._map)
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: TravelTable
+        @rtype: str
+        """
+        return "TravelTable ({} by {} cells)".format(self.rows, self.columns)
+
+    def __reduce__(self):
+        """Return how to pickle this table: as the name of its file, which
+        is mapped again, and shared, where it is unpickled.
+
+        @type self: TravelTable
+        @rtype: (callable, tuple)
+        """
+        return TravelTable, (self.filename,)
+
+    def distance(self, origin, destination):
+        """Return the distance from <origin> to <destination>, looked up in
+        the table.
+
+        Overrides TravelModel.distance
+
+        @type self: TravelTable
+        @type origin: Location
+        @type destination: Location
+        @rtype: int
+        """
+        rows = self.rows
+        columns = self.columns
+        if not (0 <= origin.row < rows and 0 <= origin.column < columns and
+                0 <= destination.row < rows and
+                0 <= destination.column < columns):
+            raise ValueError("{} to {} is outside the {} by {} table".format(
+                origin, destination, rows, columns))
+        return self._distances[
+            ((origin.row * columns + origin.column) * rows +
+             destination.row) * columns + destination.column]
+
+    def distances(self, origin_rows, origin_columns, destination_rows,
+                  destination_columns):
+        """Return the distance from each origin to each destination, looked
+        up in the table all at once.
+
+        The rows and columns of the origins and destinations are broadcast
+        against each other, as in NumPy arithmetic, and the distances have
+        the shape they broadcast to.
+
+        @type self: TravelTable
+        @type origin_rows: numpy.ndarray | int
+        @type origin_columns: numpy.ndarray | int
+        @type destination_rows: numpy.ndarray | int
+        @type destination_columns: numpy.ndarray | int
+        @rtype: numpy.ndarray
+
+        >>> import os, tempfile
+        >>> with tempfile.TemporaryDirectory() as directory:
+        ...     filename = os.path.join(directory, "table.bin")
+        ...     build_table(filename, 4, 4)
+        ...     table = TravelTable(filename)
+        ...     print(table.distances(np.array([[0], [3]]), \
+        np.array([[0], [1]]), np.array([1, 3]), np.array([1, 3])))
+        ...     del table
+        [[2 6]
+         [2 2]]
+        """
+        rows = self.rows
+        columns = self.columns
+        origin_rows, origin_columns, destination_rows, destination_columns = [
+            np.asarray(values, dtype=np.int64) for values in
+            (origin_rows, origin_columns, destination_rows,
+             destination_columns)]
+        for values, limit in ((origin_rows, rows), (origin_columns, columns),
+                              (destination_rows, rows),
+                              (destination_columns, columns)):
+            if np.any((values < 0) | (values >= limit)):
+                raise ValueError("a location is outside the {} by {} "
+                                 "table".format(rows, columns))
+        return self._map[
+            ((origin_rows * columns + origin_columns) * rows +
+             destination_rows) * columns + destination_columns].astype(
+            np.int64)
+
+
+def build_table(filename, rows, columns, model=None):
+    """Work out the distance between every pair of cells of a grid of <rows>
+    by <columns> under <model>, and write them to the table <filename>.
+
+    The table is written a row at a time, so only one row is held in
+    memory, to a temporary file that is moved into place once complete, so
+    processes that have the table open keep reading the old one. The
+    temporary file is removed if the table cannot be built.
+
+    @type filename: str
+    @type rows: int
+    @type columns: int
+    @type model: TravelModel | None
+        Defaults to Manhattan distances.
+    @rtype: None
+
+    >>> import os, tempfile
+    >>> from location import Location
+    >>> from travel import RoadNetwork
+    >>> network = RoadNetwork([(Location(0, 0), Location(0, 2), 6, False),
+    ...                        (Location(0, 0), Location(2, 0), 1, False),
+    ...                        (Location(2, 0), Location(2, 2), 1, False),
+    ...                        (Location(2, 2), Location(0, 2), 1, False)])
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     filename = os.path.join(directory, "table.bin")
+    ...     build_table(filename, 3, 3, network)
+    ...     table = TravelTable(filename)
+    ...     print(table, table.scale)
+    ...     print(table.distance(Location(0, 0), Location(0, 2)),
+    ...           network.distance(Location(0, 0), Location(0, 2)))
+    ...     del table
+    TravelTable (3 by 3 cells) 0.5
+    3 3
+    """
+    if model is None:
+        model = ManhattanModel()
+    cells = [intern_location(row, column) for row in range(rows)
+             for column in range(columns)]
+    cell_rows = np.array([cell.row for cell in cells])
+    cell_columns = np.array([cell.column for cell in cells])
+    scale = 1.0
+    largest = 0
+    temporary = filename + ".tmp"
+    try:
+        with open(temporary, "wb") as file:
+            # The header is written again once the size of each distance
+            # and the scale are known.
+            file.write(_HEADER.pack(MAGIC, VERSION, rows, columns, 4, scale))
+            for cell in cells:
+                distances = np.array(model.distances_from(cell, cells),
+                                     dtype=np.int64)
+                largest = max(largest, int(distances.max()))
+                if largest > np.iinfo(np.uint32).max:
+                    raise ValueError("a distance of {} is too long to "
+                                     "store".format(largest))
+                spans = (np.abs(cell_rows - cell.row) +
+                         np.abs(cell_columns - cell.column))
+                covered = spans > 0
+                if covered.any():
+                    scale = min(scale, float(
+                        (distances[covered] / spans[covered]).min()))
+                file.write(distances.astype(_TYPES[4]).tobytes())
+        size = 4
+        if largest <= np.iinfo(np.uint16).max:
+            size = 2
+            _narrow(temporary, len(cells))
+        with open(temporary, "r+b") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, rows, columns, size,
+                                    scale))
+        os.replace(temporary, filename)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _narrow(filename, cells):
+    """Rewrite the table of <cells> by <cells> four-byte distances in
+    <filename> as two-byte distances, in place, one row at a time.
+
+    Each row is written no later in the file than where it was read from,
+    and only over rows that have already been read.
+
+    @type filename: str
+    @type cells: int
+    @rtype: None
+    """
+    wide = np.memmap(filename, dtype=_TYPES[4], mode="r+",
+                     offset=_HEADER.size, shape=(cells, cells))
+    narrow = np.memmap(filename, dtype=_TYPES[2], mode="r+",
+                       offset=_HEADER.size, shape=(cells, cells))
+    for row in range(cells):
+        narrow[row] = np.array(wide[row])
+    narrow.flush()
+    del wide, narrow
+    os.truncate(filename, _HEADER.size + 2 * cells * cells)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build a table of the distances between the cells of a "
+                    "grid.")
+    parser.add_argument("table", help="the file to write the table to")
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--columns", type=int, required=True)
+    parser.add_argument("--roads",
+                        help="a file of roads to use rather than Manhattan "
+                             "distances")
+    arguments = parser.parse_args()
+    start = time.perf_counter()
+    build_table(arguments.table, arguments.rows, arguments.columns,
+                None if arguments.roads is None
+                else read_roads(arguments.roads))
+    table = TravelTable(arguments.table)
+    print("{}: {} bytes, scale {:.3f}, built in {:.1f} seconds".format(
+        table, os.path.getsize(arguments.table), table.scale,
+        time.perf_counter() - start))
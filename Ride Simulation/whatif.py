@@ -0,0 +1,214 @@
+"""
+The whatif module carries a simulation on from a point in its run under
+different what-ifs, such as more drivers coming online or a different
+dispatcher, each in a process of its own.
+
+Simulation.fork runs the part of a simulation the what-ifs share once, and
+hands the simulation to run_branches to run each Branch from there.
+"""
+import os
+import pickle
+import traceback
+from multiprocessing import Pool
+
+import travel
+
+
+class Branch:
+    """A what-if: a change to a simulation from the time it is forked at.
+
+    === Attributes ===
+    @type name: str
+        A name for the what-if.
+    @type events: list[Event]
+        Events to do as well as those of the simulation, such as the
+        requests of extra drivers. None is earlier than the time the
+        simulation is forked at.
+    @type dispatcher: Dispatcher | None
+        A dispatcher that has not been used, to take over from the
+        simulation's, or None to keep the simulation's.
+    """
+
+    def __init__(self, name, events=(), dispatcher=None):
+        """Initialize a Branch.
+
+        @type self: Branch
+        @type name: str
+        @type events: iterable[Event]
+        @type dispatcher: Dispatcher | None
+        @rtype: None
+        """
+        self.name = name
+        self.events = list(events)
+        self.dispatcher = dispatcher
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: Branch
+        @rtype: str
+
+        >>> print(Branch("rush hour", []))
+        rush hour (0 events)
+        """
+        return "{} ({} events)".format(self.name, len(self.events))
+
+
+def run_branches(simulation, branches, processes=None, use_fork=None):
+    """Carry <simulation> on to the end once for each of <branches>, each
+    in a child process, and return the report of each, in the same order as
+    <branches>.
+
+    A branch that fails does not stop the others: its report holds the
+    "error" that stopped it instead. Each branch goes the distances of the
+    travel model in use here, which is handed to the child with the
+    simulation when it is not forked.
+
+    @type simulation: Simulation
+        A simulation that is part way through its run, and is left there.
+    @type branches: list[Branch]
+    @type processes: int | None
+        The number of branches to run at once. Defaults to the number of
+        CPUs.
+    @type use_fork: bool | None
+        Whether to fork rather than pickle. Defaults to forking where
+        os.fork is available.
+    @rtype: list[dict[str, object]]
+
+    >>> from driver import Driver
+    >>> from event import DriverRequest, RiderRequest
+    >>> from location import Location
+    >>> from rider import Rider, WAITING
+    >>> from simulation import Simulation
+    >>> def events():
+    ...     return [DriverRequest(0, Driver("Bob", Location(0, 0), 1)),
+    ...             RiderRequest(6, Rider("Ann", Location(4, 4),
+    ...                                   Location(9, 9), WAITING, 9))]
+    >>> branches = [Branch("as is"), Branch("Sue", [DriverRequest(5, \
+    Driver("Sue", Location(5, 5), 1))])]
+    >>> for use_fork in (True, False):
+    ...     reports = Simulation().fork(events(), 5, branches, processes=1,
+    ...                                 use_fork=use_fork)
+    ...     print([report["rider_wait_time"] for report in reports])
+    [8.0, 2.0]
+    [8.0, 2.0]
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if use_fork is None:
+        use_fork = hasattr(os, "fork")
+    if use_fork:
+        return _fork_branches(simulation, branches, processes)
+
+    state = pickle.dumps(simulation, pickle.HIGHEST_PROTOCOL)
+    model = pickle.dumps(travel.model, pickle.HIGHEST_PROTOCOL)
+    jobs = [(state, pickle.dumps(branch, pickle.HIGHEST_PROTOCOL), model)
+            for branch in branches]
+    if processes == 1:
+        return [_run_pickled(job) for job in jobs]
+    with Pool(processes) as pool:
+        return pool.map(_run_pickled, jobs)
+
+
+def _fork_branches(simulation, branches, processes):
+    """Run each of <branches> in a forked child of this process, at most
+    <processes> at a time, and return the report of each.
+
+    @type simulation: Simulation
+    @type branches: list[Branch]
+    @type processes: int
+    @rtype: list[dict[str, object]]
+    """
+    reports = [None] * len(branches)
+    running = []
+    for index, branch in enumerate(branches):
+        if len(running) == processes:
+            _collect(running.pop(0), reports)
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            _serve(simulation, branch, write_end)
+        os.close(write_end)
+        running.append((index, pid, read_end))
+    while running:
+        _collect(running.pop(0), reports)
+    return reports
+
+
+def _serve(simulation, branch, write_end):
+    """Run <branch> of <simulation> in this forked child, send its report
+    down the pipe <write_end>, and exit.
+
+    @type simulation: Simulation
+    @type branch: Branch
+    @type write_end: int
+    @rtype: None
+    """
+    status = 1
+    try:
+        report = _run(simulation, branch)
+        with os.fdopen(write_end, "wb") as pipe:
+            pickle.dump(report, pipe, pickle.HIGHEST_PROTOCOL)
+        status = 0
+    finally:
+        # Leave without running any of the parent's clean-up handlers.
+        os._exit(status)
+
+
+def _collect(child, reports):
+    """Wait for the forked <child> to finish, and put its report in its
+    place in <reports>, or the error that stopped it if it did not exit
+    cleanly or its report cannot be read.
+
+    @type child: (int, int, int)
+        The index of the child's branch, its process id, and the read end
+        of the pipe it sends its report down.
+    @type reports: list[dict[str, object] | None]
+    @rtype: None
+    """
+    index, pid, read_end = child
+    with os.fdopen(read_end, "rb") as pipe:
+        data = pipe.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        reports[index] = {"error": "branch exited with status {}".format(
+            os.waitstatus_to_exitcode(status))}
+        return
+    try:
+        reports[index] = pickle.loads(data)
+    except (EOFError, pickle.UnpicklingError) as error:
+        reports[index] = {"error": "branch sent an unreadable report: "
+                                   "{}".format(error)}
+
+
+def _run_pickled(job):
+    """Run a pickled branch of a pickled simulation under a pickled travel
+    model, and return its report.
+
+    @type job: (bytes, bytes, bytes)
+    @rtype: dict[str, object]
+    """
+    state, branch, model = job
+    travel.use_model(pickle.loads(model))
+    return _run(pickle.loads(state), pickle.loads(branch))
+
+
+def _run(simulation, branch):
+    """Carry <simulation> on to the end under <branch>, and return its
+    report, or the error that stopped it.
+
+    @type simulation: Simulation
+    @type branch: Branch
+    @rtype: dict[str, object]
+    """
+    try:
+        return simulation.continue_with(branch.events, branch.dispatcher)
+    except Exception as error:
+        return {"error": "".join(traceback.format_exception_only(
+            type(error), error)).strip()}
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,409 @@
+"""
+The workload module generates synthetic scenarios of any size, for testing
+how the simulation copes with heavy demand.
+
+Riders ask for rides at a rate that follows the time of day, mostly from
+and to a few busy hotspots, and with a spread of patience. Drivers join
+over the same day with a mix of speeds. Events are generated with NumPy in
+batches, in timestamp order, so a workload can be streamed into a
+simulation or written out as an events file or a binary scenario without
+ever being held in memory all at once.
+
+Run this module with the number of riders and drivers and the time they
+arrive over to write a workload to a file, as a binary scenario if its
+name ends in .bin:
+
+    python workload.py 1000000 10000 14400 events.bin
+
+This module requires NumPy.
+"""
+import sys
+
+import numpy as np
+
+from scenario import (DRIVER_REQUEST, RIDER_REQUEST, ScenarioWriter,
+                      build_events)
+
+# The relative rate at which riders ask for rides in each hour of the day,
+# with peaks in the morning and evening rush hours.
+DAILY_RATES = [2, 1, 1, 1, 1, 2, 5, 9, 10, 7, 5, 5,
+               6, 5, 5, 6, 8, 10, 9, 7, 5, 4, 3, 2]
+
+
+class Workload:
+    """A seeded, synthetic workload of riders and drivers.
+
+    The same parameters and seed always give the same events.
+    """
+
+    # === Private Attributes ===
+    # @type _riders: int
+    #     The number of riders.
+    # @type _drivers: int
+    #     The number of drivers.
+    # @type _duration: int
+    #     The time over which riders and drivers arrive.
+    # @type _size: (int, int)
+    #     The number of rows and columns of the grid.
+    # @type _slot: int
+    #     The length of each part of the day with its own rate.
+    # @type _rates: numpy.ndarray
+    #     The relative rate of arrivals in each part of the day.
+    # @type _hotspot_share: float
+    #     The share of trips that start or end at a hotspot.
+    # @type _speeds: numpy.ndarray
+    #     The speeds drivers may have.
+    # @type _speed_shares: numpy.ndarray
+    #     The share of drivers with each of _speeds.
+    # @type _patience: float
+    #     The median patience of riders.
+    # @type _seed: int
+    #     The seed of the random numbers.
+    # @type _batch_size: int
+    #     About how many events to generate at a time.
+
+    def __init__(self, riders, drivers, duration, size=(100, 100),
+                 day_length=1440, rates=None, hotspots=5, hotspot_share=0.7,
+                 speeds=None, patience=10, seed=0, batch_size=1 << 16):
+        """Initialize a Workload.
+
+        @type self: Workload
+        @type riders: int
+            The number of riders, each of whom asks for one ride.
+        @type drivers: int
+            The number of drivers.
+        @type duration: int
+            The time over which riders and drivers arrive.
+            Precondition: duration >= 1
+        @type size: (int, int)
+            The number of rows and columns of the grid.
+        @type day_length: int
+            The length of a simulated day.
+        @type rates: list[float] | None
+            The relative rate of arrivals in each equal part of the day.
+            Defaults to DAILY_RATES.
+        @type hotspots: int
+            The number of busy places that trips gather around.
+        @type hotspot_share: float
+            The share of trip origins and destinations, and of places
+            drivers join at, near a hotspot rather than anywhere.
+        @type speeds: dict[int, float] | None
+            The share of drivers with each speed. Defaults to a mix of
+            speeds from 1 to 3.
+        @type patience: float
+            The median patience of riders, which varies log-normally.
+        @type seed: int
+        @type batch_size: int
+            About how many events to generate at a time.
+        @rtype: None
+        """
+        if rates is None:
+            rates = DAILY_RATES
+        if speeds is None:
+            speeds = {1: 0.2, 2: 0.5, 3: 0.3}
+        self._riders = riders
+        self._drivers = drivers
+        self._duration = duration
+        self._size = size
+        self._slot = max(1, day_length // len(rates))
+        self._rates = np.asarray(rates, dtype=float)
+        self._hotspot_share = hotspot_share
+        self._speeds = np.array(list(speeds), dtype=np.int64)
+        self._speed_shares = np.array(list(speeds.values()), dtype=float)
+        self._speed_shares /= self._speed_shares.sum()
+        self._patience = patience
+        self._seed = seed
+        self._batch_size = batch_size
+
+        random = np.random.default_rng([seed, 0])
+        self._hotspots = np.column_stack((
+            random.integers(0, size[0], hotspots),
+            random.integers(0, size[1], hotspots)))
+        self._hotspot_weights = random.dirichlet(np.ones(hotspots))
+        self._spread = max(1.0, min(size) / 20)
+
+    def __len__(self):
+        """Return the number of events in this Workload.
+
+        @type self: Workload
+        @rtype: int
+        """
+        return self._riders + self._drivers
+
+    def batches(self):
+        """Yield the events of this Workload in batches of columns, in
+        timestamp order.
+
+        At the same time, drivers come before riders.
+
+        @type self: Workload
+        @rtype: iterator[(dict[str, numpy.ndarray], sequence[str])]
+            The columns of each batch, as a Scenario holds them, and the
+            ids of the drivers and riders in the batch, which the ids
+            column indexes in order. Each id is only made when it is
+            needed.
+
+        >>> workload = Workload(riders=50, drivers=5, duration=100, \
+        day_length=24, batch_size=20)
+        >>> [len(names) for _, names in workload.batches()]
+        [20, 20, 15]
+        """
+        random = np.random.default_rng([self._seed, 1])
+        slots = -(-self._duration // self._slot)
+        starts = np.arange(slots) * self._slot
+        lengths = np.minimum(starts + self._slot, self._duration) - starts
+        weights = self._rates[np.arange(slots) % len(self._rates)] * lengths
+        weights /= weights.sum()
+        rider_counts = random.multinomial(self._riders, weights)
+        driver_counts = random.multinomial(self._drivers, weights)
+
+        # Gather consecutive slots into batches of about batch_size events.
+        totals = np.cumsum(rider_counts + driver_counts)
+        ends = np.searchsorted(totals, np.arange(
+            self._batch_size, totals[-1], self._batch_size),
+            side="right")
+        bounds = np.concatenate(([0], ends, [slots]))
+        first_rider = 0
+        first_driver = 0
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            if low == high:
+                continue
+            batch = self._batch(random, starts[low:high], lengths[low:high],
+                                rider_counts[low:high],
+                                driver_counts[low:high], first_rider,
+                                first_driver)
+            first_rider += int(rider_counts[low:high].sum())
+            first_driver += int(driver_counts[low:high].sum())
+            if len(batch[1]) != 0:
+                yield batch
+
+    def events(self):
+        """Yield the events of this Workload, in timestamp order.
+
+        @type self: Workload
+        @rtype: iterator[Event]
+
+        >>> workload = Workload(riders=3, drivers=1, duration=10, seed=4)
+        >>> for event in workload.events():
+        ...     print(event)
+        0 -- R0: Request a driver
+        1 -- R1: Request a driver
+        4 -- R2: Request a driver
+        9 -- D0: Request a rider
+        """
+        for columns, names in self.batches():
+            first = int(columns["ids"][0])
+            names = list(names)
+            yield from build_events(
+                columns, lambda identifier: names[identifier - first])
+
+    def write_text(self, filename):
+        """Write this Workload to <filename> as an events file.
+
+        @type self: Workload
+        @type filename: str
+        @rtype: None
+        """
+        with open(filename, "w") as file:
+            for columns, names in self.batches():
+                lines = []
+                for (timestamp, kind, name, origin_row, origin_column,
+                     destination_row, destination_column, speed,
+                     patience) in zip(
+                        columns["timestamps"].tolist(),
+                        columns["kinds"].tolist(), names,
+                        columns["origin_rows"].tolist(),
+                        columns["origin_columns"].tolist(),
+                        columns["destination_rows"].tolist(),
+                        columns["destination_columns"].tolist(),
+                        columns["speeds"].tolist(),
+                        columns["patiences"].tolist()):
+                    if kind == DRIVER_REQUEST:
+                        lines.append("{} DriverRequest {} {},{} {}\n".format(
+                            timestamp, name, origin_row, origin_column,
+                            speed))
+                    else:
+                        lines.append(
+                            "{} RiderRequest {} {},{} {},{} {}\n".format(
+                                timestamp, name, origin_row, origin_column,
+                                destination_row, destination_column,
+                                patience))
+                file.write("".join(lines))
+
+    def write_binary(self, filename):
+        """Write this Workload to <filename> as a binary scenario.
+
+        @type self: Workload
+        @type filename: str
+        @rtype: None
+        """
+        with ScenarioWriter(filename, len(self), len(self)) as writer:
+            for columns, names in self.batches():
+                writer.write(columns, names)
+
+    def _batch(self, random, starts, lengths, rider_counts, driver_counts,
+               first_rider, first_driver):
+        """Return a batch of the events that arrive in the slots of time
+        that start at <starts>.
+
+        @type self: Workload
+        @type random: numpy.random.Generator
+        @type starts: numpy.ndarray
+        @type lengths: numpy.ndarray
+            The length of each slot.
+        @type rider_counts: numpy.ndarray
+            The number of riders who arrive in each slot.
+        @type driver_counts: numpy.ndarray
+            The number of drivers who arrive in each slot.
+        @type first_rider: int
+            The number of riders in earlier batches.
+        @type first_driver: int
+            The number of drivers in earlier batches.
+        @rtype: (dict[str, numpy.ndarray], _Names)
+        """
+        riders = int(rider_counts.sum())
+        drivers = int(driver_counts.sum())
+        count = riders + drivers
+        counts = np.concatenate((driver_counts, rider_counts))
+        slot_starts = np.repeat(np.concatenate((starts, starts)), counts)
+        slot_lengths = np.repeat(np.concatenate((lengths, lengths)), counts)
+        timestamps = slot_starts + (random.random(count) *
+                                    slot_lengths).astype(np.int64)
+        kinds = np.repeat(np.array([DRIVER_REQUEST, RIDER_REQUEST],
+                                   dtype=np.int8), [drivers, riders])
+
+        origins = self._places(random, count)
+        destinations = self._places(random, count)
+        speeds = self._speeds[_choose(random, self._speed_shares, count)]
+        patiences = np.maximum(1, np.rint(
+            self._patience * random.lognormal(0, 0.5, count))).astype(
+                np.int64)
+        is_driver = kinds == DRIVER_REQUEST
+        destinations[is_driver] = 0
+        speeds[~is_driver] = 0
+        patiences[is_driver] = 0
+
+        # Order the batch by timestamp, and number the drivers and riders
+        # in the order they arrive.
+        order = np.lexsort((kinds, timestamps))
+        kinds = kinds[order]
+        is_driver = kinds == DRIVER_REQUEST
+        numbers = np.empty(count, dtype=np.int64)
+        numbers[is_driver] = first_driver + np.arange(drivers)
+        numbers[~is_driver] = first_rider + np.arange(riders)
+        first = first_driver + first_rider
+        columns = {
+            "timestamps": timestamps[order],
+            "kinds": kinds,
+            "ids": np.arange(first, first + count),
+            "origin_rows": origins[order, 0],
+            "origin_columns": origins[order, 1],
+            "destination_rows": destinations[order, 0],
+            "destination_columns": destinations[order, 1],
+            "speeds": speeds[order],
+            "patiences": patiences[order],
+        }
+        return columns, _Names(is_driver, numbers)
+
+    def _places(self, random, count):
+        """Return <count> random places on the grid, each near a hotspot or
+        anywhere.
+
+        @type self: Workload
+        @type random: numpy.random.Generator
+        @type count: int
+        @rtype: numpy.ndarray
+            A count by 2 array of rows and columns.
+        """
+        places = np.column_stack((random.integers(0, self._size[0], count),
+                                  random.integers(0, self._size[1], count)))
+        near = random.random(count) < self._hotspot_share
+        hotspots = _choose(random, self._hotspot_weights, int(near.sum()))
+        places[near] = np.rint(
+            self._hotspots[hotspots] +
+            random.normal(0, self._spread, (len(hotspots), 2))).astype(
+                np.int64)
+        places[:, 0] = np.clip(places[:, 0], 0, self._size[0] - 1)
+        places[:, 1] = np.clip(places[:, 1], 0, self._size[1] - 1)
+        return places
+
+
+def _choose(random, shares, count):
+    """Return <count> random indices into <shares>, each chosen with the
+    probability its share gives.
+
+    This is much faster than numpy.random.Generator.choice for large counts.
+
+    @type random: numpy.random.Generator
+    @type shares: numpy.ndarray
+        Shares that add up to 1.
+    @type count: int
+    @rtype: numpy.ndarray
+    """
+    bounds = np.cumsum(shares)
+    return np.minimum(np.searchsorted(bounds, random.random(count),
+                                      side="right"), len(shares) - 1)
+
+
+class _Names:
+    """The ids of the drivers and riders in a batch of a workload, made only
+    when they are needed.
+    """
+
+    # === Private Attributes ===
+    # @type _is_driver: numpy.ndarray
+    #     True for each driver in the batch.
+    # @type _numbers: numpy.ndarray
+    #     The number of each driver among the drivers, and of each rider
+    #     among the riders.
+
+    def __init__(self, is_driver, numbers):
+        """Initialize the _Names of the drivers and riders with <numbers>.
+
+        @type self: _Names
+        @type is_driver: numpy.ndarray
+        @type numbers: numpy.ndarray
+        @rtype: None
+        """
+        self._is_driver = is_driver
+        self._numbers = numbers
+
+    def __len__(self):
+        """Return the number of ids.
+
+        @type self: _Names
+        @rtype: int
+        """
+        return len(self._numbers)
+
+    def __getitem__(self, index):
+        """Return the id at <index>.
+
+        @type self: _Names
+        @type index: int
+        @rtype: str
+
+        >>> names = _Names(np.array([False, True]), np.array([7, 3]))
+        >>> names[0], list(names)
+        ('R7', ['R7', 'D3'])
+        """
+        return "{}{}".format("D" if self._is_driver[index] else "R",
+                             self._numbers[index])
+
+    def __iter__(self):
+        """Yield the ids in order, making them all at once.
+
+        @type self: _Names
+        @rtype: iterator[str]
+        """
+        return iter(np.char.add(np.where(self._is_driver, "D", "R"),
+                                self._numbers.astype(str)).tolist())
+
+
+if __name__ == "__main__":
+    workload = Workload(riders=int(sys.argv[1]), drivers=int(sys.argv[2]),
+                        duration=int(sys.argv[3]))
+    if sys.argv[4].endswith(".bin"):
+        workload.write_binary(sys.argv[4])
+    else:
+        workload.write_text(sys.argv[4])